@@ -0,0 +1,208 @@
+"""
+Build time and bytes read of every dbt model on synthetic data at scale.
+
+Creates the landing tables in a local ClickHouse, fills them with
+`synthetic_snapshots` data (pools per protocol, positions per pool, hours of
+history), runs `dbt build` and reports, per model, dbt's execution time and
+what ClickHouse's query log says the model's queries read: rows, bytes,
+peak memory. Use it to judge a model change by measurement:
+
+    docker compose -f sol_dex_dbt_models/local/docker-compose.yml up -d
+    python benchmarks/dbt_build.py --pools 500 --positions 200 --hours 720 \\
+        --truncate --json /tmp/before.json
+    # change a model, then rebuild on the same data
+    python benchmarks/dbt_build.py --skip-load --json /tmp/after.json
+
+Views (staging) read nothing themselves; their cost shows up in the tables
+built on top of them.
+"""
+
+import argparse
+import json
+import re
+import subprocess
+import sys
+import time
+from collections import defaultdict
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import requests
+
+from synthetic_snapshots import (
+    add_arguments,
+    clickhouse_auth,
+    default_start,
+    generate,
+    load,
+)
+
+from dex_dagster.ingestion.src.common.archive import LANDING_TABLES
+
+PROJECT_DIR = Path(__file__).resolve().parent.parent / "sol_dex_dbt_models"
+
+
+def clickhouse(url: str, sql: str, auth: Optional[Tuple[str, str]]) -> str:
+    resp = requests.post(url, data=sql.encode(), auth=auth, timeout=600)
+    resp.raise_for_status()
+    return resp.text
+
+
+def dbt(project_dir: Path, target: str, *args: str) -> float:
+    """Runs a dbt command in the project and returns its wall time."""
+    command = ["dbt", *args, "--target", target, "--profiles-dir", str(project_dir)]
+    print("$", " ".join(command))
+    started = time.perf_counter()
+    subprocess.run(command, cwd=project_dir, check=True)
+    return time.perf_counter() - started
+
+
+def model_runs(project_dir: Path) -> Dict[str, dict]:
+    """dbt's status and execution time per model, from run_results.json."""
+    results = json.loads((project_dir / "target" / "run_results.json").read_text())
+    return {
+        r["unique_id"].split(".")[-1]: {
+            "status": r["status"],
+            "seconds": round(r["execution_time"], 3),
+        }
+        for r in results["results"]
+        if r["unique_id"].startswith("model.")
+    }
+
+
+def query_costs(
+    url: str,
+    auth: Optional[Tuple[str, str]],
+    since: str,
+    models: List[str],
+) -> Dict[str, dict]:
+    """
+    Query-log totals per model for queries finished since `since`.
+
+    A query belongs to the model whose relation (or its __dbt_tmp/__dbt_backup
+    copy) it creates, inserts into or exchanges, which is always the first
+    relation named in the statement dbt sends.
+    """
+    clickhouse(url, "SYSTEM FLUSH LOGS", auth)
+    log = clickhouse(
+        url,
+        f"""
+        select query, read_rows, read_bytes, written_rows, memory_usage,
+            query_duration_ms
+        from system.query_log
+        where type = 'QueryFinish' and event_time_microseconds >= '{since}'
+        format JSONEachRow
+        """,
+        auth,
+    )
+    names = "|".join(sorted(map(re.escape, models), key=len, reverse=True))
+    target = re.compile(
+        rf"(?:table|view|into|tables)\s+(?:if\s+not\s+exists\s+)?"
+        rf"[`\"]?\w*[`\"]?\.?[`\"]?({names})(?:__dbt_\w+)?[`\"]?",
+        re.IGNORECASE,
+    )
+    costs: Dict[str, dict] = defaultdict(
+        lambda: {
+            "queries": 0,
+            "read_rows": 0,
+            "read_bytes": 0,
+            "written_rows": 0,
+            "peak_memory": 0,
+            "query_ms": 0,
+        }
+    )
+    for line in log.splitlines():
+        q = json.loads(line)
+        match = target.search(q["query"])
+        if match is None:
+            continue
+        c = costs[match.group(1)]
+        c["queries"] += 1
+        c["read_rows"] += int(q["read_rows"])
+        c["read_bytes"] += int(q["read_bytes"])
+        c["written_rows"] += int(q["written_rows"])
+        c["peak_memory"] = max(c["peak_memory"], int(q["memory_usage"]))
+        c["query_ms"] += int(q["query_duration_ms"])
+    return dict(costs)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    add_arguments(parser)
+    parser.add_argument("--clickhouse-url", default="http://localhost:8123")
+    parser.add_argument("--project-dir", type=Path, default=PROJECT_DIR)
+    parser.add_argument("--target", default="local")
+    parser.add_argument("--select", nargs="+", help="dbt selection (default: all)")
+    parser.add_argument("--truncate", action="store_true", help="empty raw tables")
+    parser.add_argument("--skip-load", action="store_true", help="reuse loaded data")
+    parser.add_argument("--json", type=Path, help="also write the report here")
+    args = parser.parse_args()
+
+    url, auth = args.clickhouse_url, clickhouse_auth()
+    db = args.clickhouse_database
+    report: dict = {"scale": {}, "load": {}, "models": {}}
+
+    dbt(args.project_dir, args.target, "run-operation", "create_raw_tables")
+    if args.truncate:
+        for table in sorted(set(LANDING_TABLES.values())):
+            clickhouse(url, f"truncate table {db}.{table}", auth)
+
+    if not args.skip_load:
+        report["scale"] = {
+            "pools_per_protocol": args.pools,
+            "positions_per_pool": args.positions,
+            "hours": args.hours,
+        }
+        started = time.perf_counter()
+        totals = load(
+            generate(
+                args.pools,
+                args.positions,
+                args.hours,
+                args.start or default_start(args.hours),
+                churn=args.churn,
+                seed=args.seed,
+            ),
+            url,
+            db,
+            auth,
+        )
+        report["load"] = {
+            "seconds": round(time.perf_counter() - started, 1),
+            "tables": totals,
+        }
+        # build on merged parts, as the hourly job would see them
+        for table in sorted(set(LANDING_TABLES.values())):
+            clickhouse(url, f"optimize table {db}.{table} final", auth)
+
+    since = clickhouse(url, "select now64(6)", auth).strip()
+    build = ["build"] + (["--select", *args.select] if args.select else [])
+    report["build_seconds"] = round(dbt(args.project_dir, args.target, *build), 1)
+
+    runs = model_runs(args.project_dir)
+    costs = query_costs(url, auth, since, list(runs))
+    for model, run in runs.items():
+        report["models"][model] = {**run, **costs.get(model, {})}
+
+    print(
+        f"\n{'model':<44} {'status':<8} {'seconds':>8} {'rows read':>12} "
+        f"{'MiB read':>10} {'peak MiB':>9}"
+    )
+    ordered = sorted(report["models"].items(), key=lambda m: -m[1]["seconds"])
+    for model, m in ordered:
+        print(
+            f"{model:<44} {m['status']:<8} {m['seconds']:>8.2f} "
+            f"{m.get('read_rows', 0):>12,} {m.get('read_bytes', 0) / 2**20:>10.1f} "
+            f"{m.get('peak_memory', 0) / 2**20:>9.1f}"
+        )
+    print(f"dbt build: {report['build_seconds']}s")
+
+    if args.json:
+        args.json.write_text(json.dumps(report, indent=2))
+    return 0 if all(m["status"] == "success" for m in runs.values()) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,91 @@
+"""
+Import-time benchmark for the Dagster code location.
+
+Loads `dex_dagster.definitions` in fresh interpreters and reports the median
+wall time, the slowest modules from `-X importtime`, and the cost of
+initializing both decoders with a cold vs. warm IDL cache.
+
+    python benchmarks/import_time.py --runs 5
+"""
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+MODULE = "dex_dagster.definitions"
+
+DECODER_INIT = """
+import time
+t = time.perf_counter()
+from dex_dagster.ingestion.src.decoders.orca_decoder import AnchorWhirlpoolDecoder
+from dex_dagster.ingestion.src.decoders.raydium_decoder import AnchorRaydiumDecoder
+AnchorRaydiumDecoder("").initialize()
+AnchorWhirlpoolDecoder("").initialize()
+print(time.perf_counter() - t)
+"""
+
+
+def time_import(module: str, runs: int) -> list[float]:
+    samples = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, "-c", f"import {module}"], check=True)
+        samples.append(time.perf_counter() - start)
+    return samples
+
+
+def slowest_imports(module: str, top: int) -> list[tuple[int, str]]:
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        check=True,
+        capture_output=True,
+        text=True,
+    )
+    rows = []
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:") :].split("|")
+        rows.append((int(cumulative), name.strip()))
+    # only top-level entries of the import tree are meaningful cumulatively
+    return sorted(rows, reverse=True)[:top]
+
+
+def time_decoder_init(cache_dir: str) -> float:
+    env = {**os.environ, "IDL_CACHE_DIR": cache_dir}
+    proc = subprocess.run(
+        [sys.executable, "-c", DECODER_INIT],
+        check=True,
+        capture_output=True,
+        text=True,
+        env=env,
+    )
+    return float(proc.stdout.strip().splitlines()[-1])
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=15)
+    args = parser.parse_args()
+
+    samples = time_import(MODULE, args.runs)
+    print(f"import {MODULE}: median {statistics.median(samples):.3f}s "
+          f"(min {min(samples):.3f}s, max {max(samples):.3f}s, runs={args.runs})")
+
+    print("\nslowest imports (cumulative, us):")
+    for cumulative, name in slowest_imports(MODULE, args.top):
+        print(f"  {cumulative:>10}  {name}")
+
+    with tempfile.TemporaryDirectory() as cache_dir:
+        cold = time_decoder_init(cache_dir)
+        warm = time_decoder_init(cache_dir)
+    print(f"\ndecoder initialize: cold IDL cache {cold:.3f}s, warm {warm:.3f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+"""
+Speed of the typed row structs against the dict serializers.
+
+Times both paths end to end, from synthetic decoded accounts to encoded
+JSON, for every row type (the cases of `dex_dagster_tests/test_rows.py`,
+which checks they are byte-for-byte equal). Rows are built with the given
+field profile (see `field_profiles`); compare output sizes across profiles
+with --field-profile full / default / lean.
+
+    python benchmarks/row_encoding.py --rows 20000
+"""
+
+import argparse
+import json
+import random
+import time
+
+from dex_dagster.ingestion.src.common import rows
+from dex_dagster.ingestion.src.common.field_profiles import (
+    FIELD_PROFILES,
+    active_field_profile,
+    use_field_profile,
+)
+from dex_dagster_tests.test_rows import CASES
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=20_000)
+    parser.add_argument(
+        "--field-profile",
+        choices=sorted(FIELD_PROFILES),
+        default=active_field_profile(),
+    )
+    args = parser.parse_args()
+    random.seed(3)
+
+    with use_field_profile(args.field_profile):
+        run(args.rows)
+
+
+def run(n_rows: int) -> None:
+    for name, (make, as_dict, as_struct) in CASES.items():
+        accounts = [make() for _ in range(max(1, n_rows // 20))]
+        start = time.perf_counter()
+        json.dumps([as_dict(a) for a in accounts], indent=2).encode()
+        mid = time.perf_counter()
+        new = rows.encode_json([as_struct(a) for a in accounts])
+        end = time.perf_counter()
+        print(
+            f"{name:<27} {len(accounts):>6} rows  "
+            f"dict+json {mid - start:.3f}s  struct+msgspec {end - mid:.3f}s  "
+            f"({(mid - start) / (end - mid):.1f}x)  "
+            f"{len(new) / len(accounts) / 1024:.1f} KiB/row"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+"""
+Tail-latency benchmark for the multi-endpoint RPC router.
+
+Starts a few local JSON-RPC stand-ins with different latency profiles, then
+issues the same reads against a single endpoint and through `RoutedClient`
+and reports p50 / p95 / p99 and failures for each.
+
+    python benchmarks/rpc_router.py --calls 500
+"""
+
+import argparse
+import json
+import random
+import statistics
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from solana.rpc.api import Client
+
+from dex_dagster.ingestion.src.common.rpc_router import RoutedClient
+
+# name: (mean latency s, chance of a 2s stall, chance of an HTTP 500)
+PROFILES = {
+    "fast-flaky": (0.02, 0.05, 0.05),
+    "steady": (0.05, 0.0, 0.0),
+    "slow": (0.15, 0.01, 0.0),
+}
+
+
+def make_handler(mean: float, stall: float, error: float):
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+            stalled = random.random() < stall
+            time.sleep(2.0 if stalled else random.expovariate(1 / mean))
+            if random.random() < error:
+                self.send_response(500)
+                self.end_headers()
+                return
+            payload = json.dumps(
+                {"jsonrpc": "2.0", "result": 1, "id": body["id"]}
+            ).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def log_message(self, *args):
+            pass
+
+    return Handler
+
+
+def start_servers() -> dict:
+    urls = {}
+    for name, profile in PROFILES.items():
+        server = ThreadingHTTPServer(("127.0.0.1", 0), make_handler(*profile))
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        urls[name] = f"http://127.0.0.1:{server.server_address[1]}"
+    return urls
+
+
+def measure(client, calls: int) -> tuple[list[float], int]:
+    samples, failures = [], 0
+    for _ in range(calls):
+        start = time.perf_counter()
+        try:
+            client.get_slot()
+        except Exception:
+            failures += 1
+            continue
+        samples.append(time.perf_counter() - start)
+    return samples, failures
+
+
+def report(label: str, samples: list[float], failures: int) -> None:
+    q = statistics.quantiles(samples, n=100)
+    print(
+        f"{label:<22} p50={q[49] * 1000:7.1f}ms  p95={q[94] * 1000:7.1f}ms  "
+        f"p99={q[98] * 1000:7.1f}ms  failures={failures}"
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--calls", type=int, default=500)
+    args = parser.parse_args()
+
+    urls = start_servers()
+    for name, url in urls.items():
+        report(f"single: {name}", *measure(Client(url), args.calls))
+
+    router = RoutedClient(list(urls.values()))
+    report("router", *measure(router, args.calls))
+    for stats in router.summary():
+        print(f"  {stats}")
+    router.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+"""
+Replay speed of the local snapshot archive against the S3 JSON objects.
+
+Writes a synthetic day of hourly Raydium snapshots both ways (pretty-printed
+JSON files, as uploaded to S3, and archive segments), then times reading a
+time range back: parsing every JSON file vs. memory-mapping the segments and
+decoding only the rows in range. Checks that both return the same rows.
+
+    python benchmarks/snapshot_archive.py --hours 24 --pools 50
+"""
+
+import argparse
+import json
+import random
+import tempfile
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+
+from dex_dagster.ingestion.src.common.archive import SnapshotArchive, archive_snapshot
+
+
+def synthetic_run(n_pools: int, positions_per_pool: int, ts: str):
+    pools, ticks, positions = [], [], []
+    for p in range(n_pools):
+        pool = f"pool{p}"
+        pools.append(
+            {
+                "pool": {"address": pool, "parsed": {"data": {"liquidity": "1"}}},
+                "currentTick": random.randint(-5000, 5000),
+                "tickSpacing": 10,
+                "extraction_timestamp": ts,
+            }
+        )
+        ticks.append(
+            {
+                "pool": pool,
+                "tickArrays": {
+                    str(i): [str(random.getrandbits(128)) for _ in range(60)]
+                    for i in range(10)
+                },
+                "extraction_timestamp": ts,
+            }
+        )
+        positions.extend(
+            {
+                "poolId": pool,
+                "tickLowerIndex": -10,
+                "tickUpperIndex": 10,
+                "liquidity": str(random.getrandbits(64)),
+                "extraction_timestamp": ts,
+            }
+            for _ in range(positions_per_pool)
+        )
+    return {"pool": pools, "tick": ticks, "protocol_position": positions}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--hours", type=int, default=24)
+    parser.add_argument("--pools", type=int, default=50)
+    parser.add_argument("--positions", type=int, default=40)
+    args = parser.parse_args()
+
+    random.seed(5)
+    root = Path(tempfile.mkdtemp())
+    json_dir = root / "json"
+    json_dir.mkdir()
+    archive = SnapshotArchive(root / "archive")
+
+    start = datetime(2025, 6, 1)
+    for h in range(args.hours):
+        ts = str(start + timedelta(hours=h, seconds=7))
+        run = synthetic_run(args.pools, args.positions, ts)
+        for kind, rows in run.items():
+            path = json_dir / f"{kind}_{h:04d}.json"
+            path.write_text(json.dumps(rows, indent=2))
+        archive_snapshot("raydium", "TOKEN", ts, run, root=archive.root)
+
+    lo = start + timedelta(hours=args.hours // 4)
+    hi = start + timedelta(hours=args.hours * 3 // 4)
+
+    t0 = time.perf_counter()
+    from_json = 0
+    for path in sorted(json_dir.glob("*.json")):
+        for row in json.loads(path.read_text()):
+            if lo <= datetime.fromisoformat(row["extraction_timestamp"]) <= hi:
+                from_json += 1
+    t1 = time.perf_counter()
+    from_archive = sum(1 for _ in archive.rows("raydium", lo, hi))
+    t2 = time.perf_counter()
+    scanned = sum(t.num_rows for t in archive.tables("raydium", lo, hi))
+    t3 = time.perf_counter()
+
+    assert from_json == from_archive == scanned, (from_json, from_archive, scanned)
+    print(f"{from_json} rows in range ({args.hours} hourly runs on disk)")
+    print(f"json files:        {t1 - t0:.2f}s")
+    print(f"archive (decoded): {t2 - t1:.2f}s")
+    print(f"archive (tables):  {t3 - t2:.3f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+"""
+Throughput and parity checks for the CLMM swap-quote engine.
+
+Parity: both tick -> sqrt price implementations must reproduce the programs'
+MIN/MAX_SQRT_PRICE constants and invert cleanly; quotes must converge to
+the spot price for tiny sizes and move the price in the swap direction.
+(There are no recorded on-chain swaps in the repo to replay.)
+
+Throughput: builds synthetic pools from random positions and times a batch
+of quotes of mixed sizes, from well inside one tick to draining the pool.
+
+    python benchmarks/swap_quotes.py --pools 200 --quotes 20000
+"""
+
+import argparse
+import random
+import time
+
+from dex_dagster.ingestion.src.analytics.quotes import (
+    MAX_TICK,
+    MIN_TICK,
+    ORCA_MAX_SQRT_PRICE,
+    ORCA_MIN_SQRT_PRICE,
+    RAYDIUM_MAX_SQRT_PRICE,
+    RAYDIUM_MIN_SQRT_PRICE,
+    PoolIndex,
+    QuoteEngine,
+    orca_sqrt_price_at_tick,
+    raydium_sqrt_price_at_tick,
+    tick_at_sqrt_price,
+)
+
+
+def check_tick_math() -> None:
+    for name, at_tick, lo, hi in (
+        (
+            "raydium",
+            raydium_sqrt_price_at_tick,
+            RAYDIUM_MIN_SQRT_PRICE,
+            RAYDIUM_MAX_SQRT_PRICE,
+        ),
+        ("orca", orca_sqrt_price_at_tick, ORCA_MIN_SQRT_PRICE, ORCA_MAX_SQRT_PRICE),
+    ):
+        assert at_tick(MIN_TICK) == lo, f"{name} MIN_SQRT_PRICE mismatch"
+        assert at_tick(MAX_TICK) == hi, f"{name} MAX_SQRT_PRICE mismatch"
+        assert at_tick(0) == 1 << 64
+        for tick in random.sample(range(MIN_TICK, MAX_TICK), 200):
+            assert tick_at_sqrt_price(at_tick(tick), at_tick) == tick
+        print(f"tick math ({name}): bounds match program constants, round trip ok")
+
+
+def synthetic_pool(name: str, protocol: str, n_positions: int) -> PoolIndex:
+    at_tick = (
+        raydium_sqrt_price_at_tick if protocol == "raydium" else orca_sqrt_price_at_tick
+    )
+    spacing = random.choice([1, 10, 60])
+    current = random.randint(-20000, 20000) // spacing * spacing
+    net, liquidity = {}, 0
+    for _ in range(n_positions):
+        lower = current + random.randint(-300, 300) * spacing
+        upper = lower + random.randint(1, 200) * spacing
+        amount = random.getrandbits(random.choice([40, 56, 64]))
+        net[lower] = net.get(lower, 0) + amount
+        net[upper] = net.get(upper, 0) - amount
+        if lower <= current < upper:
+            liquidity += amount
+    return PoolIndex.build(
+        name,
+        protocol,
+        (at_tick(current) + at_tick(current + 1)) // 2,
+        liquidity,
+        current,
+        random.choice([100, 500, 2500, 3000, 10000]),
+        net.items(),
+    )
+
+
+def check_quotes(engine: QuoteEngine) -> None:
+    for index in list(engine.pools.values())[:50]:
+        if index.liquidity == 0:
+            continue
+        spot = (index.sqrt_price / 2**64) ** 2
+        tiny = engine.quote(index.pool, True, 10**12)
+        assert tiny.filled and tiny.ticks_crossed == 0
+        execution = tiny.amount_out / (tiny.amount_in - tiny.fee_amount)
+        assert abs(execution / spot - 1) < 1e-3
+        for a_to_b in (True, False):
+            q = engine.quote(index.pool, a_to_b, 10**20)
+            assert q.amount_in <= 10**20 and q.amount_out >= 0
+            moved_down = q.sqrt_price_after <= index.sqrt_price
+            assert moved_down == a_to_b or q.amount_in == 0
+    print("quotes: tiny sizes match spot, directions and bounds hold")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--pools", type=int, default=200)
+    parser.add_argument("--positions", type=int, default=500)
+    parser.add_argument("--quotes", type=int, default=20_000)
+    args = parser.parse_args()
+
+    random.seed(11)
+    check_tick_math()
+
+    start = time.perf_counter()
+    engine = QuoteEngine(
+        synthetic_pool(f"pool{i}", random.choice(["raydium", "orca"]), args.positions)
+        for i in range(args.pools)
+    )
+    print(f"built {args.pools} pool indexes in {time.perf_counter() - start:.2f}s")
+    check_quotes(engine)
+
+    pools = list(engine.pools)
+    requests = [
+        (random.choice(pools), random.random() < 0.5, 10 ** random.randint(10, 22))
+        for _ in range(args.quotes)
+    ]
+    start = time.perf_counter()
+    quotes = engine.quote_many(requests)
+    elapsed = time.perf_counter() - start
+    crossed = sum(q.ticks_crossed for q in quotes) / len(quotes)
+    print(
+        f"{len(quotes)} quotes in {elapsed:.2f}s "
+        f"= {len(quotes) / elapsed:,.0f} quotes/s "
+        f"(avg {crossed:.1f} ticks crossed)"
+    )
+
+
+if __name__ == "__main__":
+    main()
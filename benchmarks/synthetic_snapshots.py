@@ -0,0 +1,616 @@
+"""
+Synthetic raw snapshots at configurable scale, for every `raw` dbt source.
+
+Fabricates hourly Raydium and Orca snapshots the way the ingestion writes
+them: decoded accounts are built in memory and formatted with the same row
+structs (`common.rows`), vault blocks and snapshot index the runners use, so
+every landing table in models/sources.yml gets rows of the exact production
+shape. The state is consistent: each pool has a set of positions, its
+liquidity-net/gross per tick and its initialized tick arrays (and Raydium's
+tick-array bitmap) are derived from them, and every hour the price walks
+and a share of the positions is replaced.
+
+    # JSONEachRow files, one per landing table
+    python benchmarks/synthetic_snapshots.py --pools 500 --positions 200 \\
+        --hours 24 --out /tmp/synthetic
+
+    # straight into the landing tables (see sol_dex_dbt_models/local)
+    python benchmarks/synthetic_snapshots.py --pools 500 --hours 720 \\
+        --clickhouse-url http://localhost:8123
+
+benchmarks/dbt_build.py uses this to time `dbt build` per model.
+"""
+
+import argparse
+import os
+import random
+import time
+from collections import defaultdict
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from pathlib import Path
+from types import SimpleNamespace as NS
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from solders.pubkey import Pubkey
+
+from dex_dagster.ingestion.src.common import rows
+from dex_dagster.ingestion.src.common.archive import LANDING_TABLES
+from dex_dagster.ingestion.src.common.constants import TOKEN_MINT
+from dex_dagster.ingestion.src.common.spl_token import vault_balance
+from dex_dagster.ingestion.src.common.utility import (
+    build_snapshot_index,
+    insert_json_rows,
+    snapshot_key,
+)
+
+TICK_ARRAY_SIZE = {"raydium": 60, "orca": 88}
+TICK_SPACINGS = [1, 8, 10, 60, 64, 128]
+RAYDIUM_BITMAP_WORDS = 16  # 1024 tick arrays around tick 0
+KINDS = {
+    "raydium": ["pool", "tick", "protocol_position", "personal_position"],
+    "orca": ["pool", "tick", "position"],
+}
+
+
+@dataclass
+class Position:
+    address: str
+    mint: str
+    lower: int
+    upper: int
+    liquidity: int
+
+
+@dataclass
+class Pool:
+    protocol: str
+    address: str
+    mint_a: str
+    mint_b: str
+    vault_a: str
+    vault_b: str
+    extension: str
+    decimals: Tuple[int, int]
+    tick_spacing: int
+    tick: int
+    positions: List[Position] = field(default_factory=list)
+    tick_array_keys: Dict[int, str] = field(default_factory=dict)
+
+
+class SyntheticMarket:
+    """Pools of both protocols for one token, stepped hour by hour."""
+
+    def __init__(
+        self,
+        token: str,
+        pools: int,
+        positions: int,
+        churn: float = 0.05,
+        seed: int = 7,
+    ):
+        self.rng = random.Random(seed)
+        self.token = token
+        self.churn = churn
+        self.pools = [
+            self._pool(protocol, positions)
+            for protocol in ("raydium", "orca")
+            for _ in range(pools)
+        ]
+
+    def key(self) -> str:
+        return str(Pubkey(self.rng.randbytes(32)))
+
+    def u(self, bits: int) -> int:
+        return self.rng.getrandbits(bits)
+
+    def _pool(self, protocol: str, n_positions: int) -> Pool:
+        spacing = self.rng.choice(TICK_SPACINGS)
+        pool = Pool(
+            protocol=protocol,
+            address=self.key(),
+            mint_a=self.token,
+            mint_b=self.key(),
+            vault_a=self.key(),
+            vault_b=self.key(),
+            extension=self.key(),
+            decimals=(6, self.rng.choice([6, 8, 9])),
+            tick_spacing=spacing,
+            tick=self.rng.randint(-2000, 2000) * spacing,
+        )
+        pool.positions = [self._position(pool) for _ in range(n_positions)]
+        return pool
+
+    def _position(self, pool: Pool) -> Position:
+        # ranges cluster around the price: most are a few arrays wide
+        spacing = pool.tick_spacing
+        width = max(1, int(self.rng.expovariate(1 / 40))) * spacing
+        center = pool.tick + int(self.rng.gauss(0, 60)) * spacing
+        lower = center // spacing * spacing - width
+        return Position(
+            address=self.key(),
+            mint=self.key(),
+            lower=lower,
+            upper=lower + 2 * width,
+            liquidity=self.rng.randint(10**6, 10**15),
+        )
+
+    def step(self) -> None:
+        """One hour: the price walks and `churn` of the positions is replaced."""
+        for pool in self.pools:
+            pool.tick += int(self.rng.gauss(0, 5)) * pool.tick_spacing
+            for i in range(len(pool.positions)):
+                if self.rng.random() < self.churn:
+                    pool.positions[i] = self._position(pool)
+
+    def tick_liquidity(self, pool: Pool) -> Dict[int, Tuple[int, int]]:
+        """Liquidity net and gross of every initialized tick."""
+        ticks: Dict[int, List[int]] = defaultdict(lambda: [0, 0])
+        for p in pool.positions:
+            ticks[p.lower][0] += p.liquidity
+            ticks[p.lower][1] += p.liquidity
+            ticks[p.upper][0] -= p.liquidity
+            ticks[p.upper][1] += p.liquidity
+        return {tick: (net, gross) for tick, (net, gross) in ticks.items()}
+
+    def tick_arrays(self, pool: Pool) -> Dict[int, Dict[int, Tuple[int, int]]]:
+        """Initialized ticks grouped by the start index of their tick array."""
+        per_array = TICK_ARRAY_SIZE[pool.protocol] * pool.tick_spacing
+        arrays: Dict[int, Dict[int, Tuple[int, int]]] = defaultdict(dict)
+        for tick, liquidity in self.tick_liquidity(pool).items():
+            arrays[tick // per_array * per_array][tick] = liquidity
+        return dict(sorted(arrays.items()))
+
+    def tick_array_key(self, pool: Pool, start: int) -> str:
+        if start not in pool.tick_array_keys:
+            pool.tick_array_keys[start] = self.key()
+        return pool.tick_array_keys[start]
+
+    def active_liquidity(self, pool: Pool) -> int:
+        return sum(
+            p.liquidity for p in pool.positions if p.lower <= pool.tick < p.upper
+        )
+
+    def sqrt_price_x64(self, pool: Pool) -> int:
+        return int(1.0001 ** (pool.tick / 2) * 2**64)
+
+    # --- Raydium -----------------------------------------------------------
+
+    def raydium_rows(self, pool: Pool, ts: str) -> Dict[str, list]:
+        arrays = self.tick_arrays(pool)
+        per_array = TICK_ARRAY_SIZE["raydium"] * pool.tick_spacing
+        bitmap = [0] * RAYDIUM_BITMAP_WORDS
+        for start in arrays:
+            bit = start // per_array + RAYDIUM_BITMAP_WORDS * 32
+            if 0 <= bit < RAYDIUM_BITMAP_WORDS * 64:
+                bitmap[bit // 64] |= 1 << (bit % 64)
+
+        state = rows.PoolStateRow.from_decoded(self._raydium_pool_state(pool, bitmap))
+        balances = [self.u(50) for _ in range(2)]
+        pool_row = {
+            "timestamp": ts,
+            "pool": _envelope("raydium_amm_v3", "PoolState", pool.address, state, 1544),
+            "extension": _envelope(
+                "raydium_amm_v3",
+                "TickArrayBitmapExtension",
+                pool.extension,
+                {
+                    "poolId": pool.address,
+                    "positiveTickArrayBitmap": [["0"] * 8 for _ in range(14)],
+                    "negativeTickArrayBitmap": [["0"] * 8 for _ in range(14)],
+                },
+                1832,
+            ),
+            "currentTick": pool.tick,
+            "tickSpacing": pool.tick_spacing,
+            "currentArrayStart": pool.tick // per_array * per_array,
+            "tokenVault0": vault_balance(
+                pool.vault_a, {"amount": balances[0]}, pool.decimals[0]
+            ),
+            "tokenVault1": vault_balance(
+                pool.vault_b, {"amount": balances[1]}, pool.decimals[1]
+            ),
+            "extraction_timestamp": ts,
+        }
+
+        tick_arrays = {}
+        for start, ticks in arrays.items():
+            address = self.tick_array_key(pool, start)
+            decoded = NS(
+                pool_id=pool.address,
+                start_tick_index=start,
+                ticks=[
+                    self._raydium_tick(start + i * pool.tick_spacing, ticks)
+                    for i in range(TICK_ARRAY_SIZE["raydium"])
+                ],
+            )
+            tick_arrays[address] = _envelope(
+                "raydium_amm_v3",
+                "TickArrayState",
+                address,
+                rows.TickArrayStateRow.from_decoded(decoded),
+                10240,
+            )
+        tick_row = {
+            "pool": pool.address,
+            "tickArrays": tick_arrays,
+            "extraction_timestamp": ts,
+        }
+
+        ranges: Dict[Tuple[int, int], int] = defaultdict(int)
+        for p in pool.positions:
+            ranges[(p.lower, p.upper)] += p.liquidity
+        protocol_positions = [
+            rows.ProtocolPositionRow(
+                pool.address,
+                lower,
+                upper,
+                str(liquidity),
+                str(self.u(128)),
+                str(self.u(128)),
+                str(self.u(40)),
+                str(self.u(40)),
+                [str(self.u(128)) for _ in range(3)],
+                extraction_timestamp=ts,
+            )
+            for (lower, upper), liquidity in ranges.items()
+        ]
+        personal_positions = [
+            rows.PersonalPositionRow(
+                p.mint,
+                pool.address,
+                p.lower,
+                p.upper,
+                str(p.liquidity),
+                str(self.u(128)),
+                str(self.u(128)),
+                str(self.u(40)),
+                str(self.u(40)),
+                [
+                    rows.PersonalRewardInfoRow(str(self.u(128)), str(self.u(40)))
+                    for _ in range(3)
+                ],
+                extraction_timestamp=ts,
+            )
+            for p in pool.positions
+        ]
+        return {
+            "pool": [pool_row],
+            "tick": [tick_row],
+            "protocol_position": protocol_positions,
+            "personal_position": personal_positions,
+        }
+
+    def _raydium_tick(self, tick: int, ticks: Dict[int, Tuple[int, int]]) -> NS:
+        net, gross = ticks.get(tick, (0, 0))
+        live = tick in ticks
+        return NS(
+            tick=tick,
+            liquidity_net=net,
+            liquidity_gross=gross,
+            fee_growth_outside0_x64=self.u(128) if live else 0,
+            fee_growth_outside1_x64=self.u(128) if live else 0,
+            reward_growths_outside_x64=[self.u(128) if live else 0 for _ in range(3)],
+        )
+
+    def _raydium_pool_state(self, pool: Pool, bitmap: List[int]) -> NS:
+        reward = lambda: NS(  # noqa: E731
+            reward_state=0,
+            open_time=0,
+            end_time=0,
+            last_update_time=0,
+            emissions_per_second_x64=0,
+            reward_total_emissioned=0,
+            reward_claimed=0,
+            token_mint=Pubkey.default(),
+            token_vault=Pubkey.default(),
+            authority=Pubkey.default(),
+            reward_growth_global_x64=0,
+        )
+        return NS(
+            bump=[self.u(8)],
+            amm_config=self.key(),
+            owner=self.key(),
+            token_mint0=pool.mint_a,
+            token_mint1=pool.mint_b,
+            token_vault0=pool.vault_a,
+            token_vault1=pool.vault_b,
+            observation_key=self.key(),
+            mint_decimals0=pool.decimals[0],
+            mint_decimals1=pool.decimals[1],
+            tick_spacing=pool.tick_spacing,
+            liquidity=self.active_liquidity(pool),
+            sqrt_price_x64=self.sqrt_price_x64(pool),
+            tick_current=pool.tick,
+            padding3=0,
+            padding4=0,
+            fee_growth_global0_x64=self.u(128),
+            fee_growth_global1_x64=self.u(128),
+            protocol_fees_token0=self.u(40),
+            protocol_fees_token1=self.u(40),
+            swap_in_amount_token0=self.u(90),
+            swap_out_amount_token1=self.u(90),
+            swap_in_amount_token1=self.u(90),
+            swap_out_amount_token0=self.u(90),
+            status=0,
+            padding=[0] * 7,
+            reward_infos=[reward() for _ in range(3)],
+            tick_array_bitmap=bitmap,
+            total_fees_token0=self.u(50),
+            total_fees_claimed_token0=self.u(48),
+            total_fees_token1=self.u(50),
+            total_fees_claimed_token1=self.u(48),
+            fund_fees_token0=self.u(40),
+            fund_fees_token1=self.u(40),
+            open_time=self.u(31),
+            recent_epoch=self.u(10),
+            padding1=[0] * 24,
+            padding2=[0] * 32,
+        )
+
+    # --- Orca --------------------------------------------------------------
+
+    def orca_rows(self, pool: Pool, ts: str) -> Dict[str, list]:
+        whirlpool = self._whirlpool(pool)
+        pool_row = {
+            "whirlpool": rows.WhirlpoolRow.from_account(
+                whirlpool, pool.address, self.token
+            ),
+            "token_vault_a_amount": self._token_account(pool.mint_a, pool.address),
+            "token_vault_b_amount": self._token_account(pool.mint_b, pool.address),
+            "extraction_timestamp": ts,
+        }
+
+        tick_arrays = []
+        for start, ticks in self.tick_arrays(pool).items():
+            tick_arrays.append(
+                rows.WhirlpoolTickArrayRow.from_account(
+                    NS(
+                        pubkey=self.tick_array_key(pool, start),
+                        start_tick_index=start,
+                        whirlpool=pool.address,
+                        ticks=[
+                            self._orca_tick(start + i * pool.tick_spacing, ticks)
+                            for i in range(TICK_ARRAY_SIZE["orca"])
+                        ],
+                    )
+                )
+            )
+        tick_row = {
+            "pool": pool.address,
+            "tick_arrays": tick_arrays,
+            "extraction_timestamp": ts,
+        }
+
+        positions = [
+            rows.WhirlpoolPositionRow.from_account(
+                NS(
+                    pubkey=p.address,
+                    whirlpool=pool.address,
+                    position_mint=p.mint,
+                    liquidity=p.liquidity,
+                    tick_lower_index=p.lower,
+                    tick_upper_index=p.upper,
+                    fee_growth_checkpoint_a=self.u(128),
+                    fee_owed_a=self.u(40),
+                    fee_growth_checkpoint_b=self.u(128),
+                    fee_owed_b=self.u(40),
+                    reward_infos=[
+                        NS(growth_inside_checkpoint=self.u(128), amount_owed=0)
+                        for _ in range(3)
+                    ],
+                ),
+                ts,
+            )
+            for p in pool.positions
+        ]
+        return {"pool": [pool_row], "tick": [tick_row], "position": positions}
+
+    def _orca_tick(self, tick: int, ticks: Dict[int, Tuple[int, int]]) -> NS:
+        net, gross = ticks.get(tick, (0, 0))
+        live = tick in ticks
+        return NS(
+            initialized=live,
+            liquidity_net=net,
+            liquidity_gross=gross,
+            fee_growth_outside_a=self.u(128) if live else 0,
+            fee_growth_outside_b=self.u(128) if live else 0,
+            reward_growths_outside=[self.u(128) if live else 0 for _ in range(3)],
+        )
+
+    def _token_account(self, mint: str, owner: str) -> rows.TokenAccountRow:
+        return rows.TokenAccountRow.from_decoded(
+            {
+                "mint": mint,
+                "owner": owner,
+                "amount": self.u(50),
+                "delegate": None,
+                "is_native": False,
+                "delegated_amount": 0,
+                "close_authority": None,
+            }
+        )
+
+    def _whirlpool(self, pool: Pool) -> NS:
+        reward = lambda: NS(  # noqa: E731
+            mint=Pubkey.default(),
+            vault=Pubkey.default(),
+            authority=self.key(),
+            emissions_per_second_x64=0,
+            growth_global_x64=0,
+        )
+        return NS(
+            whirlpools_config=self.key(),
+            whirlpool_bump=[self.u(8)],
+            tick_spacing=pool.tick_spacing,
+            tick_spacing_seed=[pool.tick_spacing % 256, pool.tick_spacing // 256],
+            fee_rate=self.rng.choice([100, 500, 3000, 10000]),
+            protocol_fee_rate=1300,
+            liquidity=self.active_liquidity(pool),
+            sqrt_price=self.sqrt_price_x64(pool),
+            tick_current_index=pool.tick,
+            protocol_fee_owed_a=self.u(40),
+            protocol_fee_owed_b=self.u(40),
+            token_mint_a=pool.mint_a,
+            token_vault_a=pool.vault_a,
+            fee_growth_global_a=self.u(128),
+            token_mint_b=pool.mint_b,
+            token_vault_b=pool.vault_b,
+            fee_growth_global_b=self.u(128),
+            reward_last_updated_timestamp=self.u(31),
+            reward_infos=[reward() for _ in range(3)],
+        )
+
+    # --- Snapshots ---------------------------------------------------------
+
+    def snapshot(self, ts: str) -> Dict[str, list]:
+        """Rows of one hourly run of both protocols, per landing table."""
+        tables: Dict[str, list] = defaultdict(list)
+        for protocol in ("raydium", "orca"):
+            outputs: Dict[str, list] = {kind: [] for kind in KINDS[protocol]}
+            for pool in self.pools:
+                if pool.protocol != protocol:
+                    continue
+                pool_rows = (
+                    self.raydium_rows(pool, ts)
+                    if protocol == "raydium"
+                    else self.orca_rows(pool, ts)
+                )
+                for kind, kind_rows in pool_rows.items():
+                    outputs[kind].extend(kind_rows)
+            for kind, kind_rows in outputs.items():
+                tables[LANDING_TABLES[(protocol, kind)]].extend(kind_rows)
+            tables[LANDING_TABLES[(protocol, "snapshot_index")]].append(
+                build_snapshot_index(
+                    protocol=protocol,
+                    token=self.token,
+                    extraction_timestamp=ts,
+                    row_counts={k: len(v) for k, v in outputs.items()},
+                    object_keys={
+                        k: snapshot_key("synthetic", protocol, k, self.token, ts)
+                        for k in outputs
+                    },
+                    pools=[p.address for p in self.pools if p.protocol == protocol],
+                )
+            )
+        return dict(tables)
+
+
+def _envelope(program: str, name: str, address: str, data, space: int) -> dict:
+    """Same shape as `DecoderRegistry._envelope`."""
+    return {
+        "address": address,
+        "parsed": {"name": name, "data": data, "type": "account"},
+        "program": program,
+        "space": space,
+    }
+
+
+def generate(
+    pools: int,
+    positions: int,
+    hours: int,
+    start: datetime,
+    token: str = TOKEN_MINT,
+    churn: float = 0.05,
+    seed: int = 7,
+) -> Iterator[Tuple[str, Dict[str, list]]]:
+    """(extraction timestamp, rows per landing table) for each hour, oldest first."""
+    market = SyntheticMarket(token, pools, positions, churn, seed)
+    for hour in range(hours):
+        if hour:
+            market.step()
+        ts = str(start + timedelta(hours=hour, seconds=7, microseconds=123456))
+        yield ts, market.snapshot(ts)
+
+
+def load(
+    snapshots: Iterator[Tuple[str, Dict[str, list]]],
+    clickhouse_url: Optional[str] = None,
+    database: str = "default",
+    auth: Optional[Tuple[str, str]] = None,
+    out: Optional[Path] = None,
+) -> Dict[str, Dict[str, int]]:
+    """
+    Writes every snapshot to ClickHouse and/or JSONEachRow files.
+
+    Returns:
+        Dict[str, Dict[str, int]]: Rows and encoded bytes per landing table
+    """
+    totals: Dict[str, Dict[str, int]] = defaultdict(lambda: {"rows": 0, "bytes": 0})
+    if out is not None:
+        out.mkdir(parents=True, exist_ok=True)
+    for ts, tables in snapshots:
+        for table, table_rows in tables.items():
+            encoded = [rows.encode_json(r, indent=0) for r in table_rows]
+            totals[table]["rows"] += len(encoded)
+            totals[table]["bytes"] += sum(len(e) + 1 for e in encoded)
+            if clickhouse_url:
+                insert_json_rows(
+                    clickhouse_url,
+                    f"{database}.{table}",
+                    (e.decode() for e in encoded),
+                    auth,
+                )
+            if out is not None:
+                with open(out / f"{table}.jsonl", "ab") as f:
+                    f.writelines(e + b"\n" for e in encoded)
+        print(f"{ts}: {sum(len(t) for t in tables.values())} rows")
+    return dict(totals)
+
+
+def add_arguments(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument("--pools", type=int, default=50, help="pools per protocol")
+    parser.add_argument("--positions", type=int, default=100, help="per pool")
+    parser.add_argument("--hours", type=int, default=24)
+    parser.add_argument("--start", type=datetime.fromisoformat, default=None)
+    parser.add_argument("--churn", type=float, default=0.05)
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--clickhouse-database", default="default")
+
+
+def clickhouse_auth() -> Optional[Tuple[str, str]]:
+    user = os.getenv("CLICKHOUSE_USER", "default")
+    return (user, os.getenv("CLICKHOUSE_PASSWORD", "clickhouse"))
+
+
+def default_start(hours: int) -> datetime:
+    """Start so the last synthetic hour is the current one."""
+    now = datetime.now().replace(minute=0, second=0, microsecond=0)
+    return now - timedelta(hours=hours - 1)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    add_arguments(parser)
+    parser.add_argument("--out", type=Path, help="write JSONEachRow files here")
+    parser.add_argument("--clickhouse-url", help="insert into the landing tables")
+    args = parser.parse_args()
+    if not args.out and not args.clickhouse_url:
+        parser.error("give --out and/or --clickhouse-url")
+
+    started = time.perf_counter()
+    totals = load(
+        generate(
+            args.pools,
+            args.positions,
+            args.hours,
+            args.start or default_start(args.hours),
+            churn=args.churn,
+            seed=args.seed,
+        ),
+        args.clickhouse_url,
+        args.clickhouse_database,
+        clickhouse_auth(),
+        args.out,
+    )
+    elapsed = time.perf_counter() - started
+    for table, t in sorted(totals.items()):
+        print(f"{table:<32} {t['rows']:>10} rows {t['bytes'] / 2**20:>10.1f} MiB")
+    print(f"generated in {elapsed:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
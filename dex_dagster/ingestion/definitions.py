@@ -1,9 +1,9 @@
+import os
+
 import dagster as dg
-from dagster_aws.s3 import S3Resource
+from typing import Dict, List, Optional
 
-from dex_dagster.ingestion.src.common.utility import get_timestamp
-from dex_dagster.ingestion.src.protocols.orca import run_orca
-from dex_dagster.ingestion.src.protocols.raydium import run_raydium
+from dagster_aws.s3 import S3Resource
 
 # pull secrets from the environment so they never appear in logs
 s3_resource = S3Resource(
@@ -14,60 +14,318 @@ s3_resource = S3Resource(
 
 
 class SolanaConfig(dg.ConfigurableResource):
+    # rpc fields take one URL or a comma-separated list; with several, calls are
+    # routed by latency and error rate and slow reads are hedged (rpc_router)
     token_mint: str = dg.EnvVar("token")
     raydium_rpc: str = dg.EnvVar("rpc_url")
     orca_rpc: str = dg.EnvVar("orca_rpc_url")
+    # Orca tick arrays either side of the current tick to read (orca.TICK_WINDOW);
+    # orca_full_tick_range reads every array of the tick range instead
+    orca_tick_window: int = 24
+    orca_full_tick_range: bool = False
+    # workers per pipeline stage ("fetch", "decode", "serialize"), overriding
+    # each protocol's defaults (RAYDIUM_CONCURRENCY / ORCA_CONCURRENCY)
+    pipeline_concurrency: Optional[Dict[str, int]] = None
+    # "sample" or "cprofile" profiles every snapshot run (see profiling);
+    # a run can also turn it on for itself through SnapshotRunConfig
+    profile: Optional[str] = None
+    # seconds a run may spend starting pool fetches; pools left by then are
+    # deferred to the next run (the most valuable are fetched first). The
+    # default leaves an hourly run time to upload before the next one starts
+    snapshot_time_budget: Optional[int] = 45 * 60
+    # look for pools created since the last run by the token mint's recent
+    # signatures; worth it for tokens with modest activity (pool_registry)
+    detect_new_pools: bool = False
+    # split every snapshot over this many worker processes by consistent
+    # hashing of the pools (sharding); each shard has its own rate limit
+    snapshot_shards: int = 1
+    # RPC URL of each shard per protocol, e.g. {"raydium": [url0, url1]};
+    # shard i reads through the i-th (wrapping around), or through the
+    # protocol's rpc field when unset
+    shard_rpc: Optional[Dict[str, List[str]]] = None
+
+    def orca_tick_range(self) -> Optional[int]:
+        """`tick_window` for run_orca: the window, or None for the full range."""
+        return None if self.orca_full_tick_range else self.orca_tick_window
+
+    def shard_rpc_urls(self, protocol: str, default: str) -> List[str]:
+        return (self.shard_rpc or {}).get(protocol) or [default]
 
 
 solana_config = SolanaConfig()
 
 
+class SnapshotRunConfig(dg.Config):
+    # per-run override of SolanaConfig.profile, e.g. from the launchpad
+    profile: Optional[str] = None
+    # snapshot only these pools; set by snapshot_schedule_sensor for the pools
+    # that are due, None snapshots every pool of the token
+    pools: Optional[List[str]] = None
+    # rescan the program for the token's pools instead of using the pool
+    # registry (it rescans on its own once POOL_REGISTRY_SCAN_INTERVAL passes)
+    rescan_pools: bool = False
+
+
+# "hourly" snapshots every pool on the hour; "adaptive" leaves it to
+# snapshot_schedule_sensor, which reads each pool at its own interval
+SNAPSHOT_SCHEDULE = os.getenv("SNAPSHOT_SCHEDULE", "hourly")
+SNAPSHOT_AUTOMATION = (
+    dg.AutomationCondition.on_cron("0 * * * *")
+    if SNAPSHOT_SCHEDULE == "hourly"
+    else None
+)
+
+
 AWS_BUCKET = dg.EnvVar("STORAGE_BUCKET_NAME")
-RAYDIUM_STORAGE_KEY = dg.EnvVar("RAYDIUM_STORAGE_KEY").get_value()
-ORCA_STORAGE_KEY = dg.EnvVar("ORCA_STORAGE_KEY").get_value()
+
+
+def snapshot_run_id(context: dg.AssetExecutionContext) -> str:
+    """Spool id for a snapshot run; re-executions reuse the original run's id."""
+    return context.run.root_run_id or context.run_id
+
+
+def manifest_metadata(manifest: Optional[dict]) -> dict:
+    """Asset metadata from a run manifest: the exact keys the run wrote."""
+    if manifest is None:
+        return {}
+    meta = {
+        "manifest_key": manifest["manifest_key"],
+        "slot_range": dg.MetadataValue.json(manifest["slot_range"]),
+        "cache_hit_rates": dg.MetadataValue.json(manifest.get("cache_hit_rates", {})),
+        "pipeline_stages": dg.MetadataValue.json(manifest.get("pipeline", {})),
+        "pools": len(manifest["index"]["pools"]),
+        "deferred_pools": dg.MetadataValue.json(manifest.get("deferred_pools", [])),
+        "failed_pools": dg.MetadataValue.json(manifest.get("failed_pools", [])),
+        "pool_schedule": dg.MetadataValue.json(manifest.get("schedule", {})),
+        "field_profile": manifest.get("field_profile", "full"),
+    }
+    for kind, obj in manifest["objects"].items():
+        # a sharded run writes its kinds as one part per shard (sharding)
+        meta[f"{kind}_key"] = obj.get("key") or dg.MetadataValue.json(obj["parts"])
+        meta[f"{kind}_rows"] = obj["rows"]
+    if "shards" in manifest:
+        meta["shards"] = dg.MetadataValue.json(manifest["shards"])
+    return meta
+
+
+def profile_metadata(artifacts: Dict[str, str]) -> dict:
+    """Asset metadata linking the profile artifacts of a run, if it was profiled."""
+    return {
+        f"profile_{kind}": dg.MetadataValue.path(uri)
+        for kind, uri in artifacts.items()
+    }
 
 
 @dg.asset(
     group_name="solana_ingestion",
-    automation_condition=dg.AutomationCondition.on_cron("0 * * * *"),
+    automation_condition=SNAPSHOT_AUTOMATION,
     kinds={"python"},
 )
 def raydium_snapshot(
+    context: dg.AssetExecutionContext,
+    config: SnapshotRunConfig,
     solana: SolanaConfig,
 ) -> dg.MaterializeResult:
     """
     Calls `run_raydium` (writes a set of JSON files to S3)
-    then records the filenames as Dagster metadata.
+    then records the keys from its run manifest as Dagster metadata.
+
+    Retries and re-executions share the root run's spool, so they resume
+    from the last finished pool instead of refetching every pool. With
+    profiling on, the profile artifacts are linked from the metadata too.
+
+    With `snapshot_shards` > 1 the pools are split over that many worker
+    processes, whose parts are merged into one snapshot (see `run_sharded`).
     """
-    run_raydium(solana.token_mint, solana.raydium_rpc)
+    # imported here so loading the code location doesn't pull in solana/anchorpy
+    from dex_dagster.ingestion.src.common.profiling import profile_run
+    from dex_dagster.ingestion.src.common.sharding import run_sharded
+    from dex_dagster.ingestion.src.protocols.raydium import run_raydium
 
-    ts = get_timestamp()
-    meta = {
-        "pool_key": f"{RAYDIUM_STORAGE_KEY}/pool/{solana.token_mint}_{ts}_pools.json",
-        "tick_key": f"{RAYDIUM_STORAGE_KEY}/tick/{solana.token_mint}_{ts}_ticks.json",
-        "protocol_pos_key": f"{RAYDIUM_STORAGE_KEY}/protocol_position/{solana.token_mint}_{ts}_protocol_position.json",
-        "personal_pos_key": f"{RAYDIUM_STORAGE_KEY}/personal_position/{solana.token_mint}_{ts}_personal_position.json",
-    }
-    return dg.MaterializeResult(metadata=meta)
+    with profile_run(
+        "raydium", solana.token_mint, config.profile or solana.profile, context.run_id
+    ) as profile:
+        if solana.snapshot_shards > 1:
+            manifest = run_sharded(
+                "raydium",
+                solana.token_mint,
+                solana.shard_rpc_urls("raydium", solana.raydium_rpc),
+                solana.snapshot_shards,
+                snapshot_run_id(context),
+                concurrency=solana.pipeline_concurrency,
+                pools=config.pools,
+                time_budget=solana.snapshot_time_budget,
+                rescan_pools=config.rescan_pools,
+                detect_new_pools=solana.detect_new_pools,
+            )
+        else:
+            manifest = run_raydium(
+                solana.token_mint,
+                solana.raydium_rpc,
+                snapshot_run_id(context),
+                solana.pipeline_concurrency,
+                config.pools,
+                solana.snapshot_time_budget,
+                config.rescan_pools,
+                solana.detect_new_pools,
+            )
+    return dg.MaterializeResult(
+        metadata={
+            **manifest_metadata(manifest),
+            **profile_metadata(profile.artifacts),
+        }
+    )
 
 
 @dg.asset(
     group_name="solana_ingestion",
-    automation_condition=dg.AutomationCondition.on_cron("0 * * * *"),
+    automation_condition=SNAPSHOT_AUTOMATION,
     kinds={"python"},
 )
 def orca_snapshot(
+    context: dg.AssetExecutionContext,
+    config: SnapshotRunConfig,
     solana: SolanaConfig,
 ) -> dg.MaterializeResult:
     """Same idea for Orca."""
     import asyncio
 
-    asyncio.run(run_orca(solana.token_mint, solana.orca_rpc))
+    from dex_dagster.ingestion.src.common.profiling import profile_run
+    from dex_dagster.ingestion.src.common.sharding import run_sharded
+    from dex_dagster.ingestion.src.protocols.orca import run_orca
 
-    ts = get_timestamp()
-    meta = {
-        "pool_key": f"{ORCA_STORAGE_KEY}/pool/{solana.token_mint}_{ts}_pools.json",
-        "tick_key": f"{ORCA_STORAGE_KEY}/tick/{solana.token_mint}_{ts}_ticks.json",
-        "position_key": f"{ORCA_STORAGE_KEY}/position/{solana.token_mint}_{ts}_positions.json",
-    }
-    return dg.MaterializeResult(metadata=meta)
+    with profile_run(
+        "orca", solana.token_mint, config.profile or solana.profile, context.run_id
+    ) as profile:
+        if solana.snapshot_shards > 1:
+            manifest = run_sharded(
+                "orca",
+                solana.token_mint,
+                solana.shard_rpc_urls("orca", solana.orca_rpc),
+                solana.snapshot_shards,
+                snapshot_run_id(context),
+                tick_window=solana.orca_tick_range(),
+                concurrency=solana.pipeline_concurrency,
+                pools=config.pools,
+                time_budget=solana.snapshot_time_budget,
+                rescan_pools=config.rescan_pools,
+                detect_new_pools=solana.detect_new_pools,
+            )
+        else:
+            manifest = asyncio.run(
+                run_orca(
+                    solana.token_mint,
+                    solana.orca_rpc,
+                    snapshot_run_id(context),
+                    solana.orca_tick_range(),
+                    solana.pipeline_concurrency,
+                    config.pools,
+                    solana.snapshot_time_budget,
+                    config.rescan_pools,
+                    solana.detect_new_pools,
+                )
+            )
+    return dg.MaterializeResult(
+        metadata={
+            **manifest_metadata(manifest),
+            **profile_metadata(profile.artifacts),
+        }
+    )
+
+
+SNAPSHOT_JOBS = {
+    protocol: dg.define_asset_job(f"{protocol}_snapshot_job", selection=[asset])
+    for protocol, asset in (("raydium", raydium_snapshot), ("orca", orca_snapshot))
+}
+
+
+@dg.sensor(
+    jobs=list(SNAPSHOT_JOBS.values()),
+    minimum_interval_seconds=300,
+    default_status=(
+        dg.DefaultSensorStatus.RUNNING
+        if SNAPSHOT_SCHEDULE == "adaptive"
+        else dg.DefaultSensorStatus.STOPPED
+    ),
+)
+def snapshot_schedule_sensor(context: dg.SensorEvaluationContext):
+    """
+    Launches a snapshot of the pools that are due under the pool schedule.
+
+    Each pool is read at the interval its recent activity earned it (see
+    `pool_schedule`), within the RPC budget; a full run of every pool in the
+    pool registry, which is how new pools join the schedule, is launched once
+    the longest interval has passed since the last one, and in the first hour
+    of every day: the landing tables keep only the hour-0 snapshots of data
+    older than their retention (see macros/raw_tables.sql), so every pool
+    needs one each day whatever its interval. A protocol with a snapshot run
+    still queued or in progress is skipped, as its pools are only
+    rescheduled once it finishes.
+
+    The schedule is read from the snapshot bucket, where every run writes it.
+    The sensor fails closed: a protocol whose schedule can't be read, or that
+    has none yet, is skipped (materialize its snapshot asset once to seed
+    it), and the cursor holds when it last launched a full run, so it never
+    launches them more often than the longest interval even if their
+    results don't reach the schedule.
+    """
+    import json
+    from datetime import datetime
+
+    from dex_dagster.ingestion.src.common.pool_schedule import get_pool_schedule
+
+    schedule = get_pool_schedule()
+    full_runs = json.loads(context.cursor) if context.cursor else {}
+    # local time, like the runs' extraction timestamps
+    local_now = datetime.now()
+    now = local_now.timestamp()
+    midnight = local_now.replace(hour=0, minute=0, second=0, microsecond=0)
+    for protocol, job in SNAPSHOT_JOBS.items():
+        active = context.instance.get_runs(
+            filters=dg.RunsFilter(
+                job_name=job.name,
+                statuses=[
+                    dg.DagsterRunStatus.NOT_STARTED,
+                    dg.DagsterRunStatus.QUEUED,
+                    dg.DagsterRunStatus.STARTING,
+                    dg.DagsterRunStatus.STARTED,
+                ],
+            ),
+            limit=1,
+        )
+        if active:
+            continue
+        try:
+            seeded = schedule.pull(protocol)
+        except Exception as exc:
+            context.log.warning(f"{protocol}: can't read the pool schedule: {exc}")
+            continue
+        if not seeded:
+            context.log.warning(
+                f"{protocol}: no pool schedule yet; materialize {protocol}_snapshot "
+                "once to seed it"
+            )
+            continue
+        pools = None
+        launched = full_runs.get(protocol, 0)
+        daily_run_due = local_now.hour == 0 and launched < midnight.timestamp()
+        if daily_run_due or (
+            schedule.full_run_due(protocol, now)
+            and now - launched >= schedule.policy.max_interval
+        ):
+            full_runs[protocol] = now
+        else:
+            pools = schedule.due_pools(protocol, now)
+            if not pools:
+                continue
+        context.log.info(
+            f"{protocol}: snapshotting {len(pools) if pools else 'all'} pools"
+        )
+        yield dg.RunRequest(
+            job_name=job.name,
+            run_config={
+                "ops": {f"{protocol}_snapshot": {"config": {"pools": pools}}}
+            },
+            tags={"snapshot/pools": str(len(pools)) if pools else "all"},
+        )
+    context.update_cursor(json.dumps(full_runs))
@@ -0,0 +1,458 @@
+"""
+Swap quotes and price impact for Raydium CLMM and Orca Whirlpool pools.
+
+Each pool is turned into a `PoolIndex` once per snapshot: its initialized
+ticks sorted by index, with liquidity_net and the tick's sqrt price
+precomputed. A quote then walks that index the way the programs' swap loop
+does (exact-input, Q64.64 integer math with the programs' rounding), so a
+(pool, direction, amount) quote is a handful of big-int steps per tick
+crossed.
+
+Both programs share the swap-step math; they differ only in how a tick index
+becomes a sqrt price, so each protocol keeps its own constants below. The
+quote assumes every initialized tick array is in the snapshot and ignores the
+per-transaction tick-array limit.
+"""
+
+import logging
+import math
+from bisect import bisect_right
+from dataclasses import dataclass
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+logger = logging.getLogger("dex")
+
+MIN_TICK = -443636
+MAX_TICK = 443636
+FEE_RATE_DENOMINATOR = 1_000_000
+Q64 = 1 << 64
+U128_MAX = (1 << 128) - 1
+LOG_1_0001 = math.log(1.0001)
+
+# Raydium tick_math: 2^64 / sqrt(1.0001)^(2^i), bit i of |tick|
+RAYDIUM_TICK_RATIOS = (
+    0xFFFCB933BD6FB800,
+    0xFFF97272373D4000,
+    0xFFF2E50F5F657000,
+    0xFFE5CACA7E10F000,
+    0xFFCB9843D60F7000,
+    0xFF973B41FA98E800,
+    0xFF2EA16466C9B000,
+    0xFE5DEE046A9A3800,
+    0xFCBE86C7900BB000,
+    0xF987A7253AC65800,
+    0xF3392B0822BB6000,
+    0xE7159475A2CAF000,
+    0xD097F3BDFD2F2000,
+    0xA9F746462D9F8000,
+    0x70D869A156F31C00,
+    0x31BE135F97ED3200,
+    0x9AA508B5B85A500,
+    0x5D6AF8DEDC582C,
+    0x2216E584F5FA,
+)
+RAYDIUM_MIN_SQRT_PRICE = 4295048016
+RAYDIUM_MAX_SQRT_PRICE = 79226673521066979257578248091
+
+# Orca tick_math: sqrt(1.0001)^(2^i) in Q96 for positive ticks ...
+ORCA_POSITIVE_TICK_RATIOS = (
+    79232123823359799118286999567,
+    79236085330515764027303304731,
+    79244008939048815603706035061,
+    79259858533276714757314932305,
+    79291567232598584799939703904,
+    79355022692464371645785046466,
+    79482085999252804386437311141,
+    79736823300114093921829183326,
+    80248749790819932309965073892,
+    81282483887344747381513967011,
+    83390072131320151908154831281,
+    87770609709833776024991924138,
+    97234110755111693312479820773,
+    119332217159966728226237229890,
+    179736315981702064433883588727,
+    407748233172238350107850275304,
+    2098478828474011932436660412517,
+    55581415166113811149459800483533,
+    38992368544603139932233054999993551,
+)
+# ... and 1 / sqrt(1.0001)^(2^i) in Q64 for negative ticks
+ORCA_NEGATIVE_TICK_RATIOS = (
+    18445821805675392311,
+    18444899583751176498,
+    18443055278223354162,
+    18439367220385604838,
+    18431993317065449817,
+    18417254355718160513,
+    18387811781193591352,
+    18329067761203520168,
+    18212142134806087854,
+    17980523815641551639,
+    17526086738831147013,
+    16651378430235024244,
+    15030750278693429944,
+    12247334978882834399,
+    8131365268884726200,
+    3584323654723342297,
+    696457651847595233,
+    26294789957452057,
+    37481735321082,
+)
+ORCA_MIN_SQRT_PRICE = 4295048016
+ORCA_MAX_SQRT_PRICE = 79226673515401279992447579055
+
+
+def raydium_sqrt_price_at_tick(tick: int) -> int:
+    """Raydium `get_sqrt_price_at_tick`, Q64.64."""
+    abs_tick = abs(tick)
+    if abs_tick > MAX_TICK:
+        raise ValueError(f"Tick {tick} out of range")
+    ratio = RAYDIUM_TICK_RATIOS[0] if abs_tick & 1 else Q64
+    for i in range(1, len(RAYDIUM_TICK_RATIOS)):
+        if abs_tick & (1 << i):
+            ratio = (ratio * RAYDIUM_TICK_RATIOS[i]) >> 64
+    if tick > 0:
+        ratio = U128_MAX // ratio
+    return ratio
+
+
+def orca_sqrt_price_at_tick(tick: int) -> int:
+    """Orca `sqrt_price_from_tick_index`, Q64.64."""
+    if abs(tick) > MAX_TICK:
+        raise ValueError(f"Tick {tick} out of range")
+    if tick >= 0:
+        ratio = ORCA_POSITIVE_TICK_RATIOS[0] if tick & 1 else 1 << 96
+        for i in range(1, len(ORCA_POSITIVE_TICK_RATIOS)):
+            if tick & (1 << i):
+                ratio = (ratio * ORCA_POSITIVE_TICK_RATIOS[i]) >> 96
+        return ratio >> 32
+    abs_tick = -tick
+    ratio = ORCA_NEGATIVE_TICK_RATIOS[0] if abs_tick & 1 else Q64
+    for i in range(1, len(ORCA_NEGATIVE_TICK_RATIOS)):
+        if abs_tick & (1 << i):
+            ratio = (ratio * ORCA_NEGATIVE_TICK_RATIOS[i]) >> 64
+    return ratio
+
+
+def tick_at_sqrt_price(
+    sqrt_price: int, sqrt_price_at_tick: Callable[[int], int]
+) -> int:
+    """
+    Greatest tick whose sqrt price is <= `sqrt_price`.
+
+    A float log gives the tick to within one; it is then settled exactly
+    against the protocol's own tick math.
+    """
+    ratio = sqrt_price / Q64
+    tick = math.floor(2 * math.log(ratio) / LOG_1_0001) if ratio > 0 else MIN_TICK
+    tick = min(max(tick, MIN_TICK), MAX_TICK)
+    while tick > MIN_TICK and sqrt_price_at_tick(tick) > sqrt_price:
+        tick -= 1
+    while tick < MAX_TICK and sqrt_price_at_tick(tick + 1) <= sqrt_price:
+        tick += 1
+    return tick
+
+
+def _div_ceil(a: int, b: int) -> int:
+    return -(-a // b)
+
+
+def amount_a_delta(sqrt_a: int, sqrt_b: int, liquidity: int, round_up: bool) -> int:
+    """Token A (token 0) between two sqrt prices: L * (hi - lo) * 2^64 / (hi * lo)."""
+    lo, hi = min(sqrt_a, sqrt_b), max(sqrt_a, sqrt_b)
+    num, den = (liquidity * (hi - lo)) << 64, hi * lo
+    return _div_ceil(num, den) if round_up else num // den
+
+
+def amount_b_delta(sqrt_a: int, sqrt_b: int, liquidity: int, round_up: bool) -> int:
+    """Token B (token 1) between two sqrt prices: L * (hi - lo) / 2^64."""
+    product = liquidity * abs(sqrt_b - sqrt_a)
+    return _div_ceil(product, Q64) if round_up else product >> 64
+
+
+def next_sqrt_price_from_input(
+    sqrt_price: int, liquidity: int, amount: int, a_to_b: bool
+) -> int:
+    """Sqrt price after adding `amount` of the input token, rounded for the pool."""
+    if amount == 0:
+        return sqrt_price
+    if a_to_b:
+        numerator = liquidity << 64
+        return _div_ceil(numerator * sqrt_price, numerator + amount * sqrt_price)
+    return sqrt_price + (amount << 64) // liquidity
+
+
+def compute_swap_step(
+    sqrt_price: int,
+    sqrt_target: int,
+    liquidity: int,
+    amount_remaining: int,
+    fee_rate: int,
+    a_to_b: bool,
+) -> Tuple[int, int, int, int]:
+    """
+    One exact-input swap step toward `sqrt_target`.
+
+    Returns:
+        Tuple[int, int, int, int]: (next sqrt price, amount in, amount out, fee)
+    """
+    delta_in = amount_a_delta if a_to_b else amount_b_delta
+    delta_out = amount_b_delta if a_to_b else amount_a_delta
+
+    remaining_less_fee = (
+        amount_remaining * (FEE_RATE_DENOMINATOR - fee_rate) // FEE_RATE_DENOMINATOR
+    )
+    amount_in = delta_in(sqrt_price, sqrt_target, liquidity, True)
+    if remaining_less_fee >= amount_in:
+        sqrt_next = sqrt_target
+    else:
+        sqrt_next = next_sqrt_price_from_input(
+            sqrt_price, liquidity, remaining_less_fee, a_to_b
+        )
+        amount_in = delta_in(sqrt_price, sqrt_next, liquidity, True)
+    amount_out = delta_out(sqrt_price, sqrt_next, liquidity, False)
+
+    if sqrt_next != sqrt_target:
+        fee = amount_remaining - amount_in
+    else:
+        fee = _div_ceil(amount_in * fee_rate, FEE_RATE_DENOMINATOR - fee_rate)
+    return sqrt_next, amount_in, amount_out, fee
+
+
+@dataclass
+class PoolIndex:
+    """Pool state and its initialized ticks, sorted, ready for quoting."""
+
+    pool: str
+    protocol: str
+    sqrt_price: int
+    liquidity: int
+    tick_current: int
+    fee_rate: int  # per FEE_RATE_DENOMINATOR
+    ticks: List[int]
+    liquidity_net: List[int]
+    tick_sqrt_prices: List[int]
+    sqrt_price_at_tick: Callable[[int], int]
+    min_sqrt_price: int
+    max_sqrt_price: int
+
+    @classmethod
+    def build(
+        cls,
+        pool: str,
+        protocol: str,
+        sqrt_price: int,
+        liquidity: int,
+        tick_current: int,
+        fee_rate: int,
+        ticks: Iterable[Tuple[int, int]],
+    ) -> "PoolIndex":
+        """
+        Args:
+            ticks: (tick index, liquidity_net) of the pool's initialized ticks
+        """
+        if protocol == "raydium":
+            at_tick = raydium_sqrt_price_at_tick
+            bounds = (RAYDIUM_MIN_SQRT_PRICE, RAYDIUM_MAX_SQRT_PRICE)
+        else:
+            at_tick = orca_sqrt_price_at_tick
+            bounds = (ORCA_MIN_SQRT_PRICE, ORCA_MAX_SQRT_PRICE)
+        ordered = sorted(dict(ticks).items())
+        return cls(
+            pool=pool,
+            protocol=protocol,
+            sqrt_price=sqrt_price,
+            liquidity=liquidity,
+            tick_current=tick_current,
+            fee_rate=fee_rate,
+            ticks=[t for t, _ in ordered],
+            liquidity_net=[net for _, net in ordered],
+            tick_sqrt_prices=[at_tick(t) for t, _ in ordered],
+            sqrt_price_at_tick=at_tick,
+            min_sqrt_price=bounds[0],
+            max_sqrt_price=bounds[1],
+        )
+
+
+@dataclass(frozen=True)
+class Quote:
+    pool: str
+    a_to_b: bool
+    amount_in: int  # input consumed, fee included
+    amount_out: int
+    fee_amount: int
+    sqrt_price_before: int
+    sqrt_price_after: int
+    tick_after: int
+    ticks_crossed: int
+    filled: bool  # False if the pool ran out of liquidity before `amount`
+    price_impact: float  # execution price vs. spot, fee included
+
+    def as_row(self) -> Dict:
+        return {
+            "pool": self.pool,
+            "a_to_b": self.a_to_b,
+            "amount_in": str(self.amount_in),
+            "amount_out": str(self.amount_out),
+            "fee_amount": str(self.fee_amount),
+            "sqrt_price_before": str(self.sqrt_price_before),
+            "sqrt_price_after": str(self.sqrt_price_after),
+            "tick_after": self.tick_after,
+            "ticks_crossed": self.ticks_crossed,
+            "filled": self.filled,
+            "price_impact": self.price_impact,
+        }
+
+
+def quote(index: PoolIndex, a_to_b: bool, amount: int) -> Quote:
+    """Exact-input quote for swapping `amount` of token A (a_to_b) or B."""
+    sqrt_price, liquidity, tick = index.sqrt_price, index.liquidity, index.tick_current
+    limit = index.min_sqrt_price if a_to_b else index.max_sqrt_price
+    remaining, amount_out, fees, crossed = amount, 0, 0, 0
+    tick_known = True
+
+    while remaining > 0 and sqrt_price != limit:
+        i = bisect_right(index.ticks, tick)
+        if a_to_b:
+            i -= 1
+            has_tick = i >= 0
+        else:
+            has_tick = i < len(index.ticks)
+        tick_sqrt = index.tick_sqrt_prices[i] if has_tick else limit
+        target = max(tick_sqrt, limit) if a_to_b else min(tick_sqrt, limit)
+
+        sqrt_next, step_in, step_out, step_fee = compute_swap_step(
+            sqrt_price, target, liquidity, remaining, index.fee_rate, a_to_b
+        )
+        remaining -= step_in + step_fee
+        amount_out += step_out
+        fees += step_fee
+
+        if has_tick and sqrt_next == tick_sqrt:
+            net = index.liquidity_net[i]
+            if a_to_b:
+                liquidity -= net
+                tick = index.ticks[i] - 1
+            else:
+                liquidity += net
+                tick = index.ticks[i]
+            crossed += 1
+            tick_known = True
+        elif sqrt_next != sqrt_price:
+            tick_known = False
+        sqrt_price = sqrt_next
+
+    if not tick_known:
+        tick = tick_at_sqrt_price(sqrt_price, index.sqrt_price_at_tick)
+
+    amount_in = amount - remaining
+    spot = (index.sqrt_price / Q64) ** 2  # token B per token A
+    if amount_in and amount_out:
+        execution = amount_out / amount_in
+        impact = 1 - (execution / spot if a_to_b else execution * spot)
+    else:
+        impact = 0.0
+
+    return Quote(
+        pool=index.pool,
+        a_to_b=a_to_b,
+        amount_in=amount_in,
+        amount_out=amount_out,
+        fee_amount=fees,
+        sqrt_price_before=index.sqrt_price,
+        sqrt_price_after=sqrt_price,
+        tick_after=tick,
+        ticks_crossed=crossed,
+        filled=remaining == 0,
+        price_impact=impact,
+    )
+
+
+class QuoteEngine:
+    """Quotes against a set of pool indexes built from one snapshot."""
+
+    def __init__(self, pools: Iterable[PoolIndex]):
+        self.pools: Dict[str, PoolIndex] = {p.pool: p for p in pools}
+
+    def quote(self, pool: str, a_to_b: bool, amount: int) -> Quote:
+        return quote(self.pools[pool], a_to_b, int(amount))
+
+    def quote_many(self, requests: Iterable[Tuple[str, bool, int]]) -> List[Quote]:
+        """Quotes a batch of (pool, a_to_b, amount); unknown pools are skipped."""
+        quotes = []
+        for pool, a_to_b, amount in requests:
+            index = self.pools.get(pool)
+            if index is None:
+                logger.info(f"No index for pool {pool}, skipping quote")
+                continue
+            quotes.append(quote(index, a_to_b, int(amount)))
+        return quotes
+
+
+def raydium_pool_indexes(
+    pool_rows: List[Dict], tick_rows: List[Dict], fee_rates: Dict[str, int]
+) -> List[PoolIndex]:
+    """
+    Indexes for Raydium snapshot rows.
+
+    The trade fee lives on the pool's AmmConfig account, which the snapshot
+    doesn't capture, so `fee_rates` maps ammConfig address to its
+    `tradeFeeRate`; pools with an unknown config are skipped.
+    """
+    ticks_by_pool = {
+        row["pool"]: [
+            (tick["tick"], int(tick["liquidityNet"]))
+            for arr in row["tickArrays"].values()
+            for tick in arr["parsed"]["data"]["ticks"]
+            if tick["liquidityGross"] != "0"
+        ]
+        for row in tick_rows
+    }
+    indexes = []
+    for row in pool_rows:
+        address, data = row["pool"]["address"], row["pool"]["parsed"]["data"]
+        fee_rate: Optional[int] = fee_rates.get(data["ammConfig"])
+        if fee_rate is None:
+            logger.info(
+                f"No fee rate for AmmConfig {data['ammConfig']}, skipping {address}"
+            )
+            continue
+        indexes.append(
+            PoolIndex.build(
+                address,
+                "raydium",
+                int(data["sqrtPriceX64"]),
+                int(data["liquidity"]),
+                int(data["tickCurrent"]),
+                fee_rate,
+                ticks_by_pool.get(address, []),
+            )
+        )
+    return indexes
+
+
+def orca_pool_indexes(pool_rows: List[Dict], tick_rows: List[Dict]) -> List[PoolIndex]:
+    """Indexes for Orca snapshot rows."""
+    arrays_by_pool = {row["pool"]: row["tick_arrays"] for row in tick_rows}
+    indexes = []
+    for row in pool_rows:
+        pool = row["whirlpool"]
+        spacing = pool["tick_spacing"]
+        ticks = [
+            (arr["start_tick_index"] + i * spacing, int(tick["liquidity_net"]))
+            for arr in arrays_by_pool.get(pool["pubkey"], [])
+            for i, tick in enumerate(arr["ticks"])
+            if tick["initialized"]
+        ]
+        indexes.append(
+            PoolIndex.build(
+                pool["pubkey"],
+                "orca",
+                int(pool["sqrt_price"]),
+                int(pool["liquidity"]),
+                pool["tick_current_index"],
+                pool["fee_rate"],
+                ticks,
+            )
+        )
+    return indexes
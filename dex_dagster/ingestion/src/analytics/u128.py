@@ -0,0 +1,79 @@
+"""
+Vectorized wrapping u128 arithmetic on 32-bit limbs.
+
+A column of u128 values is an array of shape (..., 4) and dtype uint64, limb
+0 least significant, each limb holding 32 bits. Keeping limbs at 32 bits
+leaves headroom in uint64 for carries and for 32x32-bit partial products,
+so every operation is a handful of whole-array numpy ops with no Python loop
+over rows.
+"""
+
+from typing import Iterable, List
+
+import numpy as np
+
+LIMBS = 4
+LIMB_BITS = 32
+MASK = np.uint64(0xFFFFFFFF)
+_SHIFT = np.uint64(LIMB_BITS)
+
+
+def from_ints(values: Iterable) -> np.ndarray:
+    """Limb array from ints or decimal strings (e.g. decoded `...X64` fields)."""
+    ints = [int(v) for v in values]
+    out = np.empty((len(ints), LIMBS), dtype=np.uint64)
+    for k in range(LIMBS):
+        shift = LIMB_BITS * k
+        out[:, k] = np.fromiter(
+            ((x >> shift) & 0xFFFFFFFF for x in ints), dtype=np.uint64, count=len(ints)
+        )
+    return out
+
+
+def to_ints(limbs: np.ndarray) -> List[int]:
+    """Python ints from a (n, 4) limb array."""
+    lo = (limbs[:, 1] << _SHIFT) | limbs[:, 0]
+    hi = (limbs[:, 3] << _SHIFT) | limbs[:, 2]
+    return [(int(h) << 64) | int(l) for h, l in zip(hi.tolist(), lo.tolist())]
+
+
+def zeros(n: int) -> np.ndarray:
+    return np.zeros((n, LIMBS), dtype=np.uint64)
+
+
+def wrapping_sub(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """(a - b) mod 2**128, elementwise."""
+    out = np.empty(np.broadcast_shapes(a.shape, b.shape), dtype=np.uint64)
+    borrow = np.zeros(out.shape[:-1], dtype=np.uint64)
+    base = np.uint64(1 << LIMB_BITS)
+    for k in range(LIMBS):
+        d = a[..., k] + base - b[..., k] - borrow
+        out[..., k] = d & MASK
+        borrow = np.uint64(1) - (d >> _SHIFT)
+    return out
+
+
+def select(cond: np.ndarray, a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """Rows of `a` where `cond`, else rows of `b`."""
+    return np.where(cond[..., None], a, b)
+
+
+def mul_shr64_low64(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """
+    Bits 64..127 of the full a * b product, as uint64.
+
+    This is `(liquidity * growth_delta) >> 64` truncated to u64, which is how
+    both Raydium and Orca turn a Q64.64 growth delta into token amounts. Only
+    the product columns up to 3 are needed; higher columns can't carry down.
+    """
+    cols = [np.zeros(a.shape[:-1], dtype=np.uint64) for _ in range(LIMBS)]
+    for i in range(LIMBS):
+        for j in range(LIMBS - i):
+            p = a[..., i] * b[..., j]
+            cols[i + j] += p & MASK
+            if i + j + 1 < LIMBS:
+                cols[i + j + 1] += p >> _SHIFT
+    for k in range(LIMBS - 1):
+        cols[k + 1] += cols[k] >> _SHIFT
+        cols[k] &= MASK
+    return ((cols[3] & MASK) << _SHIFT) | cols[2]
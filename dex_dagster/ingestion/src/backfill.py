@@ -0,0 +1,344 @@
+"""
+Re-process historical snapshot objects from S3.
+
+Lists the snapshot objects of a protocol within a time range (in the
+partitioned `protocol=/kind=/date=/hour=/token=` layout, pruned to the days
+in range, and in the older flat `<kind>/{token}_{ts}_*.json` one),
+stream-parses each one (rows are read one at a time with ijson, so a large
+tick file is never loaded whole), passes every row through the transcoder
+for its (protocol, kind) and loads the result, either straight into the dbt
+landing tables over ClickHouse HTTP or back to S3 as a new object, in the
+partitioned layout whatever the source's, that the S3Queue ingestion picks
+up. Objects are spread over a process pool and every finished object is
+appended to a progress file, so an interrupted backfill resumes where it
+stopped.
+
+    python -m dex_dagster.ingestion.src.backfill raydium \\
+        --start 2025-06-01 --end 2025-07-01 --target clickhouse --workers 8
+
+When the raw schema changes, add a function to TRANSCODERS that rewrites an
+old row into the current shape.
+"""
+
+import argparse
+import json
+import logging
+import multiprocessing
+import os
+import re
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Callable, Dict, Iterator, List, Optional, Set, Tuple
+
+import ijson
+
+from dex_dagster.ingestion.src.common.archive import LANDING_TABLES
+from dex_dagster.ingestion.src.common.constants import (
+    ORCA_STORAGE_KEY,
+    RAYDIUM_STORAGE_KEY,
+)
+from dex_dagster.ingestion.src.common.utility import (
+    get_s3_bucket,
+    get_s3_client,
+    insert_json_rows,
+    snapshot_key,
+)
+
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s | %(levelname)-8s | %(name)s | %(message)s",
+    datefmt="%Y-%m-%d %H:%M:%S",
+)
+logger = logging.getLogger("dex")
+
+STORAGE_KEYS = {"raydium": RAYDIUM_STORAGE_KEY, "orca": ORCA_STORAGE_KEY}
+SNAPSHOT_KINDS = {
+    "raydium": ["pool", "tick", "protocol_position", "personal_position"],
+    "orca": ["pool", "tick", "position"],
+}
+KEY_TIMESTAMP = re.compile(r"(?:^|_)(\d{4}-\d{2}-\d{2}_\d{2}-\d{2}-\d{2})_.*\.json$")
+KEY_TIMESTAMP_FORMAT = "%Y-%m-%d_%H-%M-%S"
+BACKFILL_PREFIX = "backfill_"
+
+
+def _stamp(row: dict, object_time: datetime) -> dict:
+    """Early snapshots predate `extraction_timestamp`; use the object's time."""
+    row.setdefault("extraction_timestamp", str(object_time))
+    return row
+
+
+# (protocol, kind) -> row rewriter into the current output format
+TRANSCODERS: Dict[Tuple[str, str], Callable[[dict, datetime], dict]] = {}
+
+
+def transcode(protocol: str, kind: str, row: dict, object_time: datetime) -> dict:
+    return TRANSCODERS.get((protocol, kind), _stamp)(row, object_time)
+
+
+@dataclass(frozen=True)
+class BackfillObject:
+    """One snapshot object to re-process, and where its rows go."""
+
+    protocol: str
+    kind: str
+    key: str
+    object_time: datetime
+    bucket: str
+    target: str
+    clickhouse_url: Optional[str] = None
+    clickhouse_database: str = "default"
+    clickhouse_auth: Optional[Tuple[str, str]] = None
+
+
+def list_objects(
+    bucket: str,
+    protocol: str,
+    start: datetime,
+    end: datetime,
+    kinds: Optional[List[str]] = None,
+    token: Optional[str] = None,
+) -> Iterator[Tuple[str, str, datetime]]:
+    """
+    (kind, key, object time) of every snapshot object in [start, end].
+
+    Objects written by an earlier backfill are skipped, so re-running over the
+    same range never transcodes its own output.
+    """
+    paginator = get_s3_client().get_paginator("list_objects_v2")
+    for kind in kinds or SNAPSHOT_KINDS[protocol]:
+        for prefix in _prefixes(protocol, kind, start, end, token):
+            for page in paginator.paginate(Bucket=bucket, Prefix=prefix):
+                for obj in page.get("Contents", []):
+                    yield from _in_range(kind, obj["Key"], start, end, token)
+
+
+def _prefixes(
+    protocol: str, kind: str, start: datetime, end: datetime, token: Optional[str]
+) -> Iterator[str]:
+    storage_key = STORAGE_KEYS[protocol]
+    # flat layout, from before partitioning
+    yield f"{storage_key}/{kind}/" + (f"{token}_" if token else "")
+    day = start.date()
+    while day <= end.date():
+        yield f"{storage_key}/protocol={protocol}/kind={kind}/date={day:%Y-%m-%d}/"
+        day += timedelta(days=1)
+
+
+def _in_range(
+    kind: str, key: str, start: datetime, end: datetime, token: Optional[str]
+) -> Iterator[Tuple[str, str, datetime]]:
+    name = key.rsplit("/", 1)[-1]
+    match = KEY_TIMESTAMP.search(name)
+    if match is None or name.startswith(BACKFILL_PREFIX):
+        return
+    if token is not None and "/token=" in key and f"/token={token}/" not in key:
+        return
+    object_time = datetime.strptime(match.group(1), KEY_TIMESTAMP_FORMAT)
+    if start <= object_time <= end:
+        yield kind, key, object_time
+
+
+def object_token(key: str) -> str:
+    """Token mint of a snapshot object, from either key layout."""
+    partition = re.search(r"/token=([^/]+)/", key)
+    if partition:
+        return partition.group(1)
+    name = key.rsplit("/", 1)[-1]
+    match = KEY_TIMESTAMP.search(name)
+    return (name[: match.start()] if match else "") or "unknown"
+
+
+def stream_rows(bucket: str, key: str, backend=ijson) -> Iterator[dict]:
+    """Rows of a JSON-array object, parsed incrementally from the response body."""
+    body = get_s3_client().get_object(Bucket=bucket, Key=key)["Body"]
+    try:
+        yield from backend.items(body, "item", use_float=True)
+    finally:
+        body.close()
+
+
+def process_object(task: BackfillObject) -> int:
+    """Transcodes and loads one object, returning the number of rows written."""
+    try:
+        return _process_object(task, ijson)
+    except ijson.IncompleteJSONError as exc:
+        # the C parser rejects integers beyond 64 bits (raw u128 values);
+        # redo the object with the pure-Python one, which handles them
+        if "integer overflow" not in str(exc):
+            raise
+        logger.info(f"{task.key}: integers beyond 64 bits, using the Python parser")
+        return _process_object(task, ijson.get_backend("python"))
+
+
+def _process_object(task: BackfillObject, backend) -> int:
+    count = 0
+    extraction_timestamp = str(task.object_time)
+
+    def encoded() -> Iterator[str]:
+        nonlocal count, extraction_timestamp
+        for row in stream_rows(task.bucket, task.key, backend):
+            row = transcode(task.protocol, task.kind, row, task.object_time)
+            if not count:
+                extraction_timestamp = str(row["extraction_timestamp"])
+            count += 1
+            yield json.dumps(row, separators=(",", ":"), default=str)
+
+    if task.target == "clickhouse":
+        landing = LANDING_TABLES[(task.protocol, task.kind)]
+        table = f"{task.clickhouse_database}.{landing}"
+        insert_json_rows(task.clickhouse_url, table, encoded(), task.clickhouse_auth)
+        return count
+
+    # spooled to disk rather than memory: tick objects can be very large
+    with tempfile.TemporaryFile() as out:
+        out.write(b"[")
+        for i, row in enumerate(encoded()):
+            out.write(b",\n" if i else b"\n")
+            out.write(row.encode())
+        out.write(b"\n]")
+        out.seek(0)
+        # written in the partitioned layout whatever the source layout, so the
+        # S3Queue glob (protocol=/kind=/...) picks up backfilled flat objects too
+        key = snapshot_key(
+            STORAGE_KEYS[task.protocol],
+            task.protocol,
+            task.kind,
+            object_token(task.key),
+            extraction_timestamp,
+        )
+        directory, name = key.rsplit("/", 1)
+        get_s3_client().upload_fileobj(
+            out,
+            task.bucket,
+            f"{directory}/{BACKFILL_PREFIX}{name}",
+            ExtraArgs={"ContentType": "application/json"},
+        )
+    return count
+
+
+class BackfillProgress:
+    """Append-only file of finished object keys."""
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.done: Set[str] = set()
+        if self.path.exists():
+            self.done = set(self.path.read_text().split())
+        self._file = open(self.path, "a")
+
+    def mark(self, key: str) -> None:
+        self.done.add(key)
+        self._file.write(f"{key}\n")
+        self._file.flush()
+
+    def close(self) -> None:
+        self._file.close()
+
+
+def run_backfill(
+    tasks: List[BackfillObject], progress: BackfillProgress, workers: int
+) -> Tuple[int, int, List[str]]:
+    """
+    Runs every task not yet in `progress` over a process pool.
+
+    Returns (objects done, rows written, keys that failed). Failed objects are
+    not marked, so the next run retries them.
+    """
+    pending = [t for t in tasks if t.key not in progress.done]
+    logger.info(
+        f"{len(tasks)} objects in range, {len(tasks) - len(pending)} already done, "
+        f"{len(pending)} to process with {workers} workers"
+    )
+    done, rows, failed = 0, 0, []
+    started = time.monotonic()
+    # spawn: workers build their own boto3 clients instead of inheriting ours
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context) as pool:
+        futures = {pool.submit(process_object, task): task for task in pending}
+        for future in as_completed(futures):
+            task = futures[future]
+            try:
+                rows += future.result()
+            except Exception as exc:
+                logger.error(f"Failed {task.key}: {exc}")
+                failed.append(task.key)
+                continue
+            progress.mark(task.key)
+            done += 1
+            elapsed = time.monotonic() - started
+            remaining = (len(pending) - done - len(failed)) * elapsed / done
+            logger.info(
+                f"[{done}/{len(pending)}] {task.key} "
+                f"({rows / elapsed:,.0f} rows/s, ~{remaining:.0f}s left)"
+            )
+    return done, rows, failed
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("protocol", choices=sorted(SNAPSHOT_KINDS))
+    parser.add_argument("--start", type=datetime.fromisoformat, required=True)
+    parser.add_argument("--end", type=datetime.fromisoformat, required=True)
+    parser.add_argument("--kinds", nargs="+", help="default: every data kind")
+    parser.add_argument("--token", help="only objects for this token mint")
+    parser.add_argument("--target", choices=["clickhouse", "s3"], default="s3")
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument(
+        "--progress",
+        type=Path,
+        help="progress file (default: derived from protocol, target and range)",
+    )
+    parser.add_argument(
+        "--clickhouse-url",
+        default=os.getenv("CLICKHOUSE_URL", "http://localhost:8123"),
+    )
+    parser.add_argument("--clickhouse-database", default="default")
+    args = parser.parse_args(argv)
+
+    bucket = get_s3_bucket()
+    user = os.getenv("CLICKHOUSE_USER")
+    auth = (user, os.getenv("CLICKHOUSE_PASSWORD", "")) if user else None
+    tasks = [
+        BackfillObject(
+            protocol=args.protocol,
+            kind=kind,
+            key=key,
+            object_time=object_time,
+            bucket=bucket,
+            target=args.target,
+            clickhouse_url=args.clickhouse_url,
+            clickhouse_database=args.clickhouse_database,
+            clickhouse_auth=auth,
+        )
+        for kind, key, object_time in list_objects(
+            bucket, args.protocol, args.start, args.end, args.kinds, args.token
+        )
+    ]
+
+    progress_path = args.progress or Path(tempfile.gettempdir()) / (
+        f"backfill_{args.protocol}_{args.target}"
+        f"_{args.start:%Y%m%dT%H%M%S}_{args.end:%Y%m%dT%H%M%S}.done"
+    )
+    progress = BackfillProgress(progress_path)
+    try:
+        done, rows, failed = run_backfill(tasks, progress, args.workers)
+    finally:
+        progress.close()
+
+    logger.info(f"Backfilled {done} objects ({rows} rows); progress in {progress_path}")
+    if failed:
+        logger.error(f"{len(failed)} objects failed; re-run to retry them")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
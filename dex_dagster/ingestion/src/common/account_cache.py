@@ -0,0 +1,134 @@
+import json
+import logging
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from collections import Counter
+from dataclasses import dataclass
+from functools import lru_cache
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+logger = logging.getLogger("dex")
+
+ACCOUNT_CACHE_PATH = Path(
+    os.getenv(
+        "ACCOUNT_CACHE_PATH", Path(tempfile.gettempdir()) / "dex_account_cache.sqlite"
+    )
+)
+
+
+@dataclass(frozen=True)
+class CacheTTL:
+    """How long an entry stays valid, in seconds (None = forever)."""
+
+    seconds: Optional[float] = None
+
+
+# per entry kind; anything not listed here is never cached
+ACCOUNT_TTLS: Dict[str, CacheTTL] = {
+    # a mint's decimals are fixed at creation
+    "mint_decimals": CacheTTL(),
+    # known pools per token; the registry decides when to rescan (pool_registry)
+    "pool_registry": CacheTTL(),
+}
+
+
+class AccountCache:
+    """
+    Local cache for data that rarely or never changes between runs.
+
+    Entries are JSON values keyed by (kind, key) in a local sqlite file,
+    stamped with the wall time they were written at and expired per kind by
+    its `CacheTTL`. Hits and misses are counted per kind so runs can report
+    hit rates.
+
+    The file only outlives a run where runs share a machine (local
+    development, a long-lived worker); on Dagster Cloud every run starts
+    with an empty one. State that must reach the next run is kept in the
+    snapshot bucket instead (`read_state`), as the pool registry and the
+    pool schedule are; what is left here is cheap to rebuild.
+    """
+
+    def __init__(self, path: Path = ACCOUNT_CACHE_PATH, ttls=ACCOUNT_TTLS):
+        self.path = Path(path)
+        self.ttls = ttls
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.execute("pragma journal_mode=wal")
+        self._conn.execute(
+            "create table if not exists accounts ("
+            " kind text not null, key text not null, value text not null,"
+            " fetched_at real not null,"
+            " primary key (kind, key))"
+        )
+        self._conn.commit()
+        self._lock = threading.Lock()
+        self.hits: Counter = Counter()
+        self.misses: Counter = Counter()
+
+    def _fresh(self, kind: str, fetched_at: float) -> bool:
+        ttl = self.ttls[kind]
+        return ttl.seconds is None or time.time() - fetched_at <= ttl.seconds
+
+    def get(self, kind: str, key: str) -> Any:
+        """
+        Cached value, or None if missing or expired.
+
+        Args:
+            kind (str): Entry kind, one of `ttls`
+            key (str): Entry key, e.g. an address
+        """
+        with self._lock:
+            row = self._conn.execute(
+                "select value, fetched_at from accounts where kind = ? and key = ?",
+                (kind, key),
+            ).fetchone()
+        if row is None or not self._fresh(kind, row[1]):
+            self.misses[kind] += 1
+            return None
+        self.hits[kind] += 1
+        return json.loads(row[0])
+
+    def put(self, kind: str, key: str, value: Any) -> None:
+        if kind not in self.ttls:
+            raise KeyError(f"No TTL configured for cache kind {kind!r}")
+        with self._lock:
+            # columns named: files from before may still have a slot column
+            self._conn.execute(
+                "insert or replace into accounts (kind, key, value, fetched_at)"
+                " values (?, ?, ?, ?)",
+                (kind, key, json.dumps(value), time.time()),
+            )
+            self._conn.commit()
+
+    def stats(self) -> Dict[str, Counter]:
+        """Copy of the hit/miss counters, to diff against later."""
+        return {"hits": Counter(self.hits), "misses": Counter(self.misses)}
+
+    def hit_rates(self, since: Optional[Dict[str, Counter]] = None) -> Dict[str, Dict]:
+        """
+        Hits, misses and hit rate per kind, optionally since a `stats()` copy.
+        """
+        hits, misses = Counter(self.hits), Counter(self.misses)
+        if since is not None:
+            hits.subtract(since["hits"])
+            misses.subtract(since["misses"])
+        rates = {}
+        for kind in sorted(set(hits) | set(misses)):
+            total = hits[kind] + misses[kind]
+            if total:
+                rates[kind] = {
+                    "hits": hits[kind],
+                    "misses": misses[kind],
+                    "hit_rate": round(hits[kind] / total, 4),
+                }
+        return rates
+
+
+@lru_cache(maxsize=None)
+def get_account_cache() -> AccountCache:
+    """Process-wide cache at `ACCOUNT_CACHE_PATH`."""
+    return AccountCache()
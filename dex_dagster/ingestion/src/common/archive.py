@@ -0,0 +1,243 @@
+"""
+Local Arrow IPC archive of every snapshot, for replay and backfill.
+
+Each run is appended as one Feather (Arrow IPC) segment under
+
+    <SNAPSHOT_ARCHIVE_DIR>/protocol=<protocol>/hour=<YYYY-MM-DDTHH>/<token>_<ts>.arrow
+
+holding one row per snapshot row: `extraction_timestamp`, `token`, `kind`
+(pool, tick, position, ..., snapshot_index) and `row`, the compact JSON of
+exactly what was uploaded to S3. A sharded run (see `common.sharding`) is
+archived as one segment per shard, `<token>_<ts>.<part>.arrow`, plus one for
+its snapshot index row. Segments are uncompressed so they can be
+memory-mapped and filtered on the scalar columns without copying or parsing
+the payloads; only the rows that survive the filter are decoded.
+"""
+
+import logging
+import os
+import tempfile
+from collections import defaultdict
+from datetime import datetime
+from itertools import groupby
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+import pyarrow as pa
+import pyarrow.compute as pc
+
+from dex_dagster.ingestion.src.common.rows import decode_json, encode_json
+from dex_dagster.ingestion.src.common.utility import insert_json_rows
+
+logger = logging.getLogger("dex")
+
+SNAPSHOT_ARCHIVE_DIR = Path(
+    os.getenv(
+        "SNAPSHOT_ARCHIVE_DIR", Path(tempfile.gettempdir()) / "dex_snapshot_archive"
+    )
+)
+HOUR_FORMAT = "%Y-%m-%dT%H"
+
+SCHEMA = pa.schema(
+    [
+        ("extraction_timestamp", pa.timestamp("us")),
+        ("token", pa.string()),
+        ("kind", pa.string()),
+        ("row", pa.large_string()),
+    ]
+)
+
+# (protocol, kind) -> dbt `raw` landing table; mirrors raw_landing_tables()
+LANDING_TABLES: Dict[Tuple[str, str], str] = {
+    ("raydium", "pool"): "raydium_pools_raw",
+    ("raydium", "tick"): "raydium_ticks_raw",
+    ("raydium", "protocol_position"): "raydium_pools_positions_raw",
+    ("raydium", "personal_position"): "raydium_personal_position_raw",
+    ("raydium", "snapshot_index"): "snapshot_index_raw",
+    ("orca", "pool"): "orca_pools_raw",
+    ("orca", "tick"): "orca_ticks_raw",
+    ("orca", "position"): "orca_positions_raw",
+    ("orca", "snapshot_index"): "snapshot_index_raw",
+}
+
+
+def archive_snapshot(
+    protocol: str,
+    token: str,
+    extraction_timestamp: str,
+    outputs: Dict[str, List[dict]],
+    root: Path = SNAPSHOT_ARCHIVE_DIR,
+    part: Optional[str] = None,
+) -> Path:
+    """
+    Appends one run to the archive as a new segment and returns its path.
+
+    Args:
+        protocol (str): Protocol name, e.g. "raydium" or "orca"
+        token (str): Token mint the snapshot was taken for
+        extraction_timestamp (str): Timestamp shared by every row of the run
+        outputs (dict): Rows per snapshot kind, as uploaded to S3
+        root (Path): Archive root directory
+        part (Optional[str]): The part of a sharded run these rows are, e.g.
+            "part-0-of-4"
+    """
+    ts = datetime.fromisoformat(extraction_timestamp)
+    kinds, rows = [], []
+    for kind, kind_rows in outputs.items():
+        for row in kind_rows:
+            kinds.append(kind)
+            rows.append(encode_json(row, indent=0).decode())
+
+    table = pa.table(
+        {
+            "extraction_timestamp": pa.array([ts] * len(rows), pa.timestamp("us")),
+            "token": pa.array([token] * len(rows), pa.string()),
+            "kind": pa.array(kinds, pa.string()),
+            "row": pa.array(rows, pa.large_string()),
+        },
+        schema=SCHEMA,
+    )
+
+    partition = Path(root) / f"protocol={protocol}" / f"hour={ts:{HOUR_FORMAT}}"
+    partition.mkdir(parents=True, exist_ok=True)
+    suffix = f".{part}" if part else ""
+    path = partition / f"{token}_{ts:%Y%m%dT%H%M%S%f}{suffix}.arrow"
+    tmp = path.with_suffix(".arrow.tmp")
+    with pa.OSFile(str(tmp), "wb") as sink:
+        with pa.ipc.new_file(sink, SCHEMA) as writer:
+            writer.write_table(table)
+    os.replace(tmp, path)  # readers never see a half-written segment
+    logger.info(f"Archived {len(rows)} {protocol} rows to {path}")
+    return path
+
+
+class SnapshotArchive:
+    """
+    Reader over an archive root.
+
+    `tables` yields memory-mapped Arrow tables filtered to a time range, which
+    is what bulk consumers want; `snapshots` regroups them into the per-run
+    `{kind: rows}` dicts the analytics engines take, and `load_clickhouse`
+    streams the raw JSON rows into the dbt landing tables.
+    """
+
+    def __init__(self, root: Path = SNAPSHOT_ARCHIVE_DIR):
+        self.root = Path(root)
+
+    def segments(
+        self, protocol: str, start: datetime, end: datetime
+    ) -> Iterator[Path]:
+        """Segment files whose hour partition overlaps [start, end]."""
+        base = self.root / f"protocol={protocol}"
+        if not base.exists():
+            return
+        first, last = f"hour={start:{HOUR_FORMAT}}", f"hour={end:{HOUR_FORMAT}}"
+        for partition in sorted(base.iterdir()):
+            if first <= partition.name <= last:
+                yield from sorted(partition.glob("*.arrow"))
+
+    def tables(
+        self,
+        protocol: str,
+        start: datetime,
+        end: datetime,
+        kinds: Optional[Iterable[str]] = None,
+        token: Optional[str] = None,
+    ) -> Iterator[pa.Table]:
+        """
+        One table per segment, restricted to `start <= extraction_timestamp <= end`.
+
+        Args:
+            protocol (str): Protocol name
+            start (datetime): Inclusive lower bound
+            end (datetime): Inclusive upper bound
+            kinds (Optional[Iterable[str]]): Only these snapshot kinds
+            token (Optional[str]): Only this token mint
+        """
+        kinds = list(kinds) if kinds is not None else None
+        for path in self.segments(protocol, start, end):
+            with pa.memory_map(str(path), "r") as source:
+                table = pa.ipc.open_file(source).read_all()
+            ts = table["extraction_timestamp"]
+            mask = pc.and_(
+                pc.greater_equal(ts, pa.scalar(start, pa.timestamp("us"))),
+                pc.less_equal(ts, pa.scalar(end, pa.timestamp("us"))),
+            )
+            if kinds is not None:
+                mask = pc.and_(mask, pc.is_in(table["kind"], pa.array(kinds)))
+            if token is not None:
+                mask = pc.and_(mask, pc.equal(table["token"], token))
+            table = table.filter(mask)
+            if table.num_rows:
+                yield table
+
+    def rows(
+        self, protocol: str, start: datetime, end: datetime, **filters
+    ) -> Iterator[Tuple[str, dict]]:
+        """(kind, row) pairs in archive order, decoded from JSON."""
+        for table in self.tables(protocol, start, end, **filters):
+            for kind, row in zip(table["kind"].to_pylist(), table["row"].to_pylist()):
+                yield kind, decode_json(row)
+
+    def snapshots(
+        self, protocol: str, start: datetime, end: datetime, **filters
+    ) -> Iterator[Dict[str, List[dict]]]:
+        """
+        One `{kind: rows}` dict per archived run, oldest first.
+
+        A run is a single segment, or consecutive ones for a sharded run, so
+        this holds at most one run in memory, e.g. to feed
+        `raydium_earnings(out["pool"], out["tick"], ...)`.
+        """
+
+        def run_of(table: pa.Table) -> tuple:
+            return table["token"][0].as_py(), table["extraction_timestamp"][0].as_py()
+
+        tables = self.tables(protocol, start, end, **filters)
+        for _, parts in groupby(tables, key=run_of):
+            run: Dict[str, List[dict]] = defaultdict(list)
+            for table in parts:
+                kinds, rows = table["kind"].to_pylist(), table["row"].to_pylist()
+                for kind, row in zip(kinds, rows):
+                    run[kind].append(decode_json(row))
+            yield dict(run)
+
+    def load_clickhouse(
+        self,
+        protocol: str,
+        start: datetime,
+        end: datetime,
+        url: str,
+        database: str = "default",
+        auth: Optional[Tuple[str, str]] = None,
+        **filters,
+    ) -> Dict[str, int]:
+        """
+        Inserts the archived rows into the dbt landing tables over HTTP.
+
+        Rows go in as the JSON that was originally uploaded, so this bypasses
+        S3 entirely and lands exactly what S3Queue would have. The landing
+        tables are ReplacingMergeTree keyed by hour, so replaying a range that
+        is already loaded does not duplicate it.
+
+        Args:
+            protocol (str): Protocol name
+            start (datetime): Inclusive lower bound
+            end (datetime): Inclusive upper bound
+            url (str): ClickHouse HTTP endpoint, e.g. http://localhost:8123
+            database (str): Database holding the `raw` source tables
+            auth (Optional[Tuple[str, str]]): ClickHouse user and password
+        """
+        loaded: Dict[str, int] = defaultdict(int)
+        for table in self.tables(protocol, start, end, **filters):
+            batches: Dict[str, List[str]] = defaultdict(list)
+            for kind, row in zip(table["kind"].to_pylist(), table["row"].to_pylist()):
+                batches[kind].append(row)
+            for kind, rows in batches.items():
+                target = LANDING_TABLES.get((protocol, kind))
+                if target is None:
+                    continue
+                insert_json_rows(url, f"{database}.{target}", rows, auth)
+                loaded[target] += len(rows)
+        logger.info(f"Loaded {dict(loaded)} from the {protocol} archive")
+        return dict(loaded)
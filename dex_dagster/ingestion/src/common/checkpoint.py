@@ -0,0 +1,231 @@
+import json
+import logging
+import os
+import shutil
+import tempfile
+import uuid
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional
+
+import msgspec
+
+from dex_dagster.ingestion.src.common.rows import decode_json, encode_json
+from dex_dagster.ingestion.src.common.utility import (
+    delete_state_prefix,
+    download_state_file,
+    read_state,
+    shared_state_enabled,
+    upload_state_file,
+    write_state,
+)
+
+logger = logging.getLogger("dex")
+
+SPOOL_DIR = Path(
+    os.getenv("SNAPSHOT_SPOOL_DIR", Path(tempfile.gettempdir()) / "dex_spool")
+)
+# the bucket copy of a spool's manifest is rewritten every this many finished
+# pools; a run that dies refetches at most this many pools on resume
+SPOOL_SYNC_EVERY = int(os.getenv("SNAPSHOT_SPOOL_SYNC_EVERY", 25))
+
+# a pool file with its rows left encoded, see `RunSpool.rows`
+_RAW_POOL = msgspec.json.Decoder(Dict[str, List[msgspec.Raw]])
+
+
+def _write_json_atomic(path: Path, data) -> None:
+    """Writes JSON via a temp file + rename so a crash never leaves half a file."""
+    tmp = path.with_suffix(path.suffix + ".tmp")
+    with open(tmp, "wb") as f:
+        f.write(encode_json(data, indent=0))
+    os.replace(tmp, path)
+
+
+class RunSpool:
+    """
+    Spool of per-pool results for one snapshot run.
+
+    Each finished pool is written to its own file and recorded in the run
+    manifest, so a run that dies part way can be resumed with the same run id:
+    finished pools are skipped and only the remaining ones are fetched. Once
+    every pool is done the outputs are read back from the spool kind by kind
+    (`outputs`), so the whole snapshot is never held in memory.
+
+    Layout: `<SPOOL_DIR>/<protocol>/<token>/<run_id>/{manifest.json,pools/*.json}`
+
+    A retry or re-execution on Dagster Cloud runs in a fresh container, so
+    with a bucket configured the spool is mirrored to the bucket's state
+    prefix too (`spool/<protocol>/<token>/<run_id>`, see `read_state`) and a
+    spool missing locally is restored from there. The pool files are
+    uploaded as they finish, the manifest every `SPOOL_SYNC_EVERY` pools.
+    """
+
+    def __init__(
+        self,
+        protocol: str,
+        token: str,
+        run_id: Optional[str] = None,
+        root: Optional[Path] = None,
+    ):
+        self.run_id = run_id or uuid.uuid4().hex
+        self.path = Path(root or SPOOL_DIR) / protocol / token / self.run_id
+        self.pools_path = self.path / "pools"
+        self.manifest_path = self.path / "manifest.json"
+        self.pools_path.mkdir(parents=True, exist_ok=True)
+        self.state_name = f"spool/{protocol}/{token}/{self.run_id}"
+        self._unsynced = 0
+
+        if self.manifest_path.exists():
+            with open(self.manifest_path) as f:
+                self.manifest = json.load(f)
+        else:
+            self.manifest = self._restore()
+        if self.manifest is not None:
+            logger.info(
+                f"Resuming run {self.run_id}: "
+                f"{len(self.manifest['completed'])} pools already done"
+            )
+        else:
+            self.manifest = {
+                "protocol": protocol,
+                "token": token,
+                "run_id": self.run_id,
+                "extraction_timestamp": None,
+                "start_slot": None,
+                "pools": None,
+                "completed": [],
+            }
+        self._done = set(self.manifest["completed"])
+
+    def start(self, extraction_timestamp: str) -> str:
+        """
+        Records the run's extraction timestamp and returns the one to use.
+
+        A resumed run keeps the timestamp of the original attempt so every
+        row of the snapshot shares it.
+        """
+        if self.manifest["extraction_timestamp"] is None:
+            self.manifest["extraction_timestamp"] = extraction_timestamp
+            self._save_manifest()
+        return self.manifest["extraction_timestamp"]
+
+    def start_slot(self, slot: int) -> int:
+        """Like `start`, for the slot the run began at (the manifest's slot range)."""
+        if self.manifest.get("start_slot") is None:
+            self.manifest["start_slot"] = slot
+            self._save_manifest()
+        return self.manifest["start_slot"]
+
+    def pools(self) -> Optional[List[str]]:
+        """Pool list recorded by an earlier attempt, if any."""
+        return self.manifest["pools"]
+
+    def set_pools(self, pools: List[str]) -> None:
+        """Records the discovered pool list so a resume doesn't rescan for it."""
+        self.manifest["pools"] = list(pools)
+        self._save_manifest()
+
+    def is_done(self, pool: str) -> bool:
+        return pool in self._done
+
+    def pending(self, pools: List[str]) -> List[str]:
+        return [p for p in pools if not self.is_done(p)]
+
+    def completed(self) -> List[str]:
+        """Pools finished so far, in the order they finished."""
+        return list(self.manifest["completed"])
+
+    def write_pool(self, pool: str, rows: Dict[str, list]) -> None:
+        """
+        Checkpoints one finished pool.
+
+        Args:
+            pool (str): Pool address
+            rows (Dict[str, list]): Rows produced for the pool, per snapshot kind
+        """
+        self.write_pool_encoded(pool, encode_json(rows, indent=0))
+
+    def write_pool_encoded(self, pool: str, body: bytes) -> None:
+        """`write_pool` for rows that are already JSON-encoded."""
+        path = self.pools_path / f"{pool}.json"
+        tmp = path.with_suffix(".json.tmp")
+        with open(tmp, "wb") as f:
+            f.write(body)
+        os.replace(tmp, path)
+        if shared_state_enabled():
+            try:
+                upload_state_file(f"{self.state_name}/pools/{pool}.json", path)
+            except Exception as exc:
+                # the pool is refetched if the run has to be resumed elsewhere
+                logger.warning(f"Failed to mirror spooled pool {pool}: {exc}")
+        self.manifest["completed"].append(pool)
+        self._done.add(pool)
+        self._save_manifest(sync=False)
+
+    def rows(self, kind: str, raw: bool = False) -> Iterator[Any]:
+        """
+        Spooled rows of one kind, completed pool by completed pool, so only
+        one pool's file is in memory at a time.
+
+        With `raw` the rows are left encoded (`msgspec.Raw`), to be written
+        out again as they are instead of decoded and re-encoded.
+        """
+        decode = _RAW_POOL.decode if raw else decode_json
+        for pool in self.manifest["completed"]:
+            with open(self.pools_path / f"{pool}.json", "rb") as f:
+                rows = decode(f.read())
+            yield from rows.get(kind, [])
+
+    def outputs(self, kinds: List[str], raw: bool = False) -> Dict[str, "SpooledRows"]:
+        """The spooled rows per kind, read from the spool whenever iterated."""
+        return {kind: SpooledRows(self, kind, raw) for kind in kinds}
+
+    def cleanup(self) -> None:
+        """Removes the spool, and its bucket copy, once the outputs are uploaded."""
+        shutil.rmtree(self.path, ignore_errors=True)
+        try:
+            delete_state_prefix(self.state_name)
+        except Exception as exc:
+            logger.warning(f"Failed to remove the bucket copy of {self.run_id}: {exc}")
+
+    def _save_manifest(self, sync: bool = True) -> None:
+        _write_json_atomic(self.manifest_path, self.manifest)
+        self._unsynced += 1
+        if not shared_state_enabled() or not (
+            sync or self._unsynced >= SPOOL_SYNC_EVERY
+        ):
+            return
+        try:
+            write_state(f"{self.state_name}/manifest", self.manifest)
+            self._unsynced = 0
+        except Exception as exc:
+            logger.warning(f"Failed to mirror the spool of {self.run_id}: {exc}")
+
+    def _restore(self) -> Optional[dict]:
+        """
+        The manifest of the spool's bucket copy, with its pool files
+        downloaded into the local spool; None if there is no copy.
+        """
+        manifest = read_state(f"{self.state_name}/manifest")
+        if manifest is None:
+            return None
+        completed = []
+        for pool in manifest["completed"]:
+            name = f"{self.state_name}/pools/{pool}.json"
+            if download_state_file(name, self.pools_path / f"{pool}.json"):
+                completed.append(pool)
+        # a pool whose file never made it to the bucket is fetched again
+        manifest["completed"] = completed
+        _write_json_atomic(self.manifest_path, manifest)
+        return manifest
+
+
+class SpooledRows:
+    """Re-iterable rows of one kind in a spool; see `RunSpool.rows`."""
+
+    def __init__(self, spool: RunSpool, kind: str, raw: bool = False):
+        self.spool = spool
+        self.kind = kind
+        self.raw = raw
+
+    def __iter__(self) -> Iterator[Any]:
+        return self.spool.rows(self.kind, self.raw)
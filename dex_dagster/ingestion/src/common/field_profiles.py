@@ -0,0 +1,93 @@
+"""
+Which fields of each account type snapshot rows carry.
+
+A field profile lists, per account type, the fields that are left out of the
+rows. It is read by every row builder (the `rows` structs, the Raydium
+decoder's `decode_*` formatters and `serializers`), which skip a dropped
+field before converting it, so it is never stringified, stored or uploaded.
+Names are the output names, as they appear in the JSON (camelCase for
+Raydium, snake_case for Orca). Account types:
+
+- Raydium: "PoolState", "TickState" (each tick of a TickArrayState),
+  "PersonalPositionState", "ProtocolPositionState"
+- Orca: "Whirlpool", "Tick" (each tick of a TickArray), "Position"
+
+Profiles:
+
+- "full": every field, as the programs define them.
+- "default": what the dbt models and `analytics` read. Drops the Raydium
+  pool padding.
+- "lean": also drops rewards (pool reward infos, tick and position reward
+  growths), Raydium fund fees and Orca bump and seed. The metadata models
+  then have empty reward and fund-fee columns, and `analytics.fees` can't
+  compute earnings from the snapshots.
+
+The profile is set once per process with `SNAPSHOT_FIELD_PROFILE`; the
+landing tables take the missing fields as their defaults.
+"""
+
+import os
+from contextlib import contextmanager
+from typing import Dict, FrozenSet, Iterator
+
+from msgspec import UNSET
+
+PADDING = frozenset({"padding", "padding1", "padding2", "padding3", "padding4"})
+
+# fields each builder knows how to leave out
+DROPPABLE: Dict[str, FrozenSet[str]] = {
+    "PoolState": PADDING | {"rewardInfos", "fundFeesToken0", "fundFeesToken1"},
+    "TickState": frozenset({"rewardGrowthsOutsideX64"}),
+    "PersonalPositionState": frozenset({"rewardInfos"}),
+    "ProtocolPositionState": frozenset({"rewardGrowthInside"}),
+    "Whirlpool": frozenset({"whirlpool_bump", "tick_spacing_seed", "reward_infos"}),
+    "Tick": frozenset({"reward_growths_outside"}),
+    "Position": frozenset({"reward_infos"}),
+}
+
+FIELD_PROFILES: Dict[str, Dict[str, FrozenSet[str]]] = {
+    "full": {},
+    "default": {"PoolState": PADDING},
+    "lean": DROPPABLE,
+}
+
+FIELD_PROFILE = os.getenv("SNAPSHOT_FIELD_PROFILE", "default")
+if FIELD_PROFILE not in FIELD_PROFILES:
+    raise ValueError(
+        f"Unknown SNAPSHOT_FIELD_PROFILE {FIELD_PROFILE!r}, "
+        f"expected one of {sorted(FIELD_PROFILES)}"
+    )
+
+_active = {"name": FIELD_PROFILE, "profile": FIELD_PROFILES[FIELD_PROFILE]}
+
+_NONE: FrozenSet[str] = frozenset()
+
+
+def dropped_fields(account_type: str) -> FrozenSet[str]:
+    """Fields of `account_type` the active profile leaves out."""
+    return _active["profile"].get(account_type, _NONE)
+
+
+def active_field_profile() -> str:
+    return _active["name"]
+
+
+@contextmanager
+def use_field_profile(name: str) -> Iterator[None]:
+    """Builds rows with profile `name` inside the block (benchmarks, backfills)."""
+    if name not in FIELD_PROFILES:
+        raise ValueError(
+            f"Unknown field profile {name!r}, expected one of {sorted(FIELD_PROFILES)}"
+        )
+    previous = dict(_active)
+    _active.update(name=name, profile=FIELD_PROFILES[name])
+    try:
+        yield
+    finally:
+        _active.update(previous)
+
+
+def without_unset(row: dict) -> dict:
+    """Drops the fields a dict builder set to UNSET, keeping the field order."""
+    return {k: v for k, v in row.items() if v is not UNSET}
+
@@ -0,0 +1,311 @@
+"""
+Staged snapshot pipeline: discover -> fetch -> decode -> serialize -> sink.
+
+Each stage is a pool of workers reading from its own bounded asyncio queue
+and writing to the next stage's, so network, CPU and disk work of different
+pools overlap while a slow stage holds everything upstream back (a full queue
+blocks the producer) instead of letting results pile up in memory.
+
+Stage functions are coroutines; blocking work (sync RPC clients, decoding,
+encoding, file writes) is wrapped with `in_thread`. A stage can fan out
+(`fan_out=True`: every element of its result is sent on separately) and can
+drop an item by returning None. Per-stage counters (items, errors, busy
+time, queue depth) are collected in `StageStats`, along with the items a
+`skip_errors` stage dropped (`Pipeline.dropped`).
+
+A run can have a wall-clock budget (`Deadline`): pools are fetched in the
+order discover yields them, and once the budget is spent the remaining ones
+are not started but deferred, while those already fetched still go through
+decode and sink, so the run ends with complete pools only.
+
+The protocol runners are configurations of `snapshot_stages`: they supply
+discover, fetch and decode; serialize and sink are shared and write each
+finished pool to the run's spool.
+"""
+
+import asyncio
+import logging
+import time
+from dataclasses import dataclass, field
+from functools import partial
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional, Tuple
+
+from dex_dagster.ingestion.src.common.checkpoint import RunSpool
+from dex_dagster.ingestion.src.common.rows import encode_json
+
+logger = logging.getLogger("dex")
+
+StageFunc = Callable[[Any], Awaitable[Any]]
+
+STAGE_NAMES = ("discover", "fetch", "decode", "serialize", "sink")
+DEFAULT_QUEUE_SIZE = 4
+
+_DONE = object()  # end-of-stream marker, one per downstream worker
+
+
+def in_thread(func: Callable[..., Any]) -> StageFunc:
+    """Wraps a blocking function as a stage coroutine run in a worker thread."""
+
+    async def run(item):
+        return await asyncio.to_thread(func, item)
+
+    run.__name__ = getattr(func, "__name__", "in_thread")
+    return run
+
+
+@dataclass
+class Stage:
+    """
+    One step of a pipeline.
+
+    Attributes:
+        name (str): Stage name, used in logs and stats
+        func (StageFunc): Coroutine applied to every item
+        concurrency (int): Number of workers
+        queue_size (int): Capacity of the stage's input queue
+        fan_out (bool): Send each element of the result downstream separately
+        skip_errors (bool): Log and drop items whose function raises, instead
+            of failing the whole run
+    """
+
+    name: str
+    func: StageFunc
+    concurrency: int = 1
+    queue_size: int = DEFAULT_QUEUE_SIZE
+    fan_out: bool = False
+    skip_errors: bool = False
+
+
+@dataclass
+class StageStats:
+    """Throughput and queue-depth counters of one stage."""
+
+    name: str
+    concurrency: int
+    items_in: int = 0
+    items_out: int = 0
+    errors: int = 0
+    busy: float = 0.0  # summed seconds workers spent inside the stage function
+    max_queue_depth: int = 0
+    dropped: List[Any] = field(default_factory=list, repr=False)
+    _depth_total: int = field(default=0, repr=False)
+
+    def observe_depth(self, depth: int) -> None:
+        self.max_queue_depth = max(self.max_queue_depth, depth)
+        self._depth_total += depth
+
+    def as_dict(self, elapsed: float) -> dict:
+        return {
+            "concurrency": self.concurrency,
+            "items_in": self.items_in,
+            "items_out": self.items_out,
+            "errors": self.errors,
+            "items_per_second": round(self.items_in / elapsed, 3) if elapsed else 0.0,
+            "busy_seconds": round(self.busy, 3),
+            # share of the run the stage's workers were busy; ~1 is the bottleneck
+            "utilization": (
+                round(self.busy / (elapsed * self.concurrency), 3) if elapsed else 0.0
+            ),
+            "max_queue_depth": self.max_queue_depth,
+            "mean_queue_depth": (
+                round(self._depth_total / self.items_in, 2) if self.items_in else 0.0
+            ),
+        }
+
+
+class Pipeline:
+    """Stages connected by bounded queues; see the module docstring."""
+
+    def __init__(self, stages: List[Stage]):
+        if not stages:
+            raise ValueError("A pipeline needs at least one stage")
+        self.stages = stages
+        self.stats = [StageStats(s.name, s.concurrency) for s in stages]
+        self.elapsed = 0.0
+
+    async def run(self, items: Iterable[Any]) -> List[Any]:
+        """
+        Feeds `items` through every stage.
+
+        Returns:
+            List[Any]: Results of the last stage, in completion order
+        """
+        queues = [asyncio.Queue(maxsize=s.queue_size) for s in self.stages]
+        results: List[Any] = []
+        started = time.monotonic()
+
+        async def feed():
+            for item in items:
+                await queues[0].put(item)
+            for _ in range(self.stages[0].concurrency):
+                await queues[0].put(_DONE)
+
+        async def run_stage(i: int):
+            stage = self.stages[i]
+            out = queues[i + 1] if i + 1 < len(queues) else None
+            workers = [
+                self._worker(stage, self.stats[i], queues[i], out, results)
+                for _ in range(stage.concurrency)
+            ]
+            await asyncio.gather(*workers)
+            if out is not None:
+                for _ in range(self.stages[i + 1].concurrency):
+                    await out.put(_DONE)
+
+        tasks = [asyncio.ensure_future(feed())] + [
+            asyncio.ensure_future(run_stage(i)) for i in range(len(self.stages))
+        ]
+        try:
+            await asyncio.gather(*tasks)
+        except BaseException:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            raise
+        finally:
+            self.elapsed = time.monotonic() - started
+        return results
+
+    @staticmethod
+    async def _worker(
+        stage: Stage,
+        stats: StageStats,
+        inbox: asyncio.Queue,
+        out: Optional[asyncio.Queue],
+        results: List[Any],
+    ) -> None:
+        while True:
+            stats.observe_depth(inbox.qsize())
+            item = await inbox.get()
+            if item is _DONE:
+                return
+            stats.items_in += 1
+            started = time.monotonic()
+            try:
+                result = await stage.func(item)
+            except Exception as exc:
+                stats.errors += 1
+                if not stage.skip_errors:
+                    raise
+                logger.info(f"[{stage.name}] dropped {item!r}: {exc}")
+                stats.dropped.append(item)
+                continue
+            finally:
+                stats.busy += time.monotonic() - started
+            if result is None:
+                continue
+            for value in result if stage.fan_out else (result,):
+                stats.items_out += 1
+                if out is None:
+                    results.append(value)
+                else:
+                    await out.put(value)  # blocks while downstream is full
+
+    def dropped(self, name: str) -> List[Any]:
+        """Items the stage `name` dropped because its function raised."""
+        return [item for s in self.stats if s.name == name for item in s.dropped]
+
+    def summary(self) -> Dict[str, dict]:
+        """Per-stage counters, for logs and run metadata."""
+        return {s.name: s.as_dict(self.elapsed) for s in self.stats}
+
+    def log_summary(self) -> None:
+        for name, s in self.summary().items():
+            logger.info(
+                f"Stage {name:<9} x{s['concurrency']}: {s['items_in']} in, "
+                f"{s['items_out']} out, {s['errors']} errors, "
+                f"{s['items_per_second']}/s, utilization {s['utilization']:.0%}, "
+                f"queue max {s['max_queue_depth']}"
+            )
+
+
+class Deadline:
+    """
+    Wall-clock budget for starting work; see the module docstring.
+
+    Args:
+        seconds (Optional[float]): Budget from now; None never expires
+    """
+
+    def __init__(self, seconds: Optional[float] = None):
+        self.seconds = seconds
+        self.expires = time.monotonic() + seconds if seconds else None
+        self.deferred: List[Any] = []
+
+    def expired(self) -> bool:
+        return self.expires is not None and time.monotonic() >= self.expires
+
+    def guard(self, func: StageFunc) -> StageFunc:
+        """Wraps a stage function to defer items that arrive after expiry."""
+
+        async def run(item):
+            if self.expired():
+                self.deferred.append(item)
+                return None
+            return await func(item)
+
+        run.__name__ = getattr(func, "__name__", "guarded")
+        return run
+
+
+def _serialize(item: Tuple[str, Dict[str, list]]) -> Tuple[str, bytes]:
+    pool, rows = item
+    return pool, encode_json(rows, indent=0)
+
+
+def _sink(spool: RunSpool, item: Tuple[str, bytes]) -> str:
+    pool, body = item
+    spool.write_pool_encoded(pool, body)
+    return pool
+
+
+def snapshot_stages(
+    spool: RunSpool,
+    discover: StageFunc,
+    fetch: StageFunc,
+    decode: StageFunc,
+    concurrency: Optional[Dict[str, int]] = None,
+    defaults: Optional[Dict[str, int]] = None,
+    deadline: Optional[Deadline] = None,
+) -> List[Stage]:
+    """
+    The stages of one snapshot run.
+
+    Args:
+        spool (RunSpool): Spool the sink checkpoints finished pools to
+        discover (StageFunc): token -> pools still to fetch (fanned out), in
+            the order they should be fetched
+        fetch (StageFunc): pool -> raw accounts; failures drop the pool
+            (listed by `Pipeline.dropped("fetch")`)
+        decode (StageFunc): raw accounts -> (pool, {kind: rows})
+        concurrency (Optional[Dict[str, int]]): Workers per stage name,
+            overriding `defaults`
+        defaults (Optional[Dict[str, int]]): The protocol's default workers
+        deadline (Optional[Deadline]): Budget after which pools are no
+            longer fetched but deferred
+
+    Discover and sink always run one worker: discover is called once, with
+    the token, and the spool rewrites its manifest for every pool.
+    """
+    workers = {name: 1 for name in STAGE_NAMES}
+    workers.update(defaults or {})
+    workers.update(concurrency or {})
+    unknown = set(workers) - set(STAGE_NAMES)
+    if unknown:
+        raise ValueError(f"Unknown pipeline stages: {sorted(unknown)}")
+
+    def size(name: str) -> int:
+        return max(DEFAULT_QUEUE_SIZE, 2 * workers[name])
+
+    if deadline is not None:
+        fetch = deadline.guard(fetch)
+
+    return [
+        Stage("discover", discover, 1, 1, fan_out=True),
+        Stage("fetch", fetch, workers["fetch"], size("fetch"), skip_errors=True),
+        Stage("decode", decode, workers["decode"], size("decode")),
+        Stage(
+            "serialize", in_thread(_serialize), workers["serialize"], size("serialize")
+        ),
+        Stage("sink", in_thread(partial(_sink, spool)), 1, size("sink")),
+    ]
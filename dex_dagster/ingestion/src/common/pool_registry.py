@@ -0,0 +1,289 @@
+"""
+Registry of the pools of each (protocol, token), so runs don't rescan for them.
+
+Finding a token's pools takes two `getProgramAccounts` scans per protocol
+(memcmp on the mint-A and mint-B offsets), the most expensive calls a run
+makes, while the pool set changes a few times a week. The registry keeps the
+pool set, with each pool's mints and when it was first seen, in the snapshot
+bucket (`read_state`), where every run's fresh container can read it, or in
+the local account cache when no bucket is configured (local development);
+runs read it from there and only scan:
+
+- when there is no registry for the token yet,
+- when the last full scan is older than `scan_interval`
+  (`POOL_REGISTRY_SCAN_INTERVAL`, a week by default),
+- on demand (`rescan=True`, e.g. SnapshotRunConfig.rescan_pools).
+
+Between scans, `detect_new_pools` can pick up pools created since the last
+check without a scan. Creating a pool always references both mints, so it
+reads the token mint's signatures since the last one it saw, fetches the
+transactions among them that invoke the program, and checks their unknown
+accounts for pool accounts of the token. When more than `max_signatures`
+arrived since the last check (heavily traded mints, every time) it skips
+them and leaves new pools to the next full scan, so it's only worth turning
+on for tokens with modest activity.
+"""
+
+import logging
+import os
+import time
+from dataclasses import dataclass
+from typing import Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+from httpx import HTTPStatusError
+from solana.exceptions import SolanaRpcException
+from solana.rpc.commitment import Processed
+from solana.rpc.types import MemcmpOpts
+from solders.pubkey import Pubkey
+from solders.signature import Signature
+from tenacity import (
+    retry,
+    retry_if_exception_type,
+    stop_after_attempt,
+    wait_exponential,
+)
+
+from dex_dagster.ingestion.src.common.account_cache import (
+    AccountCache,
+    get_account_cache,
+)
+from dex_dagster.ingestion.src.common.spl_token import chunked
+from dex_dagster.ingestion.src.common.utility import (
+    read_state,
+    shared_state_enabled,
+    write_state,
+)
+
+logger = logging.getLogger("dex")
+
+POOL_REGISTRY_SCAN_INTERVAL = float(
+    os.getenv("POOL_REGISTRY_SCAN_INTERVAL", 7 * 24 * 3600)
+)
+MAX_NEW_POOL_SIGNATURES = 200
+
+RegistryRetry = retry(
+    retry=retry_if_exception_type((SolanaRpcException, HTTPStatusError)),
+    wait=wait_exponential(multiplier=1.5, min=2, max=60),
+    stop=stop_after_attempt(6),
+    reraise=True,
+)
+
+
+@dataclass(frozen=True)
+class PoolProgram:
+    """Where a protocol's pool accounts live and how to recognise them."""
+
+    protocol: str
+    program_id: str
+    account_size: int
+    # byte offsets of the two mints in the pool account
+    mint_offsets: Tuple[int, int]
+
+    def mints(self, data: bytes) -> List[str]:
+        return [str(Pubkey.from_bytes(data[o : o + 32])) for o in self.mint_offsets]
+
+    def is_pool_of(self, owner, data: bytes, token: str) -> bool:
+        return (
+            str(owner) == self.program_id
+            and len(data) == self.account_size
+            and token in self.mints(data)
+        )
+
+
+class PoolRegistry:
+    """
+    Known pools of a protocol per token; see the module docstring.
+
+    Args:
+        client: Sync RPC client (a `RoutedClient` or solana `Client`)
+        program (PoolProgram): The protocol's pool accounts
+        cache (Optional[AccountCache]): Where the registry is kept when
+            there is no snapshot bucket
+        scan_interval (float): Seconds before a full scan is due again
+        before_call (Optional[Callable[[], None]]): Called before every RPC
+            call, e.g. a rate limiter
+    """
+
+    def __init__(
+        self,
+        client,
+        program: PoolProgram,
+        cache: Optional[AccountCache] = None,
+        scan_interval: float = POOL_REGISTRY_SCAN_INTERVAL,
+        before_call: Optional[Callable[[], None]] = None,
+    ):
+        self.client = client
+        self.program = program
+        self.cache = cache or get_account_cache()
+        self.scan_interval = scan_interval
+        self.before_call = before_call or (lambda: None)
+
+    @RegistryRetry
+    def _rpc(self, method: str, *args, **kwargs):
+        self.before_call()
+        return getattr(self.client, method)(*args, **kwargs)
+
+    def _key(self, token: str) -> str:
+        return f"{self.program.protocol}:{token}"
+
+    def _state_name(self, token: str) -> str:
+        return f"pool_registry/{self.program.protocol}/{token}"
+
+    def entry(self, token: str) -> Optional[dict]:
+        """
+        The stored registry of `token`: `pools` ({address: {"mints",
+        "first_seen"}}), `scanned_at` and the detection cursor `last_signature`.
+        """
+        if shared_state_enabled():
+            return read_state(self._state_name(token))
+        return self.cache.get("pool_registry", self._key(token))
+
+    def _save(self, token: str, entry: dict) -> None:
+        if not shared_state_enabled():
+            self.cache.put("pool_registry", self._key(token), entry)
+            return
+        try:
+            write_state(self._state_name(token), entry)
+        except Exception as exc:
+            # the run still has its pools; the next one scans again
+            logger.warning(f"Failed to save the {self._key(token)} registry: {exc}")
+
+    def pools(
+        self, token: str, rescan: bool = False, detect: bool = False
+    ) -> List[str]:
+        """
+        Pool addresses of `token`, scanning only when the registry is missing,
+        stale or `rescan` is set; with `detect`, new pools are looked for by
+        signature in between.
+        """
+        try:
+            entry = self.entry(token)
+        except Exception as exc:
+            logger.warning(f"Failed to read the {self._key(token)} registry: {exc}")
+            entry = None
+        age = time.time() - entry["scanned_at"] if entry else None
+        if rescan or age is None or age > self.scan_interval:
+            entry = self.scan(token, entry)
+        else:
+            if detect:
+                self.detect_new_pools(token, entry)
+            logger.info(
+                f"{self.program.protocol}: {len(entry['pools'])} pools from the "
+                f"registry, last scanned {age / 3600:.1f}h ago"
+            )
+        return list(entry["pools"])
+
+    def scan(self, token: str, previous: Optional[dict] = None) -> dict:
+        """Full `getProgramAccounts` scan for pools with `token` as either mint."""
+        now = time.time()
+        known = previous["pools"] if previous else {}
+        pools: Dict[str, dict] = {}
+        for offset in self.program.mint_offsets:
+            resp = self._rpc(
+                "get_program_accounts",
+                Pubkey.from_string(self.program.program_id),
+                commitment=Processed,
+                filters=[
+                    self.program.account_size,
+                    MemcmpOpts(offset=offset, bytes=token),
+                ],
+            )
+            for account in resp.value:
+                address = str(account.pubkey)
+                pools[address] = {
+                    "mints": self.program.mints(bytes(account.account.data)),
+                    "first_seen": known.get(address, {}).get("first_seen", now),
+                }
+
+        added = set(pools) - set(known)
+        removed = set(known) - set(pools)
+        logger.info(
+            f"{self.program.protocol}: scanned {len(pools)} pools for {token}"
+            + (f", {len(added)} new, {len(removed)} gone" if previous else "")
+        )
+        entry = {
+            "pools": pools,
+            "scanned_at": now,
+            "last_signature": previous.get("last_signature") if previous else None,
+        }
+        self._save(token, entry)
+        return entry
+
+    def detect_new_pools(
+        self,
+        token: str,
+        entry: dict,
+        max_signatures: int = MAX_NEW_POOL_SIGNATURES,
+    ) -> List[str]:
+        """
+        Adds pools created since the last check to `entry` (and the cache).
+
+        The first call only records where to start from. Returns the new pools.
+        """
+        last = entry.get("last_signature")
+        sigs = self._rpc(
+            "get_signatures_for_address",
+            Pubkey.from_string(token),
+            until=Signature.from_string(last) if last else None,
+            limit=1 if last is None else max_signatures,
+        ).value
+        if sigs:
+            entry["last_signature"] = str(sigs[0].signature)
+        if last is None or not sigs:
+            self._save(token, entry)
+            return []
+        if len(sigs) >= max_signatures:
+            logger.info(
+                f"{self.program.protocol}: over {max_signatures} signatures for "
+                f"{token} since the last check; new pools wait for the next scan"
+            )
+            self._save(token, entry)
+            return []
+
+        candidates: Set[str] = set()
+        for sig in sigs:
+            if sig.err is None:
+                candidates |= self._touched_accounts(sig.signature)
+        candidates -= set(entry["pools"]) | {token, self.program.program_id}
+
+        found = dict(self._pool_accounts(token, candidates))
+        now = time.time()
+        for address, mints in found.items():
+            entry["pools"][address] = {"mints": mints, "first_seen": now}
+        if found:
+            logger.info(
+                f"{self.program.protocol}: {len(found)} new pools for {token} "
+                f"from {len(sigs)} signatures: {sorted(found)}"
+            )
+        self._save(token, entry)
+        return sorted(found)
+
+    def _touched_accounts(self, signature) -> Set[str]:
+        """Accounts of a transaction, if it invokes the program."""
+        tx = self._rpc(
+            "get_transaction",
+            signature,
+            encoding="base64",
+            max_supported_transaction_version=0,
+        ).value
+        if tx is None:
+            return set()
+        keys = [str(k) for k in tx.transaction.transaction.message.account_keys]
+        loaded = tx.transaction.meta.loaded_addresses if tx.transaction.meta else None
+        if loaded is not None:
+            keys += [str(k) for k in [*loaded.writable, *loaded.readonly]]
+        return set(keys) if self.program.program_id in keys else set()
+
+    def _pool_accounts(
+        self, token: str, addresses: Iterable[str]
+    ) -> Iterable[Tuple[str, List[str]]]:
+        for chunk in chunked(sorted(addresses)):
+            resp = self._rpc(
+                "get_multiple_accounts", [Pubkey.from_string(a) for a in chunk]
+            )
+            for address, account in zip(chunk, resp.value):
+                if account is None:
+                    continue
+                data = bytes(account.data)
+                if self.program.is_pool_of(account.owner, data, token):
+                    yield address, self.program.mints(data)
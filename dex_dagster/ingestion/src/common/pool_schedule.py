@@ -0,0 +1,729 @@
+"""
+Activity-adaptive snapshot schedule: how often each pool is worth reading.
+
+After every run `record_snapshot` compares each pool it read with the pool's
+previous snapshot and scores how much changed, per hour:
+
+- ticks: current-tick movement, in units of the pool's tick spacing
+- liquidity: change of in-range liquidity, relative to the previous value
+- swaps: swap volume relative to the vault balances. Raydium keeps swap
+  counters (`swapInAmountToken0/1`); Orca has none, so its volume is
+  derived from fee growth, fee rate and liquidity
+- churn: positions opened or closed, relative to the previous count
+
+The weighted sum is smoothed across runs. `assign_intervals` then turns the
+scores of a protocol's pools into refresh intervals: the snapshot rate of a
+pool grows with its score, between `max_interval` (dead pools) and
+`min_interval` (the busiest), scaled down until the estimated RPC calls of
+all pools fit `rpc_budget_per_hour`. New pools start at `NEW_POOL_SCORE`
+until a second snapshot scores them.
+
+Runs and the sensor work on a local sqlite file, and each protocol's rows
+are kept in the snapshot bucket too (`read_state`): on Dagster Cloud every
+run has its own container and the sensor runs in the code server, so the
+local file alone would never reach the sensor. `pull` refreshes the local
+rows from the bucket when they are newer, `push` writes them back after a
+run. The Dagster sensor reads `due_pools` every few minutes and launches
+runs for them; a full run (every pool in the pool registry, which is how new
+pools join the schedule) is due once `max_interval` has passed since the
+last one. Each pool's value (the balance of its vault of the run's token) is
+kept too, so a run can read the most valuable pools first (`order_pools`).
+"""
+
+import json
+import logging
+import math
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from dataclasses import dataclass
+from functools import lru_cache
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional
+
+from dex_dagster.ingestion.src.common.spl_token import MAX_MULTIPLE_ACCOUNTS
+from dex_dagster.ingestion.src.common.utility import read_state, write_state
+
+logger = logging.getLogger("dex")
+
+POOL_SCHEDULE_PATH = Path(
+    os.getenv(
+        "POOL_SCHEDULE_PATH", Path(tempfile.gettempdir()) / "dex_pool_schedule.sqlite"
+    )
+)
+
+# weight of each activity component in the score; a pool that moves five tick
+# spacings, changes 5% of its liquidity, trades 20% of its reserves or turns
+# over 2% of its positions in an hour scores 1 on that component
+ACTIVITY_WEIGHTS = {"ticks": 0.2, "liquidity": 20.0, "swaps": 5.0, "churn": 50.0}
+# weight of the newest score against the running one
+SCORE_SMOOTHING = 0.5
+# score of a pool seen for the first time: about hourly, the fixed cadence
+# every pool had before, until a second snapshot gives it a real score
+NEW_POOL_SCORE = 1.0
+# RPC calls of one pool snapshot besides its tick-array batches: Raydium reads
+# the pool, its bitmap extension and two position scans; Orca the whirlpool
+# and one position scan
+SNAPSHOT_CALLS = {"raydium": 4, "orca": 2}
+# position ids are kept truncated; plenty to count opens and closes
+POSITION_ID_CHARS = 12
+
+
+@dataclass(frozen=True)
+class SchedulePolicy:
+    """
+    Limits the intervals are assigned within.
+
+    Attributes:
+        rpc_budget_per_hour (int): Estimated RPC calls per hour, per protocol,
+            that snapshots may use
+        min_interval (int): Shortest refresh interval, in seconds
+        max_interval (int): Longest refresh interval, in seconds; also the
+            interval of full runs
+        granularity (int): Intervals are multiples of this (the sensor's
+            evaluation interval), in seconds
+        snapshots_per_score (float): Snapshots per hour a pool gets per unit
+            of score while the budget allows it
+    """
+
+    rpc_budget_per_hour: int = 20_000
+    min_interval: int = 300
+    max_interval: int = 6 * 3600
+    granularity: int = 300
+    snapshots_per_score: float = 1.0
+
+
+DEFAULT_POLICY = SchedulePolicy(
+    rpc_budget_per_hour=int(os.getenv("SNAPSHOT_RPC_BUDGET_PER_HOUR", "20000"))
+)
+
+
+@dataclass
+class PoolObservation:
+    """What the schedule keeps of one pool's snapshot."""
+
+    pool: str
+    tick: int
+    tick_spacing: int
+    liquidity: int
+    # swap volume counters, per token, in base units; for Orca the fee growth
+    # (Q64.64 per unit of liquidity) stands in for them
+    volume: List[int]
+    vaults: List[Optional[int]]
+    positions: List[str]
+    # RPC calls the snapshot took
+    calls: int
+    fee_rate: Optional[int] = None
+    # balance of the run token's vault, in its base units: comparable across
+    # all pools of the token, so runs fetch the most valuable pools first
+    value: Optional[int] = None
+
+
+def activity(
+    prev: PoolObservation, cur: PoolObservation, hours: float
+) -> Dict[str, float]:
+    """Per-hour change of each activity component between two snapshots."""
+    hours = max(hours, 1 / 60)
+    ticks = abs(cur.tick - prev.tick) / max(cur.tick_spacing, 1)
+    liquidity = abs(cur.liquidity - prev.liquidity) / max(prev.liquidity, 1)
+
+    swaps = 0.0
+    for i, vault in enumerate(cur.vaults):
+        if not vault:
+            continue
+        # counters only grow; a drop means the pool was reset, not activity
+        delta = max(cur.volume[i] - prev.volume[i], 0)
+        if cur.fee_rate is not None:
+            # fees = growth * liquidity / 2**64, volume = fees / fee rate
+            fees = delta * cur.liquidity / 2**64
+            delta = fees * 1_000_000 / max(cur.fee_rate, 1)
+        swaps += delta / vault
+
+    before, after = set(prev.positions), set(cur.positions)
+    churn = len(before ^ after) / max(len(before), 1)
+    return {
+        "ticks": ticks / hours,
+        "liquidity": liquidity / hours,
+        "swaps": swaps / hours,
+        "churn": churn / hours,
+    }
+
+
+def score(components: Dict[str, float]) -> float:
+    return sum(ACTIVITY_WEIGHTS[name] * value for name, value in components.items())
+
+
+def assign_intervals(
+    scores: Dict[str, float],
+    calls: Dict[str, int],
+    policy: SchedulePolicy = DEFAULT_POLICY,
+) -> Dict[str, int]:
+    """
+    Refresh interval per pool, in seconds.
+
+    A pool's snapshot rate is `snapshots_per_score * score`, clamped to the
+    policy's interval range; when the estimated calls of every pool at those
+    rates exceed the budget, the rate per unit of score is lowered (found by
+    bisection) until they fit. If even every pool at `max_interval` is over
+    budget, every pool gets `max_interval`.
+
+    Args:
+        scores (Dict[str, float]): Activity score per pool
+        calls (Dict[str, int]): RPC calls of one snapshot, per pool
+        policy (SchedulePolicy): Interval limits and budget
+    """
+    if not scores:
+        return {}
+    lo_rate = 3600 / policy.max_interval  # snapshots per hour
+    hi_rate = 3600 / policy.min_interval
+
+    def rates(k: float) -> Dict[str, float]:
+        return {p: min(max(k * s, lo_rate), hi_rate) for p, s in scores.items()}
+
+    def cost(r: Dict[str, float]) -> float:
+        return sum(calls[p] * rate for p, rate in r.items())
+
+    k = policy.snapshots_per_score
+    if cost(rates(0)) > policy.rpc_budget_per_hour:
+        logger.warning(
+            f"Schedule: {len(scores)} pools at the longest interval already "
+            f"need {cost(rates(0)):.0f} calls/h, over the budget of "
+            f"{policy.rpc_budget_per_hour}"
+        )
+        k = 0.0
+    elif cost(rates(k)) > policy.rpc_budget_per_hour:
+        lo, hi = 0.0, k
+        for _ in range(50):
+            mid = (lo + hi) / 2
+            if cost(rates(mid)) > policy.rpc_budget_per_hour:
+                hi = mid
+            else:
+                lo = mid
+        k = lo
+
+    intervals = {}
+    for pool, rate in rates(k).items():
+        # rounded up, so rounding never takes the schedule over budget
+        steps = math.ceil(3600 / rate / policy.granularity)
+        intervals[pool] = min(steps * policy.granularity, policy.max_interval)
+    return intervals
+
+
+def _int(value) -> int:
+    return int(value) if value not in (None, "") else 0
+
+
+def _vault_amount(vault) -> Optional[int]:
+    """Base-unit balance of a filled-in vault (Raydium block or token account)."""
+    if vault is None:
+        return None
+    if isinstance(vault, dict):
+        amount = vault.get("balance", vault.get("amount"))
+    else:
+        amount = getattr(vault, "amount", None)
+    return _int(amount) if amount is not None else None
+
+
+def _tick_array_calls(count: int) -> int:
+    return math.ceil(count / MAX_MULTIPLE_ACCOUNTS)
+
+
+def raydium_observations(
+    outputs: Dict[str, list], token: str
+) -> List[PoolObservation]:
+    """Observations of every pool in the outputs of a Raydium run."""
+    positions: Dict[str, List[str]] = {}
+    for row in outputs.get("personal_position", []):
+        positions.setdefault(row["poolId"], []).append(
+            row["nftMint"][:POSITION_ID_CHARS]
+        )
+    tick_arrays = {
+        row["pool"]: len(row.get("tickArrays") or {})
+        for row in outputs.get("tick", [])
+    }
+    observations = []
+    for row in outputs.get("pool", []):
+        pool = row["pool"]["address"]
+        data = row["pool"]["parsed"]["data"]
+        vaults = [_vault_amount(row.get(f"tokenVault{i}")) for i in (0, 1)]
+        observations.append(
+            PoolObservation(
+                pool=pool,
+                tick=_int(data["tickCurrent"]),
+                tick_spacing=_int(data["tickSpacing"]),
+                liquidity=_int(data["liquidity"]),
+                volume=[
+                    _int(data[f"swapInAmountToken{i}"])
+                    + _int(data[f"swapOutAmountToken{i}"])
+                    for i in (0, 1)
+                ],
+                vaults=vaults,
+                positions=positions.get(pool, []),
+                calls=SNAPSHOT_CALLS["raydium"]
+                + _tick_array_calls(tick_arrays.get(pool, 0)),
+                value=vaults[0 if data["tokenMint0"] == token else 1],
+            )
+        )
+    return observations
+
+
+def orca_observations(outputs: Dict[str, list], token: str) -> List[PoolObservation]:
+    """Observations of every pool in the outputs of an Orca run."""
+    positions: Dict[str, List[str]] = {}
+    for row in outputs.get("position", []):
+        positions.setdefault(row["whirlpool"], []).append(
+            row["pubkey"][:POSITION_ID_CHARS]
+        )
+    tick_arrays = {
+        row["pool"]: len(row.get("tick_arrays") or [])
+        for row in outputs.get("tick", [])
+    }
+    observations = []
+    for row in outputs.get("pool", []):
+        whirlpool = row["whirlpool"]
+        pool = whirlpool["pubkey"]
+        vaults = [
+            _vault_amount(row.get(f"token_vault_{side}_amount")) for side in ("a", "b")
+        ]
+        observations.append(
+            PoolObservation(
+                pool=pool,
+                tick=_int(whirlpool["tick_current_index"]),
+                tick_spacing=_int(whirlpool["tick_spacing"]),
+                liquidity=_int(whirlpool["liquidity"]),
+                volume=[
+                    _int(whirlpool["fee_growth_global_a"]),
+                    _int(whirlpool["fee_growth_global_b"]),
+                ],
+                vaults=vaults,
+                positions=positions.get(pool, []),
+                calls=SNAPSHOT_CALLS["orca"]
+                + _tick_array_calls(tick_arrays.get(pool, 0)),
+                fee_rate=_int(whirlpool["fee_rate"]),
+                value=vaults[0 if whirlpool["token_mint_a"] == token else 1],
+            )
+        )
+    return observations
+
+
+OBSERVERS = {"raydium": raydium_observations, "orca": orca_observations}
+
+
+class PoolSchedule:
+    """
+    Per-pool activity scores and refresh intervals, in a local sqlite file
+    synced per protocol with the snapshot bucket (`pull` / `push`).
+
+    One row per (protocol, pool) holds the pool's last observation, its
+    smoothed score, the calls a snapshot of it takes, its interval and when
+    it is next due. Full runs are recorded per protocol, with the pools they
+    covered, and so are the pools a run deferred at its deadline, until they
+    are read.
+    """
+
+    def __init__(
+        self,
+        path: Path = POOL_SCHEDULE_PATH,
+        policy: SchedulePolicy = DEFAULT_POLICY,
+    ):
+        self.path = Path(path)
+        self.policy = policy
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.execute("pragma journal_mode=wal")
+        self._conn.execute(
+            "create table if not exists pools ("
+            " protocol text not null, pool text not null,"
+            " observation text not null, observed_at real not null,"
+            " score real not null, calls integer not null,"
+            " interval integer not null, next_due real not null,"
+            " primary key (protocol, pool))"
+        )
+        self._conn.execute(
+            "create table if not exists full_runs ("
+            " protocol text primary key, ran_at real not null)"
+        )
+        self._conn.execute(
+            "create table if not exists deferred ("
+            " protocol text not null, pool text not null,"
+            " primary key (protocol, pool))"
+        )
+        # the pools of the last full run, so those it couldn't read (no row
+        # in pools yet) are still due
+        self._conn.execute(
+            "create table if not exists known ("
+            " protocol text not null, pool text not null,"
+            " primary key (protocol, pool))"
+        )
+        # version of the bucket copy each protocol's rows were last synced with
+        self._conn.execute(
+            "create table if not exists synced ("
+            " protocol text primary key, version real not null)"
+        )
+        self._conn.commit()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _state_name(protocol: str) -> str:
+        return f"pool_schedule/{protocol}"
+
+    def _version(self, protocol: str) -> float:
+        row = self._conn.execute(
+            "select version from synced where protocol = ?", (protocol,)
+        ).fetchone()
+        return row[0] if row else 0.0
+
+    def pull(self, protocol: str) -> bool:
+        """
+        Replaces the protocol's rows with the bucket copy if it is newer than
+        the one they were last synced with.
+
+        Raises if the bucket can't be read, so callers can't mistake an
+        unreadable schedule for an empty one.
+
+        Returns:
+            bool: Whether the protocol has a schedule (a run was recorded)
+        """
+        state = read_state(self._state_name(protocol))
+        with self._lock:
+            if state is not None and state["version"] > self._version(protocol):
+                for table in ("pools", "full_runs", "deferred", "known"):
+                    self._conn.execute(
+                        f"delete from {table} where protocol = ?", (protocol,)
+                    )
+                self._conn.executemany(
+                    "insert into pools values (?, ?, ?, ?, ?, ?, ?, ?)",
+                    [(protocol, *row) for row in state["pools"]],
+                )
+                if state["full_run"] is not None:
+                    self._conn.execute(
+                        "insert into full_runs values (?, ?)",
+                        (protocol, state["full_run"]),
+                    )
+                self._conn.executemany(
+                    "insert into deferred values (?, ?)",
+                    [(protocol, pool) for pool in state["deferred"]],
+                )
+                self._conn.executemany(
+                    "insert into known values (?, ?)",
+                    [(protocol, pool) for pool in state.get("known", [])],
+                )
+                self._conn.execute(
+                    "insert or replace into synced values (?, ?)",
+                    (protocol, state["version"]),
+                )
+                self._conn.commit()
+            return (
+                self._conn.execute(
+                    "select 1 from full_runs where protocol = ? union all"
+                    " select 1 from pools where protocol = ? limit 1",
+                    (protocol, protocol),
+                ).fetchone()
+                is not None
+            )
+
+    def push(self, protocol: str) -> None:
+        """Writes the protocol's rows to the bucket copy; raises if it fails."""
+        with self._lock:
+            pools = self._conn.execute(
+                "select pool, observation, observed_at, score, calls, interval,"
+                " next_due from pools where protocol = ?",
+                (protocol,),
+            ).fetchall()
+            full_run = self._conn.execute(
+                "select ran_at from full_runs where protocol = ?", (protocol,)
+            ).fetchone()
+            deferred = self._conn.execute(
+                "select pool from deferred where protocol = ?", (protocol,)
+            ).fetchall()
+            known = self._conn.execute(
+                "select pool from known where protocol = ?", (protocol,)
+            ).fetchall()
+            version = max(time.time(), self._version(protocol) + 1e-6)
+            write_state(
+                self._state_name(protocol),
+                {
+                    "version": version,
+                    "pools": [list(row) for row in pools],
+                    "full_run": full_run[0] if full_run else None,
+                    "deferred": [pool for (pool,) in deferred],
+                    "known": [pool for (pool,) in known],
+                },
+            )
+            self._conn.execute(
+                "insert or replace into synced values (?, ?)", (protocol, version)
+            )
+            self._conn.commit()
+
+    def record(
+        self,
+        protocol: str,
+        observations: Iterable[PoolObservation],
+        all_pools: Optional[List[str]] = None,
+        now: Optional[float] = None,
+    ) -> Dict[str, float]:
+        """
+        Scores the observed pools against their previous snapshots and
+        reassigns the intervals of every pool of the protocol.
+
+        Args:
+            protocol (str): Protocol name, e.g. "raydium" or "orca"
+            observations (Iterable[PoolObservation]): Pools read by the run
+            all_pools (Optional[List[str]]): Every pool of the token, when
+                the run was a full one; other pools are dropped from the
+                schedule and the full run is recorded, with `all_pools` as
+                the protocol's known pools
+            now (Optional[float]): Time of the run, defaults to now
+
+        Returns:
+            Dict[str, float]: New score of every observed pool
+        """
+        now = time.time() if now is None else now
+        observations = list(observations)
+        with self._lock:
+            previous = {
+                pool: (PoolObservation(**json.loads(obs)), observed_at, prev_score)
+                for pool, obs, observed_at, prev_score in self._conn.execute(
+                    "select pool, observation, observed_at, score from pools"
+                    " where protocol = ?",
+                    (protocol,),
+                )
+            }
+            self._conn.executemany(
+                "delete from deferred where protocol = ? and pool = ?",
+                [(protocol, obs.pool) for obs in observations],
+            )
+            scores = {}
+            for obs in observations:
+                if obs.pool in previous:
+                    prev, observed_at, prev_score = previous[obs.pool]
+                    new = score(activity(prev, obs, (now - observed_at) / 3600))
+                    scores[obs.pool] = (
+                        SCORE_SMOOTHING * new + (1 - SCORE_SMOOTHING) * prev_score
+                    )
+                else:
+                    scores[obs.pool] = NEW_POOL_SCORE
+                self._conn.execute(
+                    "insert or replace into pools values (?, ?, ?, ?, ?, ?, ?, ?)",
+                    (
+                        protocol,
+                        obs.pool,
+                        json.dumps(obs.__dict__),
+                        now,
+                        scores[obs.pool],
+                        obs.calls,
+                        0,
+                        now,
+                    ),
+                )
+            if all_pools is not None:
+                for table in ("pools", "deferred"):
+                    self._conn.execute(
+                        f"delete from {table} where protocol = ? and pool not in"
+                        f" ({','.join('?' * len(all_pools))})",
+                        (protocol, *all_pools),
+                    )
+                self._conn.execute("delete from known where protocol = ?", (protocol,))
+                self._conn.executemany(
+                    "insert or replace into known values (?, ?)",
+                    [(protocol, pool) for pool in all_pools],
+                )
+                self._conn.execute(
+                    "insert or replace into full_runs values (?, ?)", (protocol, now)
+                )
+            self._reschedule(protocol)
+            self._conn.commit()
+        return scores
+
+    def _reschedule(self, protocol: str) -> None:
+        rows = self._conn.execute(
+            "select pool, score, calls, observed_at from pools where protocol = ?",
+            (protocol,),
+        ).fetchall()
+        intervals = assign_intervals(
+            {pool: s for pool, s, _, _ in rows},
+            {pool: calls for pool, _, calls, _ in rows},
+            self.policy,
+        )
+        self._conn.executemany(
+            "update pools set interval = ?, next_due = ?"
+            " where protocol = ? and pool = ?",
+            [
+                (intervals[pool], observed_at + intervals[pool], protocol, pool)
+                for pool, _, _, observed_at in rows
+            ],
+        )
+
+    def due_pools(self, protocol: str, now: Optional[float] = None) -> List[str]:
+        """
+        Pools to read now: the ones a run deferred or failed to read, then
+        the known pools never read (no row yet), then those whose interval
+        has passed since their last snapshot, most overdue first.
+        """
+        now = time.time() if now is None else now
+        with self._lock:
+            deferred = self._conn.execute(
+                "select pool from deferred where protocol = ?", (protocol,)
+            ).fetchall()
+            unread = self._conn.execute(
+                "select pool from known where protocol = ? and pool not in"
+                " (select pool from pools where protocol = ?)",
+                (protocol, protocol),
+            ).fetchall()
+            overdue = self._conn.execute(
+                "select pool from pools where protocol = ? and next_due <= ?"
+                " order by next_due",
+                (protocol, now),
+            ).fetchall()
+        return list(dict.fromkeys(pool for (pool,) in deferred + unread + overdue))
+
+    def full_run_due(self, protocol: str, now: Optional[float] = None) -> bool:
+        """True if no full run was recorded within `max_interval`."""
+        now = time.time() if now is None else now
+        with self._lock:
+            row = self._conn.execute(
+                "select ran_at from full_runs where protocol = ?", (protocol,)
+            ).fetchone()
+        return row is None or now - row[0] >= self.policy.max_interval
+
+    def defer(self, protocol: str, pools: List[str]) -> None:
+        """Records pools a run left unread at its deadline."""
+        with self._lock:
+            self._conn.executemany(
+                "insert or replace into deferred values (?, ?)",
+                [(protocol, pool) for pool in pools],
+            )
+            self._conn.commit()
+
+    def fetch_order(self, protocol: str, pools: List[str]) -> List[str]:
+        """
+        `pools` in the order a run should read them.
+
+        Pools the previous run deferred come first, so a provider that keeps
+        throttling can't starve the small pools forever; then the rest by the
+        value of their last snapshot, largest first. Pools without a recorded
+        value (new, or never read) keep their order within each group and
+        come last in it.
+        """
+        with self._lock:
+            rows = self._conn.execute(
+                "select pool, observation from pools where protocol = ?",
+                (protocol,),
+            ).fetchall()
+            deferred = {
+                pool
+                for (pool,) in self._conn.execute(
+                    "select pool from deferred where protocol = ?", (protocol,)
+                )
+            }
+        values = {pool: json.loads(obs).get("value") for pool, obs in rows}
+
+        def ordered(group: List[str]) -> List[str]:
+            known = [p for p in group if values.get(p) is not None]
+            return sorted(known, key=lambda p: -values[p]) + [
+                p for p in group if values.get(p) is None
+            ]
+
+        return ordered([p for p in pools if p in deferred]) + ordered(
+            [p for p in pools if p not in deferred]
+        )
+
+    def summary(self, protocol: str) -> Dict[str, float]:
+        """Pool count, estimated calls per hour and interval spread."""
+        with self._lock:
+            rows = self._conn.execute(
+                "select interval, calls from pools where protocol = ?", (protocol,)
+            ).fetchall()
+        if not rows:
+            return {"pools": 0}
+        intervals = sorted(interval for interval, _ in rows)
+        return {
+            "pools": len(rows),
+            "calls_per_hour": round(
+                sum(calls * 3600 / interval for interval, calls in rows if interval)
+            ),
+            "min_interval": intervals[0],
+            "median_interval": intervals[len(intervals) // 2],
+            "max_interval": intervals[-1],
+        }
+
+
+@lru_cache(maxsize=None)
+def get_pool_schedule() -> PoolSchedule:
+    """Process-wide schedule at `POOL_SCHEDULE_PATH`."""
+    return PoolSchedule()
+
+
+def order_pools(protocol: str, pools: List[str]) -> List[str]:
+    """`PoolSchedule.fetch_order`; the pools as given if the schedule can't be read."""
+    try:
+        schedule = get_pool_schedule()
+        schedule.pull(protocol)
+        return schedule.fetch_order(protocol, pools)
+    except Exception as exc:
+        logger.warning(f"Failed to read the pool schedule: {exc}")
+        return list(pools)
+
+
+def snapshot_observations(
+    protocol: str, token: str, outputs: Dict[str, list]
+) -> List[dict]:
+    """
+    The observations of a run's outputs as JSON-ready dicts, for a shard to
+    pass on in its part manifest (see `finalize_snapshot`). Never fails the
+    run: outputs that can't be read give no observations, which only leaves
+    their pools due at their old times.
+    """
+    try:
+        return [obs.__dict__ for obs in OBSERVERS[protocol](outputs, token)]
+    except Exception as exc:
+        logger.warning(f"Failed to read the pool observations: {exc}")
+        return []
+
+
+def record_snapshot(
+    protocol: str,
+    token: str,
+    outputs: Dict[str, list],
+    all_pools: Optional[List[str]],
+    deferred: Optional[List[str]] = None,
+    observations: Optional[List[dict]] = None,
+) -> dict:
+    """
+    Updates the schedule from the outputs of a finished run, and records the
+    pools it deferred at its deadline.
+
+    `all_pools` is the token's pool list for a full run, None for a run of
+    scheduled pools (see `PoolSchedule.record`). A sharded run passes the
+    `observations` its shards made (`snapshot_observations`) instead of
+    outputs, so the schedule is updated once for the whole run.
+
+    The schedule is pulled from the snapshot bucket first and pushed back
+    after, so the sensor sees the run. Never fails the run: a schedule that
+    can't be updated is logged and left as it was, and its pools simply fall
+    due at their old times.
+
+    Returns:
+        dict: The protocol's schedule summary, for the run manifest
+    """
+    try:
+        schedule = get_pool_schedule()
+        schedule.pull(protocol)
+        schedule.record(
+            protocol,
+            OBSERVERS[protocol](outputs, token)
+            if observations is None
+            else [PoolObservation(**obs) for obs in observations],
+            all_pools,
+        )
+        if deferred:
+            schedule.defer(protocol, deferred)
+        schedule.push(protocol)
+        summary = schedule.summary(protocol)
+        logger.info(f"Pool schedule: {summary}")
+        return summary
+    except Exception as exc:
+        logger.warning(f"Failed to update the pool schedule: {exc}")
+        return {}
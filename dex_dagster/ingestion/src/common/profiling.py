@@ -0,0 +1,212 @@
+"""
+Opt-in profiling of a snapshot run.
+
+    with profile_run("raydium", token, "sample", run_id) as profile:
+        run_raydium(...)
+    profile.artifacts  # {"stacks": "s3://<bucket>/profiles/...", ...}
+
+Modes:
+
+- "sample": a background thread samples the stacks of every thread every
+  `interval` seconds (wall clock, so time spent waiting on RPC shows up) and
+  writes them in collapsed-stack form (`stacks.folded`), the input of
+  flamegraph.pl, speedscope and inferno.
+- "cprofile": deterministic cProfile of the calling thread (`profile.pstats`
+  plus a cumulative-time report, `profile.txt`). Work that the pipeline runs
+  in worker threads is not covered; use "sample" for that.
+
+Both also trace allocations with tracemalloc and write the top allocation
+sites, the growth since the start of the run and the peak (`allocations.txt`).
+
+Artifacts are uploaded to `profiles/protocol=<p>/date=<YYYY-MM-DD>/<run_id>/`
+in the snapshot bucket, outside the prefixes the S3Queue tables read. With
+the mode off nothing is started or imported and the context costs nothing.
+Profiling never fails the run: errors writing or uploading artifacts are
+logged and skipped.
+"""
+
+import cProfile
+import io
+import logging
+import os
+import pstats
+import sys
+import tempfile
+import threading
+import tracemalloc
+from collections import Counter
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Iterator, Optional
+
+from dex_dagster.ingestion.src.common.utility import get_s3_bucket, get_s3_client
+
+logger = logging.getLogger("dex")
+
+PROFILE_MODES = ("sample", "cprofile")
+SAMPLE_INTERVAL = 0.005
+TRACEMALLOC_FRAMES = 10
+TOP_ALLOCATIONS = 30
+
+
+class StackSampler:
+    """Counts the stacks of all threads, sampled from a daemon thread."""
+
+    def __init__(self, interval: float = SAMPLE_INTERVAL):
+        self.interval = interval
+        self.counts: Counter = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(
+            target=self._run, name="profile-sampler", daemon=True
+        )
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self) -> None:
+        own = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            names = {t.ident: t.name for t in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(
+                        f"{code.co_name} "
+                        f"({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+                    )
+                    frame = frame.f_back
+                stack.append(names.get(ident, str(ident)))
+                self.counts[";".join(reversed(stack))] += 1
+            self.samples += 1
+
+    def collapsed(self) -> str:
+        """Stacks in collapsed form: `thread;outer;...;inner <count>` per line."""
+        return "".join(f"{stack} {n}\n" for stack, n in self.counts.most_common())
+
+
+def allocation_report(
+    start: tracemalloc.Snapshot, end: tracemalloc.Snapshot, peak: int
+) -> str:
+    """Top allocation sites at the end of the run, and the growth since start."""
+    out = io.StringIO()
+    out.write(f"peak traced memory: {peak / 2**20:.1f} MiB\n\n")
+    out.write(f"top {TOP_ALLOCATIONS} allocation sites at end of run:\n")
+    for stat in end.statistics("lineno")[:TOP_ALLOCATIONS]:
+        out.write(f"  {stat}\n")
+    out.write(f"\ntop {TOP_ALLOCATIONS} growth since start of run:\n")
+    for stat in end.compare_to(start, "lineno")[:TOP_ALLOCATIONS]:
+        out.write(f"  {stat}\n")
+    out.write("\nlargest allocation, full traceback:\n")
+    largest = end.statistics("traceback")[:1]
+    for line in largest[0].traceback.format() if largest else []:
+        out.write(f"  {line}\n")
+    return out.getvalue()
+
+
+class RunProfile:
+    """Handle returned by `profile_run`; `artifacts` is filled in on exit."""
+
+    def __init__(self, mode: Optional[str]):
+        self.mode = mode
+        self.artifacts: Dict[str, str] = {}
+
+
+def profile_key(protocol: str, run_id: str, name: str) -> str:
+    return (
+        f"profiles/protocol={protocol}/date={datetime.now():%Y-%m-%d}"
+        f"/{run_id}/{name}"
+    )
+
+
+@contextmanager
+def profile_run(
+    protocol: str,
+    token: str,
+    mode: Optional[str],
+    run_id: str,
+    interval: float = SAMPLE_INTERVAL,
+) -> Iterator[RunProfile]:
+    """
+    Profiles the body of the `with` block when `mode` is set.
+
+    Args:
+        protocol (str): Protocol name, e.g. "raydium" or "orca"
+        token (str): Token mint of the run, recorded in the report header
+        mode (Optional[str]): "sample", "cprofile", or None to do nothing
+        run_id (str): Run id, used in the artifact keys
+        interval (float): Seconds between stack samples in "sample" mode
+    """
+    profile = RunProfile(mode)
+    if not mode:
+        yield profile
+        return
+    if mode not in PROFILE_MODES:
+        raise ValueError(f"Unknown profile mode {mode!r}, expected {PROFILE_MODES}")
+
+    sampler = StackSampler(interval) if mode == "sample" else None
+    profiler = cProfile.Profile() if mode == "cprofile" else None
+    tracemalloc.start(TRACEMALLOC_FRAMES)
+    start_snapshot = tracemalloc.take_snapshot()
+    if sampler:
+        sampler.start()
+    if profiler:
+        profiler.enable()
+    try:
+        yield profile
+    finally:
+        if profiler:
+            profiler.disable()
+        if sampler:
+            sampler.stop()
+        end_snapshot = tracemalloc.take_snapshot()
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        try:
+            files = {
+                "allocations": (
+                    "allocations.txt",
+                    f"{protocol} {token} run {run_id}\n"
+                    + allocation_report(start_snapshot, end_snapshot, peak),
+                )
+            }
+            if sampler:
+                files["stacks"] = ("stacks.folded", sampler.collapsed())
+                logger.info(f"Profile: {sampler.samples} stack samples")
+            if profiler:
+                report = io.StringIO()
+                stats = pstats.Stats(profiler, stream=report)
+                stats.sort_stats("cumulative").print_stats(60)
+                files["report"] = ("profile.txt", report.getvalue())
+                with tempfile.TemporaryDirectory() as tmp:
+                    path = Path(tmp) / "profile.pstats"
+                    stats.dump_stats(path)
+                    files["pstats"] = ("profile.pstats", path.read_bytes())
+            profile.artifacts = _upload(protocol, run_id, files)
+        except Exception as exc:
+            logger.warning(f"Failed to write profile artifacts: {exc}")
+
+
+def _upload(protocol: str, run_id: str, files: Dict[str, tuple]) -> Dict[str, str]:
+    bucket = get_s3_bucket()
+    artifacts = {}
+    for kind, (name, body) in files.items():
+        key = profile_key(protocol, run_id, name)
+        text = isinstance(body, str)
+        get_s3_client().put_object(
+            Bucket=bucket,
+            Key=key,
+            Body=body.encode() if text else body,
+            ContentType="text/plain" if text else "application/octet-stream",
+        )
+        artifacts[kind] = f"s3://{bucket}/{key}"
+    logger.info(f"Profile artifacts: {artifacts}")
+    return artifacts
@@ -0,0 +1,491 @@
+"""
+Typed snapshot rows and the fast JSON encoder they are written with.
+
+Each struct mirrors one of the dict builders (`serializers`, the decoders'
+`decode_*` formatters, `spl_token`): same field names, same order, same
+values, so `encode_json(Row.from_...(x))` is byte-for-byte what
+`json.dumps(builder(x), indent=2)` produced (see benchmarks/row_encoding.py).
+Structs are much cheaper to build than nested dicts and msgspec encodes them
+(and plain dicts/lists) without going through the stdlib encoder.
+
+u64/u128 values stay strings, as in the existing output, because JSON
+consumers can't be trusted with integers above 2**53.
+
+Fields the active field profile drops (see `field_profiles`) are set to
+UNSET without being converted, and msgspec leaves them out of the output.
+"""
+
+from typing import Any, List, Optional, Union
+
+import msgspec
+from msgspec import UNSET, UnsetType
+
+from dex_dagster.ingestion.src.common.field_profiles import dropped_fields
+
+_encoder = msgspec.json.Encoder()
+_decoder = msgspec.json.Decoder()
+
+
+def encode_json(data: Any, indent: int = 2) -> bytes:
+    """
+    Encodes rows (structs, dicts, lists) to JSON.
+
+    With `indent` the output matches `json.dumps(data, indent=indent)` for
+    ASCII strings, ints and None, which is everything snapshot rows hold.
+    `indent=0` gives compact output, like separators=(",", ":").
+    """
+    buf = _encoder.encode(data)
+    return msgspec.json.format(buf, indent=indent) if indent else buf
+
+
+def decode_json(buf: bytes) -> Any:
+    return _decoder.decode(buf)
+
+
+# Orca (whirlpool-essentials objects, see serializers.py)
+
+
+class WhirlpoolRewardInfoRow(msgspec.Struct):
+    mint: str
+    vault: str
+    authority: str
+    emissions_per_second_x64: str
+    growth_global_x64: str
+
+    @classmethod
+    def from_account(cls, ri) -> "WhirlpoolRewardInfoRow":
+        return cls(
+            str(ri.mint),
+            str(ri.vault),
+            str(ri.authority),
+            str(ri.emissions_per_second_x64),
+            str(ri.growth_global_x64),
+        )
+
+
+class WhirlpoolRow(msgspec.Struct):
+    pubkey: str
+    token: str
+    whirlpools_config: str
+    whirlpool_bump: Union[List[int], UnsetType]
+    tick_spacing: int
+    tick_spacing_seed: Union[List[int], UnsetType]
+    fee_rate: int
+    protocol_fee_rate: int
+    liquidity: str
+    sqrt_price: str
+    tick_current_index: int
+    protocol_fee_owed_a: str
+    protocol_fee_owed_b: str
+    token_mint_a: str
+    token_vault_a: str
+    fee_growth_global_a: str
+    token_mint_b: str
+    token_vault_b: str
+    fee_growth_global_b: str
+    reward_last_updated_timestamp: int
+    reward_infos: Union[List[WhirlpoolRewardInfoRow], UnsetType]
+
+    @classmethod
+    def from_account(cls, whirlpool, whirlpool_pubkey, token: str) -> "WhirlpoolRow":
+        drop = dropped_fields("Whirlpool")
+        return cls(
+            str(whirlpool_pubkey),
+            token,
+            str(whirlpool.whirlpools_config),
+            (
+                UNSET
+                if "whirlpool_bump" in drop
+                else [int(b) for b in whirlpool.whirlpool_bump]
+            ),
+            whirlpool.tick_spacing,
+            (
+                UNSET
+                if "tick_spacing_seed" in drop
+                else [int(s) for s in whirlpool.tick_spacing_seed]
+            ),
+            whirlpool.fee_rate,
+            whirlpool.protocol_fee_rate,
+            str(whirlpool.liquidity),
+            str(whirlpool.sqrt_price),
+            whirlpool.tick_current_index,
+            str(whirlpool.protocol_fee_owed_a),
+            str(whirlpool.protocol_fee_owed_b),
+            str(whirlpool.token_mint_a),
+            str(whirlpool.token_vault_a),
+            str(whirlpool.fee_growth_global_a),
+            str(whirlpool.token_mint_b),
+            str(whirlpool.token_vault_b),
+            str(whirlpool.fee_growth_global_b),
+            whirlpool.reward_last_updated_timestamp,
+            (
+                UNSET
+                if "reward_infos" in drop
+                else [
+                    WhirlpoolRewardInfoRow.from_account(ri)
+                    for ri in whirlpool.reward_infos
+                ]
+            ),
+        )
+
+
+class WhirlpoolTickRow(msgspec.Struct):
+    initialized: bool
+    liquidity_net: str
+    liquidity_gross: str
+    fee_growth_outside_a: str
+    fee_growth_outside_b: str
+    reward_growths_outside: Union[List[str], UnsetType]
+
+
+class WhirlpoolTickArrayRow(msgspec.Struct):
+    pubkey: str
+    start_tick_index: int
+    ticks: List[WhirlpoolTickRow]
+    whirlpool: str
+
+    @classmethod
+    def from_account(cls, tick_array) -> "WhirlpoolTickArrayRow":
+        rewards = "reward_growths_outside" not in dropped_fields("Tick")
+        return cls(
+            str(tick_array.pubkey),
+            tick_array.start_tick_index,
+            [
+                WhirlpoolTickRow(
+                    tick.initialized,
+                    str(tick.liquidity_net),
+                    str(tick.liquidity_gross),
+                    str(tick.fee_growth_outside_a),
+                    str(tick.fee_growth_outside_b),
+                    (
+                        [str(g) for g in tick.reward_growths_outside]
+                        if rewards
+                        else UNSET
+                    ),
+                )
+                for tick in tick_array.ticks
+            ],
+            str(tick_array.whirlpool),
+        )
+
+
+class WhirlpoolPositionRewardInfoRow(msgspec.Struct):
+    growth_inside_checkpoint: str
+    amount_owed: str
+
+
+class WhirlpoolPositionRow(msgspec.Struct, omit_defaults=True):
+    pubkey: str
+    whirlpool: str
+    position_mint: str
+    liquidity: str
+    tick_lower_index: int
+    tick_upper_index: int
+    fee_growth_ckpt_a: str
+    fee_owed_a: str
+    fee_growth_ckpt_b: str
+    fee_owed_b: str
+    reward_infos: Union[List[WhirlpoolPositionRewardInfoRow], UnsetType]
+    extraction_timestamp: Optional[str] = None
+
+    @classmethod
+    def from_account(
+        cls, pos, extraction_timestamp: Optional[str] = None
+    ) -> "WhirlpoolPositionRow":
+        drop = dropped_fields("Position")
+        return cls(
+            str(pos.pubkey),
+            str(pos.whirlpool),
+            str(pos.position_mint),
+            str(pos.liquidity),
+            pos.tick_lower_index,
+            pos.tick_upper_index,
+            str(pos.fee_growth_checkpoint_a),
+            str(pos.fee_owed_a),
+            str(pos.fee_growth_checkpoint_b),
+            str(pos.fee_owed_b),
+            (
+                UNSET
+                if "reward_infos" in drop
+                else [
+                    WhirlpoolPositionRewardInfoRow(
+                        str(ri.growth_inside_checkpoint), str(ri.amount_owed)
+                    )
+                    for ri in pos.reward_infos
+                ]
+            ),
+            extraction_timestamp,
+        )
+
+
+# vaults (spl_token.decode_token_account output)
+
+
+class TokenAccountRow(msgspec.Struct):
+    mint: str
+    owner: str
+    amount: str
+    delegate: str
+    is_native: bool
+    delegated_amount: str
+    close_authority: str
+
+    @classmethod
+    def from_decoded(cls, account: dict) -> "TokenAccountRow":
+        return cls(
+            account["mint"],
+            account["owner"],
+            str(account["amount"]),
+            str(account["delegate"]),
+            account["is_native"],
+            str(account["delegated_amount"]),
+            str(account["close_authority"]),
+        )
+
+
+# Raydium CLMM (anchorpy-decoded accounts, see raydium_decoder.py)
+
+
+class RaydiumRewardInfoRow(msgspec.Struct, rename="camel"):
+    reward_state: int
+    open_time: str
+    end_time: str
+    last_update_time: str
+    emissions_per_second_x64: str
+    reward_total_emissioned: str
+    reward_claimed: str
+    token_mint: str
+    token_vault: str
+    authority: str
+    reward_growth_global_x64: str
+
+
+class PoolStateRow(msgspec.Struct, rename="camel"):
+    bump: List[int]
+    amm_config: str
+    owner: str
+    token_mint0: str
+    token_mint1: str
+    token_vault0: str
+    token_vault1: str
+    observation_key: str
+    mint_decimals0: int
+    mint_decimals1: int
+    tick_spacing: int
+    liquidity: str
+    sqrt_price_x64: str
+    tick_current: int
+    padding3: Union[int, UnsetType]
+    padding4: Union[int, UnsetType]
+    fee_growth_global0_x64: str
+    fee_growth_global1_x64: str
+    protocol_fees_token0: str
+    protocol_fees_token1: str
+    swap_in_amount_token0: str
+    swap_out_amount_token1: str
+    swap_in_amount_token1: str
+    swap_out_amount_token0: str
+    status: int
+    padding: Union[List[int], UnsetType]
+    reward_infos: Union[List[RaydiumRewardInfoRow], UnsetType]
+    tick_array_bitmap: List[str]
+    total_fees_token0: str
+    total_fees_claimed_token0: str
+    total_fees_token1: str
+    total_fees_claimed_token1: str
+    fund_fees_token0: Union[str, UnsetType]
+    fund_fees_token1: Union[str, UnsetType]
+    open_time: str
+    recent_epoch: str
+    padding1: Union[List[str], UnsetType]
+    padding2: Union[List[str], UnsetType]
+
+    @classmethod
+    def from_decoded(cls, decoded) -> "PoolStateRow":
+        drop = dropped_fields("PoolState")
+        return cls(
+            list(decoded.bump),
+            str(decoded.amm_config),
+            str(decoded.owner),
+            str(decoded.token_mint0),
+            str(decoded.token_mint1),
+            str(decoded.token_vault0),
+            str(decoded.token_vault1),
+            str(decoded.observation_key),
+            decoded.mint_decimals0,
+            decoded.mint_decimals1,
+            decoded.tick_spacing,
+            str(decoded.liquidity),
+            str(decoded.sqrt_price_x64),
+            decoded.tick_current,
+            UNSET if "padding3" in drop else decoded.padding3,
+            UNSET if "padding4" in drop else decoded.padding4,
+            str(decoded.fee_growth_global0_x64),
+            str(decoded.fee_growth_global1_x64),
+            str(decoded.protocol_fees_token0),
+            str(decoded.protocol_fees_token1),
+            str(decoded.swap_in_amount_token0),
+            str(decoded.swap_out_amount_token1),
+            str(decoded.swap_in_amount_token1),
+            str(decoded.swap_out_amount_token0),
+            decoded.status,
+            UNSET if "padding" in drop else list(decoded.padding),
+            (
+                UNSET
+                if "rewardInfos" in drop
+                else [
+                    RaydiumRewardInfoRow(
+                        reward.reward_state,
+                        str(reward.open_time),
+                        str(reward.end_time),
+                        str(reward.last_update_time),
+                        str(reward.emissions_per_second_x64),
+                        str(reward.reward_total_emissioned),
+                        str(reward.reward_claimed),
+                        str(reward.token_mint),
+                        str(reward.token_vault),
+                        str(reward.authority),
+                        str(reward.reward_growth_global_x64),
+                    )
+                    for reward in decoded.reward_infos
+                ]
+            ),
+            [str(bitmap) for bitmap in decoded.tick_array_bitmap],
+            str(decoded.total_fees_token0),
+            str(decoded.total_fees_claimed_token0),
+            str(decoded.total_fees_token1),
+            str(decoded.total_fees_claimed_token1),
+            UNSET if "fundFeesToken0" in drop else str(decoded.fund_fees_token0),
+            UNSET if "fundFeesToken1" in drop else str(decoded.fund_fees_token1),
+            str(decoded.open_time),
+            str(decoded.recent_epoch),
+            UNSET if "padding1" in drop else [str(p) for p in decoded.padding1],
+            UNSET if "padding2" in drop else [str(p) for p in decoded.padding2],
+        )
+
+
+class RaydiumTickRow(msgspec.Struct, rename="camel"):
+    initialized: bool
+    tick: int
+    liquidity_net: str
+    liquidity_gross: str
+    fee_growth_outside0_x64: str
+    fee_growth_outside1_x64: str
+    reward_growths_outside_x64: Union[List[str], UnsetType]
+
+
+class TickArrayStateRow(msgspec.Struct, rename="camel"):
+    pool_id: str
+    start_tick_index: int
+    ticks: List[RaydiumTickRow]
+
+    @classmethod
+    def from_decoded(cls, decoded) -> "TickArrayStateRow":
+        rewards = "rewardGrowthsOutsideX64" not in dropped_fields("TickState")
+        return cls(
+            str(decoded.pool_id),
+            decoded.start_tick_index,
+            [
+                RaydiumTickRow(
+                    getattr(tick, "initialized", False),
+                    tick.tick,
+                    str(tick.liquidity_net),
+                    str(tick.liquidity_gross),
+                    str(tick.fee_growth_outside0_x64),
+                    str(tick.fee_growth_outside1_x64),
+                    (
+                        [str(growth) for growth in tick.reward_growths_outside_x64]
+                        if rewards
+                        else UNSET
+                    ),
+                )
+                for tick in decoded.ticks
+                if hasattr(tick, "tick")
+            ],
+        )
+
+
+class PersonalRewardInfoRow(msgspec.Struct, rename="camel"):
+    growth_inside_last_x64: str
+    reward_amount_owed: str
+
+
+# Position rows carry the run's `extraction_timestamp` (the Raydium fetcher
+# stamps it on with msgspec.structs.replace); while unset it is left out, so
+# the output matches the decoders' dicts.
+
+
+class PersonalPositionRow(msgspec.Struct, rename="camel", omit_defaults=True):
+    nft_mint: str
+    pool_id: str
+    tick_lower_index: int
+    tick_upper_index: int
+    liquidity: str
+    fee_growth_inside0_last_x64: str
+    fee_growth_inside1_last_x64: str
+    token_fees_owed0: str
+    token_fees_owed1: str
+    reward_infos: Union[List[PersonalRewardInfoRow], UnsetType]
+    extraction_timestamp: Optional[str] = msgspec.field(
+        default=None, name="extraction_timestamp"
+    )
+
+    @classmethod
+    def from_decoded(cls, decoded) -> "PersonalPositionRow":
+        drop = dropped_fields("PersonalPositionState")
+        return cls(
+            str(decoded.nft_mint),
+            str(decoded.pool_id),
+            decoded.tick_lower_index,
+            decoded.tick_upper_index,
+            str(decoded.liquidity),
+            str(decoded.fee_growth_inside0_last_x64),
+            str(decoded.fee_growth_inside1_last_x64),
+            str(decoded.token_fees_owed0),
+            str(decoded.token_fees_owed1),
+            (
+                UNSET
+                if "rewardInfos" in drop
+                else [
+                    PersonalRewardInfoRow(
+                        str(reward.growth_inside_last_x64),
+                        str(reward.reward_amount_owed),
+                    )
+                    for reward in decoded.reward_infos
+                ]
+            ),
+        )
+
+
+class ProtocolPositionRow(msgspec.Struct, rename="camel", omit_defaults=True):
+    pool_id: str
+    tick_lower_index: int
+    tick_upper_index: int
+    liquidity: str
+    fee_growth_inside0_last_x64: str
+    fee_growth_inside1_last_x64: str
+    token_fees_owed0: str
+    token_fees_owed1: str
+    reward_growth_inside: Union[List[str], UnsetType]
+    extraction_timestamp: Optional[str] = msgspec.field(
+        default=None, name="extraction_timestamp"
+    )
+
+    @classmethod
+    def from_decoded(cls, decoded) -> "ProtocolPositionRow":
+        drop = dropped_fields("ProtocolPositionState")
+        return cls(
+            str(decoded.pool_id),
+            decoded.tick_lower_index,
+            decoded.tick_upper_index,
+            str(decoded.liquidity),
+            str(decoded.fee_growth_inside0_last_x64),
+            str(decoded.fee_growth_inside1_last_x64),
+            str(decoded.token_fees_owed0),
+            str(decoded.token_fees_owed1),
+            (
+                UNSET
+                if "rewardGrowthInside" in drop
+                else [str(growth) for growth in decoded.reward_growth_inside]
+            ),
+        )
@@ -0,0 +1,336 @@
+import asyncio
+import logging
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from functools import lru_cache
+from typing import Callable, Dict, List, Optional, Sequence, Union
+
+from solana.rpc.api import Client
+from solana.rpc.async_api import AsyncClient
+
+logger = logging.getLogger("dex")
+
+EWMA_ALPHA = 0.2  # weight of the newest sample in latency / error averages
+ERROR_PENALTY = 4.0  # score multiplier per unit of error rate
+EJECT_AFTER = 3  # consecutive failures before an endpoint is ejected
+EJECT_FOR = 30.0  # seconds an ejected endpoint is left out of rotation
+HEDGE_PERCENTILE = 0.95
+HEDGE_MIN_SAMPLES = 20  # below this, hedge after HEDGE_DEFAULT_DELAY
+HEDGE_DEFAULT_DELAY = 1.0
+HEDGE_MIN_DELAY = 0.05
+LATENCY_WINDOW = 200  # samples kept per endpoint and method for the percentile
+EXPLORE_RATE = 0.05  # share of calls led by a non-best endpoint to refresh its stats
+# reads too expensive to send twice; they still fail over on error
+UNHEDGED_METHODS = {"get_program_accounts"}
+
+
+def split_endpoints(urls: Union[str, Sequence[str]]) -> List[str]:
+    """Accepts one URL, a comma-separated list, or a sequence of URLs."""
+    if isinstance(urls, str):
+        urls = urls.split(",")
+    return [u.strip() for u in urls if u and u.strip()]
+
+
+def is_idempotent(method: str) -> bool:
+    """Reads can be hedged and failed over; anything else is sent once."""
+    return method.startswith("get_")
+
+
+def is_hedged(method: str) -> bool:
+    return is_idempotent(method) and method not in UNHEDGED_METHODS
+
+
+class EndpointStats:
+    """
+    Health of one RPC endpoint: EWMA latency and error rate, recent latency
+    samples per method for the hedge threshold, and ejection state.
+
+    The hedge threshold is kept per method because a method's latency says
+    little about another's: a `getMultipleAccounts` of 100 accounts is far
+    slower than `getSlot`, and would be hedged on nearly every call against
+    a threshold shared with it.
+    """
+
+    def __init__(self, url: str):
+        self.url = url
+        self.latency: Optional[float] = None
+        self.error_rate = 0.0
+        self.samples: Dict[str, deque] = {}
+        self.consecutive_failures = 0
+        self.ejected_until = 0.0
+        self.calls = 0
+        self.failures = 0
+        self._lock = threading.Lock()
+
+    def record_success(self, elapsed: float, method: str = "") -> None:
+        with self._lock:
+            self.calls += 1
+            samples = self.samples.get(method)
+            if samples is None:
+                samples = self.samples[method] = deque(maxlen=LATENCY_WINDOW)
+            samples.append(elapsed)
+            self.latency = (
+                elapsed
+                if self.latency is None
+                else EWMA_ALPHA * elapsed + (1 - EWMA_ALPHA) * self.latency
+            )
+            self.error_rate *= 1 - EWMA_ALPHA
+            self.consecutive_failures = 0
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self.calls += 1
+            self.failures += 1
+            self.error_rate = EWMA_ALPHA + (1 - EWMA_ALPHA) * self.error_rate
+            self.consecutive_failures += 1
+            if self.consecutive_failures >= EJECT_AFTER:
+                self.ejected_until = time.monotonic() + EJECT_FOR
+                self.consecutive_failures = 0
+                logger.info(f"Ejecting RPC endpoint {self.url} for {EJECT_FOR:.0f}s")
+
+    def ejected(self, now: float) -> bool:
+        return self.ejected_until > now
+
+    def score(self) -> float:
+        """Lower is better. Unmeasured endpoints score 0 so they get tried."""
+        return (self.latency or 0.0) * (1 + ERROR_PENALTY * self.error_rate)
+
+    def hedge_delay(self, method: str = "") -> float:
+        """
+        How long to wait on this endpoint before hedging a call: its p95
+        latency for `method`.
+        """
+        with self._lock:
+            samples = self.samples.get(method, ())
+            if len(samples) < HEDGE_MIN_SAMPLES:
+                return HEDGE_DEFAULT_DELAY
+            ordered = sorted(samples)
+        p95 = ordered[int(HEDGE_PERCENTILE * (len(ordered) - 1))]
+        return max(p95, HEDGE_MIN_DELAY)
+
+    def summary(self) -> Dict:
+        return {
+            "url": self.url,
+            "calls": self.calls,
+            "failures": self.failures,
+            "ewma_latency": self.latency,
+            "error_rate": round(self.error_rate, 4),
+            "ejected": self.ejected(time.monotonic()),
+        }
+
+
+# shared across routers so endpoint health survives from one run to the next
+_STATS: Dict[str, EndpointStats] = {}
+_STATS_LOCK = threading.Lock()
+
+
+def endpoint_stats(url: str) -> EndpointStats:
+    with _STATS_LOCK:
+        if url not in _STATS:
+            _STATS[url] = EndpointStats(url)
+        return _STATS[url]
+
+
+class _Router:
+    def __init__(self, urls: Union[str, Sequence[str]], make_client: Callable):
+        self.urls = split_endpoints(urls)
+        if not self.urls:
+            raise ValueError("At least one RPC endpoint is required")
+        self.clients = {url: make_client(url) for url in self.urls}
+        self.stats = {url: endpoint_stats(url) for url in self.urls}
+
+    def ranked(self) -> List[str]:
+        """
+        Endpoints in the order they should be tried, best first.
+
+        Ejected endpoints are left out unless every endpoint is ejected, in
+        which case the one due back soonest goes first. A small share of calls
+        is led by another healthy endpoint so one slow sample can't bench it
+        for good; the best endpoint is then next in line for the hedge.
+        """
+        now = time.monotonic()
+        healthy = [u for u in self.urls if not self.stats[u].ejected(now)]
+        if not healthy:
+            return sorted(self.urls, key=lambda u: self.stats[u].ejected_until)
+        ranked = sorted(healthy, key=lambda u: self.stats[u].score())
+        if len(ranked) > 1 and random.random() < EXPLORE_RATE:
+            ranked.insert(0, ranked.pop(random.randrange(1, len(ranked))))
+        return ranked
+
+    def summary(self) -> List[Dict]:
+        return [self.stats[u].summary() for u in self.urls]
+
+    def __getattr__(self, name: str):
+        if name.startswith("_"):
+            raise AttributeError(name)
+        attr = getattr(self.clients[self.urls[0]], name)
+        if not callable(attr):
+            return attr
+        return self._route(name)
+
+
+class RoutedClient(_Router):
+    """
+    Drop-in stand-in for `solana.rpc.api.Client` over several endpoints.
+
+    Each call goes to the endpoint with the best EWMA latency / error score.
+    Reads (`get_*`) fail over to the next endpoint on error, and if the
+    chosen endpoint hasn't answered within its p95 latency for the method the
+    same read is hedged to the runner-up; whichever answers first wins.
+    `UNHEDGED_METHODS` (program scans) only fail over. Endpoints that
+    fail `EJECT_AFTER` times in a row are ejected for `EJECT_FOR` seconds.
+    Once every candidate has failed the last error is raised, so callers'
+    retry policies still apply.
+    """
+
+    def __init__(self, urls: Union[str, Sequence[str]], max_workers: int = 16):
+        super().__init__(urls, Client)
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="rpc-hedge"
+        )
+
+    def _timed(self, url: str, method: str, args, kwargs):
+        start = time.perf_counter()
+        try:
+            result = getattr(self.clients[url], method)(*args, **kwargs)
+        except Exception:
+            self.stats[url].record_failure()
+            raise
+        self.stats[url].record_success(time.perf_counter() - start, method)
+        return result
+
+    def _route(self, method: str):
+        def call(*args, **kwargs):
+            candidates = self.ranked()
+            if not is_idempotent(method) or len(candidates) == 1:
+                return self._timed(candidates[0], method, args, kwargs)
+            return self._hedged(candidates, method, args, kwargs)
+
+        return call
+
+    def _hedged(self, candidates: List[str], method: str, args, kwargs):
+        pending = {}
+        last_exc: Optional[Exception] = None
+        next_idx = 0
+
+        def launch():
+            nonlocal next_idx
+            url = candidates[next_idx]
+            next_idx += 1
+            fut = self._executor.submit(self._timed, url, method, args, kwargs)
+            pending[fut] = url
+
+        launch()
+        while pending:
+            can_hedge = is_hedged(method) and next_idx < len(candidates)
+            timeout = (
+                self.stats[candidates[0]].hedge_delay(method) if can_hedge else None
+            )
+            done, _ = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+            if not done:
+                launch()
+                continue
+            for fut in done:
+                pending.pop(fut)
+                try:
+                    return fut.result()
+                except Exception as exc:
+                    last_exc = exc
+            if not pending and next_idx < len(candidates):
+                launch()
+        raise last_exc
+
+    def close(self) -> None:
+        self._executor.shutdown(wait=False)
+
+
+class AsyncRoutedClient(_Router):
+    """`RoutedClient` for `solana.rpc.async_api.AsyncClient`, hedging with tasks."""
+
+    def __init__(self, urls: Union[str, Sequence[str]]):
+        super().__init__(urls, AsyncClient)
+
+    async def _timed(self, url: str, method: str, args, kwargs):
+        start = time.perf_counter()
+        try:
+            result = await getattr(self.clients[url], method)(*args, **kwargs)
+        except Exception:
+            self.stats[url].record_failure()
+            raise
+        self.stats[url].record_success(time.perf_counter() - start, method)
+        return result
+
+    def _route(self, method: str):
+        async def call(*args, **kwargs):
+            candidates = self.ranked()
+            if not is_idempotent(method) or len(candidates) == 1:
+                return await self._timed(candidates[0], method, args, kwargs)
+            return await self._hedged(candidates, method, args, kwargs)
+
+        return call
+
+    async def _hedged(self, candidates: List[str], method: str, args, kwargs):
+        pending = set()
+        last_exc: Optional[Exception] = None
+        next_idx = 0
+
+        def launch():
+            nonlocal next_idx
+            url = candidates[next_idx]
+            next_idx += 1
+            pending.add(asyncio.ensure_future(self._timed(url, method, args, kwargs)))
+
+        launch()
+        try:
+            while pending:
+                can_hedge = is_hedged(method) and next_idx < len(candidates)
+                timeout = (
+                    self.stats[candidates[0]].hedge_delay(method)
+                    if can_hedge
+                    else None
+                )
+                done, _ = await asyncio.wait(
+                    pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED
+                )
+                if not done:
+                    launch()
+                    continue
+                for task in done:
+                    pending.discard(task)
+                    try:
+                        return task.result()
+                    except Exception as exc:
+                        last_exc = exc
+                if not pending and next_idx < len(candidates):
+                    launch()
+            raise last_exc
+        finally:
+            for task in pending:
+                task.cancel()
+
+    async def close(self) -> None:
+        await asyncio.gather(*(c.close() for c in self.clients.values()))
+
+
+@lru_cache(maxsize=None)
+def routed_client(urls: str) -> RoutedClient:
+    """
+    Shared `RoutedClient` for a comma-separated endpoint list, so every
+    fetcher in the process reuses one set of connections and hedge threads.
+    """
+    return RoutedClient(urls)
+
+
+def log_endpoint_summary(router: _Router) -> None:
+    """Logs per-endpoint calls, failures and latency at the end of a run."""
+    for stats in router.summary():
+        latency = stats["ewma_latency"]
+        logger.info(
+            f"RPC {stats['url']}: calls={stats['calls']} "
+            f"failures={stats['failures']} "
+            f"ewma_latency={'n/a' if latency is None else f'{latency:.3f}s'}"
+            f"{' (ejected)' if stats['ejected'] else ''}"
+        )
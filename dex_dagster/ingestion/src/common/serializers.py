@@ -1,3 +1,11 @@
+from msgspec import UNSET
+
+from dex_dagster.ingestion.src.common.field_profiles import (
+    dropped_fields,
+    without_unset,
+)
+
+
 def serialize_whirlpool_reward_info(reward_info):
     return {
         "mint": str(reward_info.mint),
@@ -21,13 +29,22 @@ def serialize_token_accounts(token_accounts):
 
 
 def serialize_whirlpool(whirlpool, whirlpool_pubkey, token):
-    return {
+    drop = dropped_fields("Whirlpool")
+    row = {
         "pubkey": str(whirlpool_pubkey),
         "token": token,
         "whirlpools_config": str(whirlpool.whirlpools_config),
-        "whirlpool_bump": [int(b) for b in whirlpool.whirlpool_bump],
+        "whirlpool_bump": (
+            UNSET
+            if "whirlpool_bump" in drop
+            else [int(b) for b in whirlpool.whirlpool_bump]
+        ),
         "tick_spacing": whirlpool.tick_spacing,
-        "tick_spacing_seed": [int(s) for s in whirlpool.tick_spacing_seed],
+        "tick_spacing_seed": (
+            UNSET
+            if "tick_spacing_seed" in drop
+            else [int(s) for s in whirlpool.tick_spacing_seed]
+        ),
         "fee_rate": whirlpool.fee_rate,
         "protocol_fee_rate": whirlpool.protocol_fee_rate,
         "liquidity": str(whirlpool.liquidity),
@@ -42,13 +59,17 @@ def serialize_whirlpool(whirlpool, whirlpool_pubkey, token):
         "token_vault_b": str(whirlpool.token_vault_b),
         "fee_growth_global_b": str(whirlpool.fee_growth_global_b),
         "reward_last_updated_timestamp": whirlpool.reward_last_updated_timestamp,
-        "reward_infos": [
-            serialize_whirlpool_reward_info(ri) for ri in whirlpool.reward_infos
-        ],
+        "reward_infos": (
+            UNSET
+            if "reward_infos" in drop
+            else [serialize_whirlpool_reward_info(ri) for ri in whirlpool.reward_infos]
+        ),
     }
+    return without_unset(row)
 
 
 def serialize_tick_array(tick_array):
+    rewards = "reward_growths_outside" not in dropped_fields("Tick")
     return {
         "pubkey": str(tick_array.pubkey),
         "start_tick_index": tick_array.start_tick_index,
@@ -59,7 +80,15 @@ def serialize_tick_array(tick_array):
                 "liquidity_gross": str(tick.liquidity_gross),
                 "fee_growth_outside_a": str(tick.fee_growth_outside_a),
                 "fee_growth_outside_b": str(tick.fee_growth_outside_b),
-                "reward_growths_outside": [str(g) for g in tick.reward_growths_outside],
+                **(
+                    {
+                        "reward_growths_outside": [
+                            str(g) for g in tick.reward_growths_outside
+                        ]
+                    }
+                    if rewards
+                    else {}
+                ),
             }
             for tick in tick_array.ticks
         ],
@@ -87,7 +116,8 @@ def serialize_position_reward_info(ri):
 def serialize_position(pos):
     if pos is None:
         return None
-    return {
+    drop = dropped_fields("Position")
+    row = {
         "pubkey": str(pos.pubkey),
         "whirlpool": str(pos.whirlpool),
         "position_mint": str(pos.position_mint),
@@ -98,5 +128,10 @@ def serialize_position(pos):
         "fee_owed_a": str(pos.fee_owed_a),
         "fee_growth_ckpt_b": str(pos.fee_growth_checkpoint_b),
         "fee_owed_b": str(pos.fee_owed_b),
-        "reward_infos": [serialize_position_reward_info(ri) for ri in pos.reward_infos],
+        "reward_infos": (
+            UNSET
+            if "reward_infos" in drop
+            else [serialize_position_reward_info(ri) for ri in pos.reward_infos]
+        ),
     }
+    return without_unset(row)
@@ -0,0 +1,541 @@
+"""
+Sharded snapshot runs: a token's pools split across several workers.
+
+A run is bounded by one process and one RPC endpoint's rate limit. A sharded
+run splits the token's pools over K workers by consistent hashing
+(`HashRing`). Each worker is an ordinary run (`run_raydium` / `run_orca` with
+`shard=`) with its own RPC endpoint, rate limit and spool, and uploads its
+rows as part objects next to the usual ones:
+
+    .../kind=<k>/.../<YYYY-MM-DD_HH-MM-SS>_<kind>.part-<i>-of-<K>.json
+
+plus a part manifest under kind=manifest. The S3Queue tables ingest parts
+like any other object. Workers share the run's extraction timestamp, and
+none of them writes a snapshot index row or updates the pool schedule:
+`finalize_snapshot` merges the part manifests into the run's manifest and
+writes its single index row, so the snapshot only becomes visible to the
+models (`latest_pool_snapshot`) once every part is in, and records the
+pool observations the parts carry in the schedule in one update, so
+workers never overwrite each other's.
+
+Workers can be:
+
+- processes on one box: `run_sharded` starts them and finalizes (what the
+  snapshot assets do with SolanaConfig.snapshot_shards > 1),
+- separate nodes or Dagster runs: start one `worker` per shard with the same
+  run id and extraction timestamp, then `finalize` once they are all done:
+
+    python -m dex_dagster.ingestion.src.common.sharding worker raydium \\
+        --shard 0/4 --run-id R --extraction-timestamp "2025-06-01 13:00:00" \\
+        --rpc-url https://...
+    python -m dex_dagster.ingestion.src.common.sharding finalize raydium \\
+        --shards 4 --extraction-timestamp "2025-06-01 13:00:00"
+
+Consistent hashing keeps a pool on the same shard while K is unchanged and
+moves only about 1/K of the pools when a worker is added, so per-worker state
+(account cache, endpoint stats) stays warm. Each worker reads the token's
+pools from its own pool registry; workers whose registries disagree can miss
+a pool for a run, or both read it (the landing tables deduplicate that).
+"""
+
+import argparse
+import asyncio
+import bisect
+import hashlib
+import logging
+import multiprocessing
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from datetime import datetime
+from functools import lru_cache
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from dex_dagster.ingestion.src.common.archive import archive_snapshot
+from dex_dagster.ingestion.src.common.checkpoint import RunSpool
+from dex_dagster.ingestion.src.common.constants import (
+    ORCA_RPC,
+    ORCA_STORAGE_KEY,
+    RAYDIUM_RPC,
+    RAYDIUM_STORAGE_KEY,
+    TOKEN_MINT,
+)
+from dex_dagster.ingestion.src.common.pool_schedule import record_snapshot
+from dex_dagster.ingestion.src.common.utility import (
+    build_run_manifest,
+    build_snapshot_index,
+    ensure_uploaded,
+    failed_uploads,
+    get_s3_bucket,
+    read_from_s3,
+    snapshot_key,
+    upload_objects,
+    upload_to_s3,
+)
+
+logger = logging.getLogger("dex")
+
+STORAGE_KEYS = {"raydium": RAYDIUM_STORAGE_KEY, "orca": ORCA_STORAGE_KEY}
+DEFAULT_RPC = {"raydium": RAYDIUM_RPC, "orca": ORCA_RPC}
+
+# points per shard on the ring; more evens out the split. With 128, shards
+# stay within ~15% of an even share up to 8 shards
+RING_VNODES = 128
+
+
+def _point(key: str) -> int:
+    return int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(), "big")
+
+
+class HashRing:
+    """
+    Consistent hash ring over `shards` shards, `vnodes` points each.
+
+    A pool belongs to the shard owning the first point at or after its hash.
+    """
+
+    def __init__(self, shards: int, vnodes: int = RING_VNODES):
+        points = sorted(
+            (_point(f"shard-{s}-{v}"), s) for s in range(shards) for v in range(vnodes)
+        )
+        self._points = [p for p, _ in points]
+        self._shards = [s for _, s in points]
+
+    def shard_of(self, pool: str) -> int:
+        i = bisect.bisect_left(self._points, _point(pool)) % len(self._points)
+        return self._shards[i]
+
+
+@lru_cache(maxsize=None)
+def hash_ring(shards: int) -> HashRing:
+    return HashRing(shards)
+
+
+@dataclass(frozen=True)
+class Shard:
+    """Shard `index` of a run split `count` ways."""
+
+    index: int
+    count: int
+
+    def __post_init__(self):
+        if not 0 <= self.index < self.count:
+            raise ValueError(f"Shard {self.index} out of range for {self.count}")
+
+    @classmethod
+    def parse(cls, spec: str) -> "Shard":
+        """From "<index>/<count>", e.g. "0/4"."""
+        index, count = spec.split("/")
+        return cls(int(index), int(count))
+
+    @property
+    def label(self) -> str:
+        return f"part-{self.index}-of-{self.count}"
+
+    def select(self, pools: Iterable[str]) -> List[str]:
+        """The pools of `pools` this shard snapshots, in their order."""
+        ring = hash_ring(self.count)
+        return [pool for pool in pools if ring.shard_of(pool) == self.index]
+
+
+def part_key(key: str, shard: Shard) -> str:
+    """`key` of a snapshot object, for one shard's part of it."""
+    return f"{key.removesuffix('.json')}.{shard.label}.json"
+
+
+def upload_snapshot_part(
+    bucket: str,
+    storage_key: str,
+    protocol: str,
+    token: str,
+    extraction_timestamp: str,
+    outputs: dict,
+    slot_range: Tuple[int, int],
+    pools: List[str],
+    shard: Shard,
+    assigned: List[str],
+    observations: Optional[List[dict]] = None,
+    deferred: Optional[List[str]] = None,
+    failed: Optional[List[str]] = None,
+) -> dict:
+    """
+    Uploads one shard's part of every snapshot kind and its part manifest,
+    and returns the part manifest (with `manifest_key`). Unlike
+    `upload_snapshot`, no index row is written and the pool schedule isn't
+    updated; the part manifest carries the pool observations, deferred and
+    failed pools for `finalize_snapshot` to do that.
+
+    Args:
+        bucket (str): S3 bucket name
+        storage_key (str): Protocol storage prefix, e.g. RAYDIUM_STORAGE_KEY
+        protocol (str): Protocol name, e.g. "raydium" or "orca"
+        token (str): Token mint the snapshot was taken for
+        extraction_timestamp (str): Timestamp shared by every shard of the run
+        outputs (dict): Rows per snapshot kind
+        slot_range (Tuple[int, int]): First and last slot observed by the shard
+        pools (List[str]): Pools the part covers
+        shard (Shard): The shard that read them
+        assigned (List[str]): Pools assigned to the shard
+        observations (Optional[List[dict]]): The shard's pool observations,
+            see `snapshot_observations`
+        deferred (Optional[List[str]]): Pools the shard deferred at its deadline
+        failed (Optional[List[str]]): Pools the shard failed to fetch
+    """
+
+    def key(kind: str) -> str:
+        return part_key(
+            snapshot_key(storage_key, protocol, kind, token, extraction_timestamp),
+            shard,
+        )
+
+    what = f"the {protocol} {shard.label} of {extraction_timestamp}"
+    objects = upload_objects(bucket, {kind: key(kind) for kind in outputs}, outputs)
+    # a part manifest is only written once every object is there, so
+    # finalize_snapshot never merges a part with missing objects
+    ensure_uploaded(objects, what)
+    manifest = build_run_manifest(
+        protocol, token, extraction_timestamp, objects, slot_range
+    )
+    manifest = {
+        **manifest,
+        "shard": {"index": shard.index, "count": shard.count},
+        "pools": pools,
+        "assigned_pools": assigned,
+        "observations": observations or [],
+        "deferred_pools": deferred or [],
+        "failed_pools": failed or [],
+    }
+    size = upload_to_s3(bucket, key("manifest"), manifest)
+    ensure_uploaded({"manifest": {"bytes": size}}, what)
+    return {**manifest, "manifest_key": key("manifest")}
+
+
+def merge_part_manifests(
+    parts: List[dict],
+) -> Tuple[dict, Tuple[int, int], List[str]]:
+    """
+    Objects, slot range and pools of a run from the manifests of its parts.
+
+    Objects are merged per kind into {"rows", "bytes", "parts"}, with the
+    part objects' keys under "parts".
+    """
+    objects: Dict[str, dict] = {}
+    for part in parts:
+        for kind, obj in part["objects"].items():
+            merged = objects.setdefault(kind, {"rows": 0, "bytes": 0, "parts": []})
+            merged["rows"] += obj["rows"]
+            merged["bytes"] += obj["bytes"]
+            merged["parts"].append(obj["key"])
+    slot_range = (
+        min(part["slot_range"]["first"] for part in parts),
+        max(part["slot_range"]["last"] for part in parts),
+    )
+    pools = [pool for part in parts for pool in part["pools"]]
+    return objects, slot_range, pools
+
+
+def finalize_snapshot(
+    bucket: str,
+    protocol: str,
+    token: str,
+    extraction_timestamp: str,
+    shards: int,
+    full_run: bool = True,
+) -> dict:
+    """
+    Merges the part manifests of a sharded run into its manifest and writes
+    its snapshot index row, then records the run in the pool schedule from
+    the observations, deferred and failed pools of every part.
+
+    Fails if any shard has not uploaded its part, or any object of it, so a
+    run is never indexed with pools missing; run it again once the missing
+    shards are done.
+
+    Args:
+        bucket (str): S3 bucket name
+        protocol (str): Protocol name, e.g. "raydium" or "orca"
+        token (str): Token mint the snapshot was taken for
+        extraction_timestamp (str): Timestamp shared by every shard of the run
+        shards (int): Number of shards the run was split into
+        full_run (bool): Whether the shards covered every pool of the token
+            rather than the scheduled ones (see `record_snapshot`)
+
+    Returns:
+        dict: The run manifest (with `manifest_key` and `index`)
+    """
+    storage_key = STORAGE_KEYS[protocol]
+
+    def key(kind: str) -> str:
+        return snapshot_key(storage_key, protocol, kind, token, extraction_timestamp)
+
+    parts, missing = [], []
+    for shard in (Shard(i, shards) for i in range(shards)):
+        try:
+            part = read_from_s3(bucket, part_key(key("manifest"), shard))
+        except Exception as exc:
+            logger.warning(f"No {shard.label} manifest for {protocol}: {exc}")
+            missing.append(shard.label)
+            continue
+        failed = failed_uploads(part["objects"])
+        if failed:
+            logger.warning(f"{protocol} {shard.label} failed to upload {failed}")
+            missing.append(shard.label)
+            continue
+        parts.append(part)
+    if missing:
+        raise RuntimeError(
+            f"Can't finalize the {protocol} snapshot of {extraction_timestamp}: "
+            f"missing {missing}"
+        )
+
+    objects, slot_range, pools = merge_part_manifests(parts)
+    index = build_snapshot_index(
+        protocol=protocol,
+        token=token,
+        extraction_timestamp=extraction_timestamp,
+        row_counts={kind: obj["rows"] for kind, obj in objects.items()},
+        object_keys={
+            f"{kind}.{Shard(**part['shard']).label}": obj["key"]
+            for part in parts
+            for kind, obj in part["objects"].items()
+        },
+        pools=pools,
+    )
+    what = f"the {protocol} snapshot of {extraction_timestamp}"
+    size = upload_to_s3(bucket, key("snapshot_index"), [index])
+    objects["snapshot_index"] = {"key": key("snapshot_index"), "rows": 1, "bytes": size}
+    ensure_uploaded(objects, what)
+
+    manifest = build_run_manifest(
+        protocol, token, extraction_timestamp, objects, slot_range
+    )
+    size = upload_to_s3(bucket, key("manifest"), manifest)
+    ensure_uploaded({"manifest": {"bytes": size}}, what)
+    logger.info(
+        f"Finalized {protocol} snapshot of {extraction_timestamp}: "
+        f"{shards} parts, {len(pools)} pools"
+    )
+
+    try:
+        archive_snapshot(
+            protocol,
+            token,
+            extraction_timestamp,
+            {"snapshot_index": [index]},
+            part="index",
+        )
+    except Exception as exc:
+        # best-effort: the snapshot is already uploaded
+        logger.warning(f"Failed to archive snapshot index locally: {exc}")
+    schedule = record_snapshot(
+        protocol,
+        token,
+        {},
+        all_pools=[p for part in parts for p in part["assigned_pools"]]
+        if full_run
+        else None,
+        deferred=[
+            pool
+            for part in parts
+            for pool in part.get("deferred_pools", []) + part.get("failed_pools", [])
+        ],
+        observations=[obs for part in parts for obs in part.get("observations", [])],
+    )
+    return {
+        **manifest,
+        "manifest_key": key("manifest"),
+        "index": index,
+        "schedule": schedule,
+    }
+
+
+def run_shard(
+    protocol: str,
+    token: str,
+    rpc_url: str,
+    shard: Shard,
+    extraction_timestamp: str,
+    run_id: Optional[str] = None,
+    **options,
+) -> dict:
+    """
+    Runs one shard of a snapshot in this process and returns its part
+    manifest; `options` are passed on to `run_raydium` / `run_orca`.
+    """
+    # imported here so the protocol modules load in the worker process only
+    if protocol == "raydium":
+        from dex_dagster.ingestion.src.protocols.raydium import run_raydium
+
+        return run_raydium(
+            token,
+            rpc_url,
+            run_id,
+            shard=shard,
+            extraction_timestamp=extraction_timestamp,
+            **options,
+        )
+    if protocol == "orca":
+        from dex_dagster.ingestion.src.protocols.orca import run_orca
+
+        return asyncio.run(
+            run_orca(
+                token,
+                rpc_url,
+                run_id,
+                shard=shard,
+                extraction_timestamp=extraction_timestamp,
+                **options,
+            )
+        )
+    raise ValueError(f"Unknown protocol {protocol!r}")
+
+
+def run_sharded(
+    protocol: str,
+    token: str,
+    rpc_urls: List[str],
+    shards: int,
+    run_id: Optional[str] = None,
+    **options,
+) -> dict:
+    """
+    Snapshots `token` with `shards` worker processes and finalizes the run.
+
+    Shard i reads through `rpc_urls[i % len(rpc_urls)]`, so give one endpoint
+    (or API key) per shard to multiply the rate budget. Calling again with the
+    same `run_id` resumes: shards whose part is already uploaded are not run
+    again, the others resume from their spools. `options` are passed on to
+    `run_raydium` / `run_orca`, e.g. `pools` for a scheduled run.
+
+    Returns:
+        dict: The run manifest, with each shard's pipeline counters, cache hit
+        rates, deferred and failed pools
+    """
+    # the parent's spool only pins the extraction timestamp, for resumes
+    spool = RunSpool(protocol, token, run_id)
+    extraction_timestamp = spool.start(str(datetime.now()))
+    bucket = get_s3_bucket()
+    manifest_key = snapshot_key(
+        STORAGE_KEYS[protocol], protocol, "manifest", token, extraction_timestamp
+    )
+
+    parts: Dict[Shard, dict] = {}
+    pending = []
+    for shard in (Shard(i, shards) for i in range(shards)):
+        try:
+            part = read_from_s3(bucket, part_key(manifest_key, shard))
+        except Exception:
+            pending.append(shard)
+            continue
+        if failed_uploads(part["objects"]):
+            pending.append(shard)
+            continue
+        parts[shard] = part
+        logger.info(f"{protocol} {shard.label} already uploaded")
+
+    # spawn: the workers must not inherit the parent's event loop, clients or
+    # sqlite connections
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max(1, len(pending)), mp_context=context) as pool:
+        futures = {
+            shard: pool.submit(
+                run_shard,
+                protocol,
+                token,
+                rpc_urls[shard.index % len(rpc_urls)],
+                shard,
+                extraction_timestamp,
+                f"{spool.run_id}-{shard.label}",
+                **options,
+            )
+            for shard in pending
+        }
+        for shard, future in futures.items():
+            parts[shard] = future.result()
+
+    manifest = finalize_snapshot(
+        bucket,
+        protocol,
+        token,
+        extraction_timestamp,
+        shards,
+        full_run=not options.get("pools"),
+    )
+    spool.cleanup()
+
+    ordered = sorted(parts.items(), key=lambda item: item[0].index)
+    manifest["shards"] = {
+        shard.label: {
+            "pools": len(part["pools"]),
+            "pipeline": part.get("pipeline"),
+            "cache_hit_rates": part.get("cache_hit_rates"),
+        }
+        for shard, part in ordered
+    }
+    manifest["deferred_pools"] = [
+        pool for _, part in ordered for pool in part.get("deferred_pools", [])
+    ]
+    manifest["failed_pools"] = [
+        pool for _, part in ordered for pool in part.get("failed_pools", [])
+    ]
+    manifest["field_profile"] = ordered[0][1].get("field_profile")
+    return manifest
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    worker = commands.add_parser("worker", help="snapshot one shard")
+    worker.add_argument("protocol", choices=sorted(STORAGE_KEYS))
+    worker.add_argument("--shard", type=Shard.parse, required=True, help="i/K")
+    worker.add_argument("--run-id", required=True)
+    worker.add_argument("--extraction-timestamp", required=True)
+    worker.add_argument("--rpc-url", help="default: the protocol's RPC from env")
+    worker.add_argument("--token", default=TOKEN_MINT)
+    worker.add_argument("--time-budget", type=float)
+
+    finalize = commands.add_parser("finalize", help="merge the shards' parts")
+    finalize.add_argument("protocol", choices=sorted(STORAGE_KEYS))
+    finalize.add_argument("--shards", type=int, required=True)
+    finalize.add_argument("--extraction-timestamp", required=True)
+    finalize.add_argument("--token", default=TOKEN_MINT)
+    finalize.add_argument(
+        "--scheduled",
+        action="store_true",
+        help="the shards read the scheduled pools, not every pool",
+    )
+    args = parser.parse_args(argv)
+
+    if args.command == "worker":
+        run_shard(
+            args.protocol,
+            args.token,
+            args.rpc_url or DEFAULT_RPC[args.protocol],
+            args.shard,
+            # validated here rather than as a key error after the whole run
+            str(datetime.fromisoformat(args.extraction_timestamp)),
+            args.run_id,
+            time_budget=args.time_budget,
+        )
+    else:
+        finalize_snapshot(
+            get_s3_bucket(),
+            args.protocol,
+            args.token,
+            str(datetime.fromisoformat(args.extraction_timestamp)),
+            args.shards,
+            full_run=not args.scheduled,
+        )
+    return 0
+
+
+if __name__ == "__main__":
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s | %(levelname)-8s | %(name)s | %(message)s",
+        datefmt="%Y-%m-%d %H:%M:%S",
+    )
+    sys.exit(main())
@@ -0,0 +1,151 @@
+import struct
+from typing import Callable, Dict, Iterable, Iterator, List, Optional
+
+from solders.pubkey import Pubkey
+
+from dex_dagster.ingestion.src.common.account_cache import (
+    AccountCache,
+    get_account_cache,
+)
+
+# getMultipleAccounts accepts at most 100 pubkeys per call
+MAX_MULTIPLE_ACCOUNTS = 100
+
+# SPL token account base layout (Token-2022 accounts append extensions after it)
+TOKEN_ACCOUNT_SIZE = 165
+# mint_authority COption<Pubkey> (36) + supply u64 (8), then decimals u8
+MINT_DECIMALS_OFFSET = 44
+
+_TOKEN_ACCOUNT = struct.Struct("<32s32sQI32sBIQQI32s")
+
+
+def chunked(
+    items: List[str], size: int = MAX_MULTIPLE_ACCOUNTS
+) -> Iterator[List[str]]:
+    """Splits a list of addresses into getMultipleAccounts-sized chunks."""
+    for i in range(0, len(items), size):
+        yield items[i : i + size]
+
+
+def _pubkey(raw: bytes) -> str:
+    return str(Pubkey.from_bytes(raw))
+
+
+def decode_token_account(data: bytes) -> Optional[Dict]:
+    """
+    Decodes an SPL token account without an RPC round trip.
+
+    Args:
+        data (bytes): Raw account data
+
+    Returns:
+        Optional[Dict]: Fields as produced by `serialize_token_accounts`, with
+            `amount` as an int, or None if the buffer is not a token account.
+    """
+    if len(data) < TOKEN_ACCOUNT_SIZE:
+        return None
+    (
+        mint,
+        owner,
+        amount,
+        delegate_option,
+        delegate,
+        _state,
+        is_native_option,
+        _rent_exempt_reserve,
+        delegated_amount,
+        close_authority_option,
+        close_authority,
+    ) = _TOKEN_ACCOUNT.unpack_from(data)
+    return {
+        "mint": _pubkey(mint),
+        "owner": _pubkey(owner),
+        "amount": amount,
+        "delegate": _pubkey(delegate) if delegate_option else None,
+        "is_native": bool(is_native_option),
+        "delegated_amount": delegated_amount,
+        "close_authority": (
+            _pubkey(close_authority) if close_authority_option else None
+        ),
+    }
+
+
+def decode_mint_decimals(data: bytes) -> Optional[int]:
+    """Reads `decimals` from a raw SPL mint account."""
+    if len(data) <= MINT_DECIMALS_OFFSET:
+        return None
+    return data[MINT_DECIMALS_OFFSET]
+
+
+def ui_amount_string(amount: int, decimals: int) -> str:
+    """
+    Formats a raw token amount the way RPC `uiAmountString` does: scaled by
+    `decimals` with trailing zeros trimmed.
+    """
+    if decimals == 0:
+        return str(amount)
+    digits = str(amount).rjust(decimals + 1, "0")
+    return f"{digits[:-decimals]}.{digits[-decimals:]}".rstrip("0").rstrip(".")
+
+
+def serialize_token_account(account: Dict) -> Dict:
+    """Same output as `serialize_token_accounts` for a locally decoded account."""
+    return {
+        "mint": account["mint"],
+        "owner": account["owner"],
+        "amount": str(account["amount"]),
+        "delegate": str(account["delegate"]),
+        "is_native": account["is_native"],
+        "delegated_amount": str(account["delegated_amount"]),
+        "close_authority": str(account["close_authority"]),
+    }
+
+
+def vault_balance(address: str, account: Dict, decimals: int) -> Dict:
+    """Same output as the Raydium `tokenVault0`/`tokenVault1` blocks."""
+    return {
+        "address": address,
+        "balance": str(account["amount"]),
+        "decimals": decimals,
+        "amount": ui_amount_string(account["amount"], decimals),
+    }
+
+
+class MintCache:
+    """
+    Mint decimals, kept in memory and in the local account cache.
+
+    Decimals never change for a mint, so they are seeded from data we already
+    have (e.g. Raydium pool state) and only fetched for mints not seen yet.
+    """
+
+    def __init__(self, store_factory: Callable[[], AccountCache] = get_account_cache):
+        self._decimals: Dict[str, int] = {}
+        self._store_factory = store_factory
+
+    def seed(self, mint: str, decimals: int) -> None:
+        if mint not in self._decimals:
+            self._decimals[mint] = int(decimals)
+            self._store_factory().put("mint_decimals", mint, int(decimals))
+
+    def get(self, mint: str) -> Optional[int]:
+        if mint not in self._decimals:
+            decimals = self._store_factory().get("mint_decimals", mint)
+            if decimals is None:
+                return None
+            self._decimals[mint] = decimals
+        return self._decimals[mint]
+
+    def missing(self, mints: Iterable[str]) -> List[str]:
+        """Mints without known decimals, deduplicated, in first-seen order."""
+        return [m for m in dict.fromkeys(mints) if self.get(m) is None]
+
+    def update(self, accounts: Dict[str, Optional[bytes]]) -> None:
+        """Records decimals from raw mint accounts keyed by mint address."""
+        for mint, data in accounts.items():
+            decimals = decode_mint_decimals(data) if data else None
+            if decimals is not None:
+                self.seed(mint, decimals)
+
+
+mint_cache = MintCache()
@@ -1,26 +1,40 @@
-import json
 import os
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
+from functools import lru_cache
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
 
-import boto3
-from dotenv import load_dotenv
-
-load_dotenv()
-
+from dex_dagster.ingestion.src.common.rows import decode_json, encode_json
 
 STORAGE_ACCESS_KEY = os.getenv("STORAGE_ACCESS_KEY")
 STORAGE_SECRET_KEY = os.getenv("STORAGE_SECRET_KEY")
 STORAGE_ENDPOINT_URL = os.getenv("STORAGE_ENDPOINT_URL")
 STORAGE_BUCKET_NAME = os.getenv("STORAGE_BUCKET_NAME")
+# prefix of the state documents in the snapshot bucket (read_state)
+STATE_PREFIX = os.getenv("SNAPSHOT_STATE_PREFIX", "state")
+
+
+@lru_cache(maxsize=None)
+def get_s3_client():
+    """
+    Returns the shared boto3 S3 client, creating it on first use.
+
+    boto3 is slow to import and to build clients, so this is deferred until an
+    asset actually writes to storage rather than paid when the code location loads.
+    """
+    import boto3
 
-S3 = boto3.client(
-    "s3",
-    aws_access_key_id=STORAGE_ACCESS_KEY,
-    aws_secret_access_key=STORAGE_SECRET_KEY,
-)
+    return boto3.client(
+        "s3",
+        aws_access_key_id=STORAGE_ACCESS_KEY,
+        aws_secret_access_key=STORAGE_SECRET_KEY,
+        endpoint_url=STORAGE_ENDPOINT_URL,
+    )
 
 
-def upload_to_s3(bucket: str, key: str, data: dict, log: bool = True) -> None:
+def upload_to_s3(bucket: str, key: str, data: dict, log: bool = True) -> Optional[int]:
     """
     Uploads a dictionary as a JSON file to an S3 bucket.
 
@@ -29,18 +43,213 @@ def upload_to_s3(bucket: str, key: str, data: dict, log: bool = True) -> None:
         key (str): S3 object key (path in the bucket)
         data (dict): Python dictionary to upload
         log (bool): Whether to print success log
+
+    Returns:
+        Size of the uploaded object in bytes, or None if the upload failed.
     """
     try:
-        S3.put_object(
+        body = encode_json(data)
+        get_s3_client().put_object(
             Bucket=bucket,
             Key=key,
-            Body=json.dumps(data, indent=2),
+            Body=body,
             ContentType="application/json",
         )
         if log:
             print(f"Uploaded to s3://{bucket}/{key}")
+        return len(body)
     except Exception as e:
         print(f"Failed to upload to S3: {e}")
+        return None
+
+
+def upload_rows(bucket: str, key: str, rows: Iterable) -> Tuple[int, Optional[int]]:
+    """
+    Uploads rows as a JSON array, one compact row per line, streamed through
+    a temporary file so they never have to be in memory together.
+
+    Args:
+        bucket (str): S3 bucket name
+        key (str): S3 object key (path in the bucket)
+        rows (Iterable): Rows to upload (dicts, row structs or `msgspec.Raw`)
+
+    Returns:
+        Number of rows, and size of the uploaded object in bytes or None if
+        the upload failed.
+    """
+    count = 0
+    try:
+        with tempfile.TemporaryFile() as out:
+            out.write(b"[")
+            for row in rows:
+                out.write(b",\n" if count else b"\n")
+                out.write(encode_json(row, indent=0))
+                count += 1
+            out.write(b"\n]")
+            size = out.tell()
+            out.seek(0)
+            get_s3_client().upload_fileobj(
+                out, bucket, key, ExtraArgs={"ContentType": "application/json"}
+            )
+        print(f"Uploaded to s3://{bucket}/{key}")
+        return count, size
+    except Exception as e:
+        print(f"Failed to upload to S3: {e}")
+        return count, None
+
+
+def read_from_s3(bucket: str, key: str):
+    """Reads a JSON object written by `upload_to_s3`; raises if it is missing."""
+    body = get_s3_client().get_object(Bucket=bucket, Key=key)["Body"].read()
+    return decode_json(body)
+
+
+def shared_state_enabled() -> bool:
+    """Whether state documents are kept in the snapshot bucket (see `read_state`)."""
+    return bool(STORAGE_BUCKET_NAME)
+
+
+def read_state(name: str) -> Optional[dict]:
+    """
+    Reads a state document shared by every run and the sensors.
+
+    Runs on Dagster Cloud each get a fresh container and the sensors run in
+    the code server, so state that must outlive a run (pool schedule, pool
+    registry) is kept in the snapshot bucket, at `<STATE_PREFIX>/<name>.json`,
+    outside the prefixes S3Queue ingests.
+
+    Returns:
+        The document, or None if it doesn't exist yet or no bucket is
+        configured (local development). Any other error is raised.
+    """
+    if not shared_state_enabled():
+        return None
+    client = get_s3_client()
+    try:
+        body = client.get_object(
+            Bucket=STORAGE_BUCKET_NAME, Key=f"{STATE_PREFIX}/{name}.json"
+        )["Body"].read()
+    except client.exceptions.NoSuchKey:
+        return None
+    return decode_json(body)
+
+
+def write_state(name: str, data: dict) -> None:
+    """Writes a state document read by `read_state`; raises if it fails."""
+    if not shared_state_enabled():
+        return
+    get_s3_client().put_object(
+        Bucket=STORAGE_BUCKET_NAME,
+        Key=f"{STATE_PREFIX}/{name}.json",
+        Body=encode_json(data, indent=0),
+        ContentType="application/json",
+    )
+
+
+def download_state_file(name: str, path: Path) -> bool:
+    """
+    Like `read_state`, for a file kept as is (e.g. a dbt manifest) at
+    `<STATE_PREFIX>/<name>`: downloads it to `path`. False if it doesn't exist.
+    """
+    from botocore.exceptions import ClientError
+
+    try:
+        get_s3_client().download_file(
+            STORAGE_BUCKET_NAME, f"{STATE_PREFIX}/{name}", str(path)
+        )
+    except ClientError as exc:
+        if exc.response["Error"]["Code"] in ("404", "NoSuchKey"):
+            return False
+        raise
+    return True
+
+
+def upload_state_file(name: str, path: Path) -> None:
+    """Uploads a file read by `download_state_file`; raises if it fails."""
+    get_s3_client().upload_file(
+        str(path), STORAGE_BUCKET_NAME, f"{STATE_PREFIX}/{name}"
+    )
+
+
+def delete_state_prefix(prefix: str) -> None:
+    """Deletes every state document and file under `<STATE_PREFIX>/<prefix>/`."""
+    if not shared_state_enabled():
+        return
+    client = get_s3_client()
+    pages = client.get_paginator("list_objects_v2").paginate(
+        Bucket=STORAGE_BUCKET_NAME, Prefix=f"{STATE_PREFIX}/{prefix}/"
+    )
+    for page in pages:
+        # a list page holds at most 1000 keys, the most one delete takes
+        keys = [{"Key": obj["Key"]} for obj in page.get("Contents", [])]
+        if keys:
+            client.delete_objects(
+                Bucket=STORAGE_BUCKET_NAME, Delete={"Objects": keys, "Quiet": True}
+            )
+
+
+def upload_objects(bucket: str, keys: Dict[str, str], outputs: dict) -> dict:
+    """
+    Uploads the rows of every snapshot kind to its key (see `upload_rows`),
+    side by side rather than one after another, and returns {"key", "rows",
+    "bytes"} per kind. The rows of a kind can be any iterable, e.g. the
+    spooled rows of `RunSpool.outputs`.
+    """
+    with ThreadPoolExecutor(max_workers=max(1, len(outputs))) as pool:
+        uploads = {
+            kind: pool.submit(upload_rows, bucket, keys[kind], rows)
+            for kind, rows in outputs.items()
+        }
+        objects = {}
+        for kind, upload in uploads.items():
+            count, size = upload.result()
+            objects[kind] = {"key": keys[kind], "rows": count, "bytes": size}
+        return objects
+
+
+def failed_uploads(objects: dict) -> List[str]:
+    """Kinds of a manifest's objects whose upload failed (`bytes` is None)."""
+    return [kind for kind, obj in objects.items() if obj.get("bytes") is None]
+
+
+def ensure_uploaded(objects: dict, what: str) -> None:
+    """
+    Raises if any of `objects` failed to upload, so callers stop before
+    indexing the run or cleaning up the spool that still holds its rows.
+    """
+    failed = failed_uploads(objects)
+    if failed:
+        raise RuntimeError(f"Failed to upload {failed} of {what}")
+
+
+def insert_json_rows(
+    url: str,
+    table: str,
+    rows: Iterable[str],
+    auth: Optional[Tuple[str, str]] = None,
+) -> None:
+    """
+    Streams JSON rows into a ClickHouse table over the HTTP interface.
+
+    The body is sent chunked as it is produced, so `rows` can be a generator
+    over arbitrarily many rows without holding them all in memory.
+
+    Args:
+        url (str): ClickHouse HTTP endpoint, e.g. http://localhost:8123
+        table (str): Fully qualified target table, e.g. default.orca_pools_raw
+        rows (Iterable[str]): One JSON object per row, already encoded
+        auth (Optional[Tuple[str, str]]): ClickHouse user and password
+    """
+    import requests
+
+    resp = requests.post(
+        url,
+        params={"query": f"INSERT INTO {table} FORMAT JSONEachRow"},
+        data=(f"{row}\n".encode() for row in rows),
+        auth=auth,
+        timeout=300,
+    )
+    resp.raise_for_status()
 
 
 def get_timestamp(fmt: str = "%Y-%m-%d_%H-%M-%S") -> str:
@@ -48,6 +257,147 @@ def get_timestamp(fmt: str = "%Y-%m-%d_%H-%M-%S") -> str:
     return datetime.now().strftime(fmt)
 
 
+def snapshot_key(
+    storage_key: str,
+    protocol: str,
+    kind: str,
+    token: str,
+    extraction_timestamp: str,
+) -> str:
+    """
+    Object key for one snapshot kind of a run, in the partitioned layout
+
+        <storage_key>/protocol=<p>/kind=<k>/date=<YYYY-MM-DD>/hour=<HH>/token=<mint>/
+            <YYYY-MM-DD_HH-MM-SS>_<kind>.json
+
+    so readers can prune to an hour or a token by prefix instead of listing
+    everything. The key is derived from the run's extraction timestamp, so it
+    is the same for every object of the run and for a resumed attempt.
+    """
+    ts = datetime.fromisoformat(extraction_timestamp)
+    return (
+        f"{storage_key}/protocol={protocol}/kind={kind}"
+        f"/date={ts:%Y-%m-%d}/hour={ts:%H}/token={token}"
+        f"/{ts:%Y-%m-%d_%H-%M-%S}_{kind}.json"
+    )
+
+
+def build_run_manifest(
+    protocol: str,
+    token: str,
+    extraction_timestamp: str,
+    objects: dict,
+    slot_range: Tuple[int, int],
+) -> dict:
+    """
+    Builds the manifest written once per run, listing exactly what it wrote.
+
+    Args:
+        protocol (str): Protocol name, e.g. "raydium" or "orca"
+        token (str): Token mint the snapshot was taken for
+        extraction_timestamp (str): Timestamp shared by every row of the run
+        objects (dict): Per snapshot kind, {"key", "rows", "bytes"} of its object
+        slot_range (Tuple[int, int]): First and last slot observed by the run
+    """
+    return {
+        "protocol": protocol,
+        "token": token,
+        "extraction_timestamp": extraction_timestamp,
+        "objects": objects,
+        "slot_range": {"first": slot_range[0], "last": slot_range[1]},
+    }
+
+
+def upload_snapshot(
+    bucket: str,
+    storage_key: str,
+    protocol: str,
+    token: str,
+    extraction_timestamp: str,
+    outputs: dict,
+    slot_range: Tuple[int, int],
+    pools: List[str],
+) -> dict:
+    """
+    Uploads every snapshot kind of a run, its snapshot index row and its
+    manifest, and returns the manifest (with `manifest_key` and `index`).
+
+    Args:
+        bucket (str): S3 bucket name
+        storage_key (str): Protocol storage prefix, e.g. RAYDIUM_STORAGE_KEY
+        protocol (str): Protocol name, e.g. "raydium" or "orca"
+        token (str): Token mint the snapshot was taken for
+        extraction_timestamp (str): Timestamp shared by every row of the run
+        outputs (dict): Rows per snapshot kind (any iterable of rows)
+        slot_range (Tuple[int, int]): First and last slot observed by the run
+        pools (List[str]): Pools the snapshot covers
+    """
+
+    def key(kind: str) -> str:
+        return snapshot_key(storage_key, protocol, kind, token, extraction_timestamp)
+
+    what = f"the {protocol} snapshot of {extraction_timestamp}"
+    objects = upload_objects(bucket, {kind: key(kind) for kind in outputs}, outputs)
+    ensure_uploaded(objects, what)
+
+    index = build_snapshot_index(
+        protocol=protocol,
+        token=token,
+        extraction_timestamp=extraction_timestamp,
+        row_counts={kind: obj["rows"] for kind, obj in objects.items()},
+        object_keys={kind: obj["key"] for kind, obj in objects.items()},
+        pools=pools,
+    )
+    size = upload_to_s3(bucket, key("snapshot_index"), [index])
+    objects["snapshot_index"] = {
+        "key": key("snapshot_index"),
+        "rows": 1,
+        "bytes": size,
+    }
+    ensure_uploaded(objects, what)
+
+    manifest = build_run_manifest(
+        protocol, token, extraction_timestamp, objects, slot_range
+    )
+    size = upload_to_s3(bucket, key("manifest"), manifest)
+    ensure_uploaded({"manifest": {"bytes": size}}, what)
+    return {**manifest, "manifest_key": key("manifest"), "index": index}
+
+
+def build_snapshot_index(
+    protocol: str,
+    token: str,
+    extraction_timestamp: str,
+    row_counts: dict,
+    object_keys: dict,
+    pools: List[str],
+) -> dict:
+    """
+    Builds the snapshot index row written alongside every ingestion run.
+
+    The index is tiny (one row per run) so dbt models can look up the latest
+    `extraction_timestamp` of every pool without scanning the raw snapshots.
+    Scheduled runs only read the pools that are due, so the row lists the
+    pools the run covers.
+
+    Args:
+        protocol (str): Protocol name, e.g. "raydium" or "orca"
+        token (str): Token mint the snapshot was taken for
+        extraction_timestamp (str): Timestamp shared by every row of the run
+        row_counts (dict): Number of rows written per snapshot kind
+        object_keys (dict): S3 object key written per snapshot kind
+        pools (List[str]): Pools the snapshot covers
+    """
+    return {
+        "protocol": protocol,
+        "token": token,
+        "extraction_timestamp": extraction_timestamp,
+        "row_counts": row_counts,
+        "object_keys": object_keys,
+        "pools": pools,
+    }
+
+
 def get_s3_bucket() -> str:
     """
     Returns the S3 bucket from environment variable `S3_BUCKET`.
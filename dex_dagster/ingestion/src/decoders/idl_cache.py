@@ -0,0 +1,81 @@
+import hashlib
+import logging
+import os
+import pickle
+from functools import lru_cache
+from importlib import resources
+from pathlib import Path
+
+from anchorpy import Coder, Idl
+
+logger = logging.getLogger("dex")
+
+# IDL files shipped inside this package, by program name
+IDL_FILES = {
+    "raydium_clmm": "rayclmmidl.json",
+    "orca_whirlpool": "orcaidl.json",
+}
+
+IDL_CACHE_DIR = Path(
+    os.getenv("IDL_CACHE_DIR", Path(__file__).parent / "__idlcache__")
+)
+
+
+def _cache_path(name: str, raw: bytes) -> Path:
+    """Cache file for an IDL, keyed by its content so edits invalidate it."""
+    digest = hashlib.sha256(raw).hexdigest()[:16]
+    return IDL_CACHE_DIR / f"{name}-{digest}.pickle"
+
+
+@lru_cache(maxsize=None)
+def load_idl(name: str) -> Idl:
+    """
+    Returns the parsed Anchor IDL for a program.
+
+    The IDL is read from package resources, so it loads regardless of the
+    working directory. A pickled copy of the parsed `Idl` is used when one
+    exists for the current file contents; otherwise the JSON is parsed and
+    the pickle written for next time.
+
+    Args:
+        name (str): Program name, one of `IDL_FILES`
+    """
+    raw = (resources.files(__package__) / IDL_FILES[name]).read_bytes()
+    cached = _cache_path(name, raw)
+
+    if cached.exists():
+        try:
+            return pickle.loads(cached.read_bytes())
+        except Exception as exc:
+            logger.info(f"Ignoring unreadable IDL cache {cached.name}: {exc}")
+
+    idl = Idl.from_json(raw.decode())
+    try:
+        IDL_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+        cached.write_bytes(pickle.dumps(idl, protocol=pickle.HIGHEST_PROTOCOL))
+    except Exception as exc:
+        logger.info(f"Could not write IDL cache {cached.name}: {exc}")
+    return idl
+
+
+@lru_cache(maxsize=None)
+def load_coder(name: str) -> Coder:
+    """
+    Returns the Anchor coder for a program, built once per process.
+
+    Decoding only needs the coder, so there is no need to construct a
+    `Program` (and its RPC provider) for every decoder.
+    """
+    return Coder(load_idl(name))
+
+
+def build_idl_cache() -> None:
+    """Pre-parses every shipped IDL; run at build time so workers start warm."""
+    for name in IDL_FILES:
+        load_idl(name)
+        logger.info(f"Cached IDL {name} in {IDL_CACHE_DIR}")
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    build_idl_cache()
@@ -1,9 +1,6 @@
-import json
 from typing import Dict, List
 
-from anchorpy import Idl, Program, Provider, Wallet
-from solana.rpc.async_api import AsyncClient
-from solders.keypair import Keypair
+from dex_dagster.ingestion.src.decoders.registry import AccountType, build_registry
 
 
 class AnchorWhirlpoolDecoder:
@@ -26,42 +23,40 @@ class AnchorWhirlpoolDecoder:
             "whirLbMiicVdio4qvUfM5KAg6Ct8VwpYzGff3uctyCc"  # Orca Whirlpool program ID
         )
         self.rpc_url = rpc_url
-        self.program = None  # Will hold the initialized Anchor program
+        self.registry = None  # Will hold the discriminator-dispatch registry
+
+    @classmethod
+    def account_types(cls) -> List[AccountType]:
+        """Account types this decoder formats, for the decoder registry."""
+        program, idl = "whirlpool", "orca_whirlpool"
+        return [
+            AccountType(program, idl, "Whirlpool", cls.decode_whirlpool_account),
+            AccountType(program, idl, "Position", cls.decode_position_account),
+            AccountType(program, idl, "TickArray", cls.decode_tick_array_account),
+        ]
 
     def initialize(self) -> bool:
         """
-        Initialize the Anchor program with the Whirlpool IDL.
+        Load the Anchor coder for the Whirlpool IDL.
 
-        This method:
-        1. Sets up a Solana connection
-        2. Creates a dummy wallet (required by Anchor)
-        3. Loads the Orca IDL from file
-        4. Initializes the Anchor program
+        The IDL is read from package resources and parsed once per process
+        (see `idl_cache`); decoding only needs the coder, so no RPC provider
+        or `Program` is created. Accounts are dispatched through a registry
+        keyed by Anchor discriminator (see `registry`).
 
         Returns:
             bool: True if initialization successful, False otherwise
         """
         try:
-            # Set up Solana connection and wallet
-            connection = AsyncClient(self.rpc_url)
-            wallet = Wallet(Keypair())
-            provider = Provider(connection, wallet)
-
-            # Load and parse the Orca IDL
-            with open("orcaidl.json", "r") as f:
-                idl_json = json.load(f)
-
-            # Initialize the Anchor program
-            idl = Idl.from_json(json.dumps(idl_json))
-            self.program = Program(idl, self.PROGRAM_ID, provider)
-            print("Successfully initialized Anchor decoder")
+            self.registry = build_registry()
             return True
 
         except Exception as e:
             print(f"Failed to initialize: {str(e)}")
             return False
 
-    def decode_whirlpool_account(self, decoded) -> Dict:
+    @staticmethod
+    def decode_whirlpool_account(decoded) -> Dict:
         """
         Format Whirlpool account data into a standardized dictionary.
 
@@ -107,7 +102,8 @@ class AnchorWhirlpoolDecoder:
             ],
         }
 
-    def decode_position_account(self, decoded) -> Dict:
+    @staticmethod
+    def decode_position_account(decoded) -> Dict:
         """
         Format Position account data into a standardized dictionary.
 
@@ -141,7 +137,8 @@ class AnchorWhirlpoolDecoder:
             ],
         }
 
-    def decode_tick_array_account(self, decoded) -> Dict:
+    @staticmethod
+    def decode_tick_array_account(decoded) -> Dict:
         """
         Format TickArray account data into a standardized dictionary.
 
@@ -176,8 +173,8 @@ class AnchorWhirlpoolDecoder:
         """
         Decode account data and determine its type.
 
-        This method attempts to decode raw account data using the Anchor program
-        and formats it based on the detected account type (Whirlpool, Position,
+        The account type is looked up by its Anchor discriminator in the decoder
+        registry and the data formatted based on the detected type (Whirlpool, Position,
         or TickArray).
 
         Args:
@@ -202,40 +199,6 @@ class AnchorWhirlpoolDecoder:
                     "error": error message
                 }
         """
-        try:
-            # Check if program is initialized
-            if not self.program:
-                raise Exception("Program not initialized")
-
-            account_data = bytes(raw_data)
-
-            try:
-                # Attempt to decode and identify account type
-                decoded = self.program.coder.accounts.decode(account_data)
-                account_type = type(decoded).__name__
-
-                # Process based on account type
-                if account_type == "Whirlpool":
-                    data = self.decode_whirlpool_account(decoded)
-                elif account_type == "Position":
-                    data = self.decode_position_account(decoded)
-                elif account_type == "TickArray":
-                    data = self.decode_tick_array_account(decoded)
-                else:
-                    return {"error": f"Unknown account type: {account_type}"}
-
-                # Return formatted data
-                return {
-                    "address": pubkey,
-                    "parsed": {"name": account_type, "data": data, "type": "account"},
-                    "program": "whirlpool",
-                    "space": len(account_data),
-                }
-
-            except Exception as e:
-                print(f"Decode error for {pubkey}: {str(e)}")
-                return {"error": f"Failed to decode: {str(e)}"}
-
-        except Exception as e:
-            print(f"Error processing account {pubkey}: {str(e)}")
-            return {"error": str(e)}
+        if not self.registry:
+            return {"error": "Decoder not initialized"}
+        return self.registry.decode(raw_data, pubkey)
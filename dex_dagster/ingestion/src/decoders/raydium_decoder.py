@@ -1,10 +1,13 @@
-import json
-from pathlib import Path
 from typing import Dict, List
 
-from anchorpy import Idl, Program, Provider, Wallet
-from solana.rpc.api import Client
-from solders.keypair import Keypair
+from msgspec import UNSET
+
+from dex_dagster.ingestion.src.common import rows
+from dex_dagster.ingestion.src.common.field_profiles import (
+    dropped_fields,
+    without_unset,
+)
+from dex_dagster.ingestion.src.decoders.registry import AccountType, build_registry
 
 
 class AnchorRaydiumDecoder:
@@ -16,54 +19,55 @@ class AnchorRaydiumDecoder:
     It uses the Anchor framework for decoding account data based on the Raydium IDL.
     """
 
-    def __init__(self, rpc_url: str):
+    def __init__(self, rpc_url: str, typed: bool = False):
         """
         Initialize the Raydium AMM V3 decoder.
 
         Args:
             rpc_url (str): URL of the Solana RPC endpoint
+            typed (bool): Decode into `rows` structs instead of dicts
         """
         self.PROGRAM_ID = (
             "CAMMCzo5YL8w4VFF8KVHrK22GGUsp5VTaW7grrKgrWqK"  # Raydium AMM V3 program ID
         )
         self.rpc_url = rpc_url
-        self.program = None  # Will hold the initialized Anchor program
+        self.typed = typed
+        self.registry = None  # Will hold the discriminator-dispatch registry
+
+    @classmethod
+    def account_types(cls) -> List[AccountType]:
+        """Account types this decoder formats, for the decoder registry."""
+        program, idl = "raydium_amm_v3", "raydium_clmm"
+        return [
+            AccountType(program, idl, "PoolState", cls.decode_pool_state, rows.PoolStateRow),
+            AccountType(program, idl, "PersonalPositionState", cls.decode_position_state, rows.PersonalPositionRow),
+            AccountType(program, idl, "ProtocolPositionState", cls.decode_protocol_position_state, rows.ProtocolPositionRow),
+            AccountType(program, idl, "TickArrayState", cls.decode_tick_array_state, rows.TickArrayStateRow),
+            AccountType(program, idl, "TickArrayBitmapExtension", cls.decode_tick_array_bitmap_extension),
+        ]
 
     def initialize(self) -> bool:
         """
-        Initialize the Anchor program with the Raydium AMM V3 IDL.
+        Load the Anchor coder for the Raydium AMM V3 IDL.
 
-        This method:
-        1. Sets up a Solana connection
-        2. Creates a dummy wallet (required by Anchor)
-        3. Loads the Raydium IDL from file
-        4. Initializes the Anchor program
+        The IDL is read from package resources and parsed once per process
+        (see `idl_cache`); decoding only needs the coder, so no RPC provider
+        or `Program` is created. Accounts are dispatched through a registry
+        keyed by Anchor discriminator (see `registry`).
 
         Returns:
             bool: True if initialization successful, False otherwise
         """
         try:
-            # Set up Solana connection and wallet
-            connection = Client(self.rpc_url)
-            wallet = Wallet(Keypair())
-            provider = Provider(connection, wallet)
-
-            # Load and parse the Raydium IDL
-            file_path = Path(__file__).parent / "rayclmmidl.json"
-            with open(file_path, "r") as f:
-                idl_json = json.load(f)
-
-            # Initialize the Anchor program
-            idl = Idl.from_json(json.dumps(idl_json))
-            self.program = Program(idl, self.PROGRAM_ID, provider)
-            print("Successfully initialized Raydium decoder")
+            self.registry = build_registry(typed=self.typed)
             return True
 
         except Exception as e:
             print(f"Failed to initialize: {str(e)}")
             return False
 
-    def decode_pool_state(self, decoded) -> Dict:
+    @staticmethod
+    def decode_pool_state(decoded) -> Dict:
         """
         Format Pool state account data into a standardized dictionary.
 
@@ -80,8 +84,11 @@ class AnchorRaydiumDecoder:
                 - Swap amounts and status
                 - Reward information
                 - Total fees and fund fees
+
+            Fields the active field profile drops are left out.
         """
-        return {
+        drop = dropped_fields("PoolState")
+        row = {
             "bump": list(decoded.bump),
             "ammConfig": str(decoded.amm_config),
             "owner": str(decoded.owner),
@@ -96,8 +103,8 @@ class AnchorRaydiumDecoder:
             "liquidity": str(decoded.liquidity),
             "sqrtPriceX64": str(decoded.sqrt_price_x64),
             "tickCurrent": decoded.tick_current,
-            "padding3": decoded.padding3,
-            "padding4": decoded.padding4,
+            "padding3": UNSET if "padding3" in drop else decoded.padding3,
+            "padding4": UNSET if "padding4" in drop else decoded.padding4,
             "feeGrowthGlobal0X64": str(decoded.fee_growth_global0_x64),
             "feeGrowthGlobal1X64": str(decoded.fee_growth_global1_x64),
             "protocolFeesToken0": str(decoded.protocol_fees_token0),
@@ -107,37 +114,53 @@ class AnchorRaydiumDecoder:
             "swapInAmountToken1": str(decoded.swap_in_amount_token1),
             "swapOutAmountToken0": str(decoded.swap_out_amount_token0),
             "status": decoded.status,
-            "padding": list(decoded.padding),
-            "rewardInfos": [
-                {
-                    "rewardState": reward.reward_state,
-                    "openTime": str(reward.open_time),
-                    "endTime": str(reward.end_time),
-                    "lastUpdateTime": str(reward.last_update_time),
-                    "emissionsPerSecondX64": str(reward.emissions_per_second_x64),
-                    "rewardTotalEmissioned": str(reward.reward_total_emissioned),
-                    "rewardClaimed": str(reward.reward_claimed),
-                    "tokenMint": str(reward.token_mint),
-                    "tokenVault": str(reward.token_vault),
-                    "authority": str(reward.authority),
-                    "rewardGrowthGlobalX64": str(reward.reward_growth_global_x64),
-                }
-                for reward in decoded.reward_infos
-            ],
+            "padding": UNSET if "padding" in drop else list(decoded.padding),
+            "rewardInfos": (
+                UNSET
+                if "rewardInfos" in drop
+                else [
+                    {
+                        "rewardState": reward.reward_state,
+                        "openTime": str(reward.open_time),
+                        "endTime": str(reward.end_time),
+                        "lastUpdateTime": str(reward.last_update_time),
+                        "emissionsPerSecondX64": str(reward.emissions_per_second_x64),
+                        "rewardTotalEmissioned": str(reward.reward_total_emissioned),
+                        "rewardClaimed": str(reward.reward_claimed),
+                        "tokenMint": str(reward.token_mint),
+                        "tokenVault": str(reward.token_vault),
+                        "authority": str(reward.authority),
+                        "rewardGrowthGlobalX64": str(
+                            reward.reward_growth_global_x64
+                        ),
+                    }
+                    for reward in decoded.reward_infos
+                ]
+            ),
             "tickArrayBitmap": [str(bitmap) for bitmap in decoded.tick_array_bitmap],
             "totalFeesToken0": str(decoded.total_fees_token0),
             "totalFeesClaimedToken0": str(decoded.total_fees_claimed_token0),
             "totalFeesToken1": str(decoded.total_fees_token1),
             "totalFeesClaimedToken1": str(decoded.total_fees_claimed_token1),
-            "fundFeesToken0": str(decoded.fund_fees_token0),
-            "fundFeesToken1": str(decoded.fund_fees_token1),
+            "fundFeesToken0": (
+                UNSET if "fundFeesToken0" in drop else str(decoded.fund_fees_token0)
+            ),
+            "fundFeesToken1": (
+                UNSET if "fundFeesToken1" in drop else str(decoded.fund_fees_token1)
+            ),
             "openTime": str(decoded.open_time),
             "recentEpoch": str(decoded.recent_epoch),
-            "padding1": [str(p) for p in decoded.padding1],
-            "padding2": [str(p) for p in decoded.padding2],
+            "padding1": (
+                UNSET if "padding1" in drop else [str(p) for p in decoded.padding1]
+            ),
+            "padding2": (
+                UNSET if "padding2" in drop else [str(p) for p in decoded.padding2]
+            ),
         }
+        return without_unset(row)
 
-    def decode_position_state(self, decoded) -> Dict:
+    @staticmethod
+    def decode_position_state(decoded) -> Dict:
         """
         Format Personal Position account data into a standardized dictionary.
 
@@ -153,7 +176,8 @@ class AnchorRaydiumDecoder:
                 - Token fees owed
                 - Reward information
         """
-        return {
+        drop = dropped_fields("PersonalPositionState")
+        row = {
             "nftMint": str(decoded.nft_mint),
             "poolId": str(decoded.pool_id),
             "tickLowerIndex": decoded.tick_lower_index,
@@ -163,16 +187,22 @@ class AnchorRaydiumDecoder:
             "feeGrowthInside1LastX64": str(decoded.fee_growth_inside1_last_x64),
             "tokenFeesOwed0": str(decoded.token_fees_owed0),
             "tokenFeesOwed1": str(decoded.token_fees_owed1),
-            "rewardInfos": [
-                {
-                    "growthInsideLastX64": str(reward.growth_inside_last_x64),
-                    "rewardAmountOwed": str(reward.reward_amount_owed),
-                }
-                for reward in decoded.reward_infos
-            ],
+            "rewardInfos": (
+                UNSET
+                if "rewardInfos" in drop
+                else [
+                    {
+                        "growthInsideLastX64": str(reward.growth_inside_last_x64),
+                        "rewardAmountOwed": str(reward.reward_amount_owed),
+                    }
+                    for reward in decoded.reward_infos
+                ]
+            ),
         }
+        return without_unset(row)
 
-    def decode_protocol_position_state(self, decoded) -> Dict:
+    @staticmethod
+    def decode_protocol_position_state(decoded) -> Dict:
         """
         Format Protocol Position account data into a standardized dictionary.
 
@@ -188,7 +218,8 @@ class AnchorRaydiumDecoder:
                 - Token fees owed
                 - Reward growth inside information
         """
-        return {
+        drop = dropped_fields("ProtocolPositionState")
+        row = {
             "poolId": str(decoded.pool_id),
             "tickLowerIndex": decoded.tick_lower_index,
             "tickUpperIndex": decoded.tick_upper_index,
@@ -197,12 +228,16 @@ class AnchorRaydiumDecoder:
             "feeGrowthInside1LastX64": str(decoded.fee_growth_inside1_last_x64),
             "tokenFeesOwed0": str(decoded.token_fees_owed0),
             "tokenFeesOwed1": str(decoded.token_fees_owed1),
-            "rewardGrowthInside": [
-                str(growth) for growth in decoded.reward_growth_inside
-            ],
+            "rewardGrowthInside": (
+                UNSET
+                if "rewardGrowthInside" in drop
+                else [str(growth) for growth in decoded.reward_growth_inside]
+            ),
         }
+        return without_unset(row)
 
-    def decode_tick_array_state(self, decoded) -> Dict:
+    @staticmethod
+    def decode_tick_array_state(decoded) -> Dict:
         """
         Format TickArray account data into a standardized dictionary.
 
@@ -223,6 +258,7 @@ class AnchorRaydiumDecoder:
         Note:
             Includes safety checks for tick initialization and attribute presence
         """
+        rewards = "rewardGrowthsOutsideX64" not in dropped_fields("TickState")
         return {
             "poolId": str(decoded.pool_id),
             "startTickIndex": decoded.start_tick_index,
@@ -236,16 +272,24 @@ class AnchorRaydiumDecoder:
                     "liquidityGross": str(tick.liquidity_gross),
                     "feeGrowthOutside0X64": str(tick.fee_growth_outside0_x64),
                     "feeGrowthOutside1X64": str(tick.fee_growth_outside1_x64),
-                    "rewardGrowthsOutsideX64": [
-                        str(growth) for growth in tick.reward_growths_outside_x64
-                    ],
+                    **(
+                        {
+                            "rewardGrowthsOutsideX64": [
+                                str(growth)
+                                for growth in tick.reward_growths_outside_x64
+                            ]
+                        }
+                        if rewards
+                        else {}
+                    ),
                 }
                 for tick in decoded.ticks
                 if hasattr(tick, "tick")  # Only include valid ticks
             ],
         }
 
-    def decode_tick_array_bitmap_extension(self, decoded) -> Dict:
+    @staticmethod
+    def decode_tick_array_bitmap_extension(decoded) -> Dict:
         """
         Format TickArrayBitmapExtension account data into a standardized dictionary.
         """
@@ -265,8 +309,8 @@ class AnchorRaydiumDecoder:
         """
         Decode account data and determine its type.
 
-        This method attempts to decode raw account data using the Anchor program
-        and formats it based on the detected account type (Pool, Position,
+        The account type is looked up by its Anchor discriminator in the decoder
+        registry and the data formatted based on the detected type (Pool, Position,
         Protocol Position, or TickArray).
 
         Args:
@@ -291,44 +335,6 @@ class AnchorRaydiumDecoder:
                     "error": error message
                 }
         """
-        try:
-            # Check if program is initialized
-            if not self.program:
-                raise Exception("Program not initialized")
-
-            account_data = bytes(raw_data)
-
-            try:
-                # Attempt to decode and identify account type
-                decoded = self.program.coder.accounts.decode(account_data)
-                account_type = type(decoded).__name__
-
-                # Process based on account type
-                if account_type == "PoolState":
-                    data = self.decode_pool_state(decoded)
-                elif account_type == "PersonalPositionState":
-                    data = self.decode_position_state(decoded)
-                elif account_type == "ProtocolPositionState":
-                    data = self.decode_protocol_position_state(decoded)
-                elif account_type == "TickArrayState":
-                    data = self.decode_tick_array_state(decoded)
-                elif account_type == "TickArrayBitmapExtension":
-                    data = self.decode_tick_array_bitmap_extension(decoded)
-                else:
-                    return {"error": f"Unknown account type: {account_type}"}
-
-                # Return formatted data
-                return {
-                    "address": pubkey,
-                    "parsed": {"name": account_type, "data": data, "type": "account"},
-                    "program": "raydium_amm_v3",
-                    "space": len(account_data),
-                }
-
-            except Exception as e:
-                print(f"Decode error for {pubkey}: {str(e)}")
-                return {"error": f"Failed to decode: {str(e)}"}
-
-        except Exception as e:
-            print(f"Error processing account {pubkey}: {str(e)}")
-            return {"error": str(e)}
+        if not self.registry:
+            return {"error": "Decoder not initialized"}
+        return self.registry.decode(raw_data, pubkey)
@@ -0,0 +1,168 @@
+import hashlib
+import logging
+from collections import Counter, defaultdict
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from dex_dagster.ingestion.src.decoders.idl_cache import load_coder
+
+logger = logging.getLogger("dex")
+
+ACCOUNT_DISCRIMINATOR_SIZE = 8
+
+
+def account_discriminator(name: str) -> bytes:
+    """Anchor account discriminator: first 8 bytes of sha256("account:<Name>")."""
+    return hashlib.sha256(f"account:{name}".encode()).digest()[
+        :ACCOUNT_DISCRIMINATOR_SIZE
+    ]
+
+
+@dataclass(frozen=True)
+class AccountType:
+    """An Anchor account type and the function that formats its decoded value."""
+
+    program: str  # program label used in decoded output, e.g. "whirlpool"
+    idl: str  # IDL name in idl_cache.IDL_FILES
+    name: str  # account name in the IDL, e.g. "PoolState"
+    format: Callable[[Any], Dict]
+    row: Optional[Any] = None  # typed row struct (`rows`), same output as `format`
+
+    @property
+    def discriminator(self) -> bytes:
+        return account_discriminator(self.name)
+
+
+class DecoderRegistry:
+    """
+    Decodes Anchor accounts of several programs, dispatched by discriminator.
+
+    Every registered account type is keyed by its 8-byte Anchor discriminator,
+    so any buffer can be routed to the right coder and formatter without trial
+    decoding. Failures are counted in `errors` (by account type) instead of
+    being printed per account.
+
+    With `typed`, account types that have a row struct are formatted into it
+    rather than into a dict (cheaper to build and to encode).
+    """
+
+    def __init__(self, account_types: Iterable[AccountType], typed: bool = False):
+        self.typed = typed
+        self._types: Dict[bytes, AccountType] = {}
+        for account_type in account_types:
+            disc = account_type.discriminator
+            if disc in self._types:
+                raise ValueError(
+                    f"Discriminator clash between {self._types[disc].name} "
+                    f"and {account_type.name}"
+                )
+            self._types[disc] = account_type
+        self.errors: Counter = Counter()
+
+    def _formatter(self, account_type: AccountType) -> Callable[[Any], Any]:
+        if self.typed and account_type.row is not None:
+            return account_type.row.from_decoded
+        return account_type.format
+
+    def account_type(self, data: bytes) -> Optional[AccountType]:
+        """Returns the registered account type of a raw buffer, if any."""
+        return self._types.get(bytes(data[:ACCOUNT_DISCRIMINATOR_SIZE]))
+
+    @staticmethod
+    def _envelope(account_type: AccountType, pubkey: str, data: Dict, size: int) -> Dict:
+        return {
+            "address": pubkey,
+            "parsed": {"name": account_type.name, "data": data, "type": "account"},
+            "program": account_type.program,
+            "space": size,
+        }
+
+    def decode(self, raw_data, pubkey: str) -> dict:
+        """
+        Decode a single account.
+
+        Returns:
+            dict: Decoded account in the same format as the decoders'
+                `decode_account`, or {"error": message} if decoding fails.
+        """
+        account_data = bytes(raw_data)
+        account_type = self.account_type(account_data)
+        if account_type is None:
+            self.errors["unknown"] += 1
+            return {"error": f"Unknown account type for {pubkey}"}
+        try:
+            decoded = load_coder(account_type.idl).accounts.decode(account_data)
+            data = self._formatter(account_type)(decoded)
+        except Exception as e:
+            self.errors[account_type.name] += 1
+            return {"error": f"Failed to decode: {str(e)}"}
+        return self._envelope(account_type, pubkey, data, len(account_data))
+
+    def decode_many(
+        self, buffers: Iterable[Tuple[str, Any]]
+    ) -> Dict[str, List[dict]]:
+        """
+        Decode a batch of accounts, grouped by account type.
+
+        Buffers are bucketed by discriminator first, then each group is
+        decoded in one pass with its coder and formatter resolved once.
+
+        Args:
+            buffers: (pubkey, raw account data) pairs
+
+        Returns:
+            Dict[str, List[dict]]: Decoded accounts per account type name.
+                Accounts that fail to decode are counted in `errors` and left out.
+        """
+        groups: Dict[bytes, List[Tuple[str, bytes]]] = defaultdict(list)
+        for pubkey, raw_data in buffers:
+            account_data = bytes(raw_data)
+            groups[account_data[:ACCOUNT_DISCRIMINATOR_SIZE]].append(
+                (pubkey, account_data)
+            )
+
+        batches: Dict[str, List[dict]] = {}
+        for disc, accounts in groups.items():
+            account_type = self._types.get(disc)
+            if account_type is None:
+                self.errors["unknown"] += len(accounts)
+                continue
+
+            decode = load_coder(account_type.idl).accounts.decode
+            fmt = self._formatter(account_type)
+            envelope = self._envelope
+            rows = batches.setdefault(account_type.name, [])
+            for pubkey, account_data in accounts:
+                try:
+                    data = fmt(decode(account_data))
+                except Exception:
+                    self.errors[account_type.name] += 1
+                    continue
+                rows.append(envelope(account_type, pubkey, data, len(account_data)))
+        return batches
+
+    def log_errors(self) -> None:
+        """Logs a one-line summary of decode failures, if there were any."""
+        if self.errors:
+            logger.info(f"Decode errors by account type: {dict(self.errors)}")
+
+
+def build_registry(typed: bool = False) -> DecoderRegistry:
+    """
+    New registry covering the Raydium CLMM and Orca Whirlpool account types.
+
+    Coders are shared process-wide, so this is cheap; each caller gets its own
+    error counts.
+    """
+    from dex_dagster.ingestion.src.decoders.orca_decoder import AnchorWhirlpoolDecoder
+    from dex_dagster.ingestion.src.decoders.raydium_decoder import (
+        AnchorRaydiumDecoder,
+    )
+
+    return DecoderRegistry(
+        [
+            *AnchorRaydiumDecoder.account_types(),
+            *AnchorWhirlpoolDecoder.account_types(),
+        ],
+        typed=typed,
+    )
@@ -1,12 +1,14 @@
 import asyncio
 
-from common.constants import ORCA_RPC, RAYDIUM_RPC, TOKEN_MINT
 from dotenv import load_dotenv
-from protocols.orca import run_orca
-from protocols.raydium import run_raydium
 
+# load .env before the ingestion modules read their settings from the environment
 load_dotenv()
 
+from common.constants import ORCA_RPC, RAYDIUM_RPC, TOKEN_MINT  # noqa: E402
+from protocols.orca import run_orca  # noqa: E402
+from protocols.raydium import run_raydium  # noqa: E402
+
 
 def main():
 
@@ -2,41 +2,68 @@
 import asyncio
 import logging
 from datetime import datetime
+from functools import partial
 from time import time  # no blocking sleep
-from typing import List
+from types import SimpleNamespace
+from typing import Dict, List, Optional, Tuple
 
-from dotenv import load_dotenv
 from httpx import HTTPStatusError
 from orca_whirlpool.accounts import AccountFetcher, AccountFinder
 from orca_whirlpool.constants import ORCA_WHIRLPOOL_PROGRAM_ID
 from solana.exceptions import SolanaRpcException
-from solana.rpc.api import Client
-from solana.rpc.async_api import AsyncClient
-from solana.rpc.commitment import Processed
-from solana.rpc.types import MemcmpOpts
 from solders.pubkey import Pubkey
 from tenacity import (
     AsyncRetrying,
-    retry,
     retry_if_exception_type,
     stop_after_attempt,
     wait_exponential,
 )
 
+from dex_dagster.ingestion.src.common.account_cache import get_account_cache
+from dex_dagster.ingestion.src.common.archive import archive_snapshot
+from dex_dagster.ingestion.src.common.checkpoint import RunSpool
 from dex_dagster.ingestion.src.common.constants import (
     ORCA_STORAGE_KEY,
     ORCA_WHIRLPOOL_PROGRAM,
 )
-from dex_dagster.ingestion.src.common.serializers import (
-    serialize_position,
-    serialize_tick_array,
-    serialize_token_accounts,
-    serialize_whirlpool,
+from dex_dagster.ingestion.src.common.field_profiles import active_field_profile
+from dex_dagster.ingestion.src.common.pipeline import (
+    Deadline,
+    Pipeline,
+    in_thread,
+    snapshot_stages,
+)
+from dex_dagster.ingestion.src.common.pool_registry import PoolProgram, PoolRegistry
+from dex_dagster.ingestion.src.common.pool_schedule import (
+    order_pools,
+    record_snapshot,
+    snapshot_observations,
+)
+from dex_dagster.ingestion.src.common.rpc_router import (
+    AsyncRoutedClient,
+    log_endpoint_summary,
+    routed_client,
+)
+from dex_dagster.ingestion.src.common.rows import (
+    TokenAccountRow,
+    WhirlpoolPositionRow,
+    WhirlpoolRow,
+    WhirlpoolTickArrayRow,
+)
+from dex_dagster.ingestion.src.common.sharding import Shard, upload_snapshot_part
+from dex_dagster.ingestion.src.common.spl_token import (
+    chunked,
+    decode_token_account,
 )
 from dex_dagster.ingestion.src.common.utility import (
     get_s3_bucket,
-    get_timestamp,
-    upload_to_s3,
+    upload_snapshot,
+)
+from dex_dagster.ingestion.src.decoders.registry import (
+    ACCOUNT_DISCRIMINATOR_SIZE,
+    DecoderRegistry,
+    account_discriminator,
+    build_registry,
 )
 
 logging.basicConfig(
@@ -45,48 +72,29 @@ logging.basicConfig(
     datefmt="%Y-%m-%d %H:%M:%S",
 )
 logger = logging.getLogger("dex")
-load_dotenv()
 
 POOL_ACCOUNT_SIZE = 653
 TOKEN_MINT_A_OFFSET = 101
 TOKEN_MINT_B_OFFSET = 181
 PROGRAM_ID = ORCA_WHIRLPOOL_PROGRAM  # Pubkey object
+TICK_ARRAY_SIZE = 88
+MIN_TICK_INDEX = -443636
+MAX_TICK_INDEX = 443636
+# tick arrays read either side of the current one by default: 49 PDAs, one
+# getMultipleAccounts call per pool (±2112 ticks at the tightest spacing)
+TICK_WINDOW = 24
+TICK_ARRAY_DISCRIMINATOR = account_discriminator("TickArray")
 
+# pipeline workers per stage; RPC calls are further capped by rpc_limiter
+ORCA_CONCURRENCY = {"fetch": 8, "decode": 2, "serialize": 2}
 
-SyncRetry = retry(
-    retry=retry_if_exception_type((SolanaRpcException, HTTPStatusError)),
-    wait=wait_exponential(multiplier=0.8, min=1, max=30),
-    stop=stop_after_attempt(6),
-    reraise=True,
-)
-
-
-@SyncRetry
-def fetch_pool_addresses(rpc_url: str, token_mint: str) -> List[str]:
-    client = Client(rpc_url)
-    found = set()
-
-    filters_base = [
-        POOL_ACCOUNT_SIZE,
-        MemcmpOpts(offset=TOKEN_MINT_A_OFFSET, bytes=token_mint),
-    ]
-    filters_quote = [
-        POOL_ACCOUNT_SIZE,
-        MemcmpOpts(offset=TOKEN_MINT_B_OFFSET, bytes=token_mint),
-    ]
-
-    for acc in client.get_program_accounts(
-        PROGRAM_ID, commitment=Processed, filters=filters_base
-    ).value:
-        found.add(str(acc.pubkey))
 
-    for acc in client.get_program_accounts(
-        PROGRAM_ID, commitment=Processed, filters=filters_quote
-    ).value:
-        found.add(str(acc.pubkey))
-
-    logger.info(f"Found {len(found)} matching Orca pools for mint {token_mint}")
-    return list(found)
+ORCA_POOLS = PoolProgram(
+    "orca",
+    str(PROGRAM_ID),
+    POOL_ACCOUNT_SIZE,
+    (TOKEN_MINT_A_OFFSET, TOKEN_MINT_B_OFFSET),
+)
 
 
 rpc_limiter = asyncio.Semaphore(10)  # max 30 concurrent RPCs
@@ -104,81 +112,434 @@ async def with_retry(func, *args, **kwargs):
                 return await func(*args, **kwargs)
 
 
-async def run_orca(token: str, rpc_url: str) -> None:
+async def fetch_token_accounts(
+    connection: AsyncRoutedClient, addresses: List[str]
+) -> Dict[str, Optional[dict]]:
+    """
+    Fetches SPL token accounts with chunked `getMultipleAccounts` and decodes
+    them locally.
 
-    pool_addresses = fetch_pool_addresses(rpc_url, token)
-    if not pool_addresses:
-        logger.info("No pools found for token.")
+    Returns:
+        Dict[str, Optional[dict]]: Decoded account by address (None if missing)
+    """
+
+    async def fetch_chunk(chunk: List[str]):
+        resp = await with_retry(
+            connection.get_multiple_accounts, [Pubkey.from_string(a) for a in chunk]
+        )
+        return zip(chunk, resp.value)
+
+    results = await asyncio.gather(*(fetch_chunk(c) for c in chunked(addresses)))
+    return {
+        address: decode_token_account(bytes(account.data)) if account else None
+        for pairs in results
+        for address, account in pairs
+    }
+
+
+async def fetch_vault_amounts(
+    connection: AsyncRoutedClient, pool_rows: List[dict]
+) -> None:
+    """
+    Fills `token_vault_a_amount`/`token_vault_b_amount` of every pool row in
+    place, replacing two `get_token_account` calls per pool with one batched
+    fetch for all vaults.
+    """
+    vaults = [
+        (row, f"token_vault_{side}_amount", row["whirlpool"][f"token_vault_{side}"])
+        for row in pool_rows
+        for side in ("a", "b")
+    ]
+    if not vaults:
         return
 
-    connection = AsyncClient(rpc_url)
+    accounts = await fetch_token_accounts(
+        connection, list(dict.fromkeys(address for _, _, address in vaults))
+    )
+    for row, field, address in vaults:
+        account = accounts.get(address)
+        if account is None:
+            logger.info(
+                f"Could not read vault {address} of {row['whirlpool']['pubkey']}"
+            )
+            continue
+        row[field] = TokenAccountRow.from_decoded(account)
+
+
+def tick_array_start_index(tick_index: int, tick_spacing: int) -> int:
+    ticks_in_array = TICK_ARRAY_SIZE * tick_spacing
+    return tick_index // ticks_in_array * ticks_in_array
+
+
+def tick_array_starts(
+    tick_current_index: int, tick_spacing: int, window: Optional[int] = None
+) -> List[int]:
+    """
+    Start indexes of the tick arrays to fetch for a whirlpool.
+
+    Args:
+        tick_current_index (int): The pool's current tick
+        tick_spacing (int): The pool's tick spacing
+        window (Optional[int]): Arrays on each side of the current one, or
+            None for every array in the valid tick range
+    """
+    ticks_in_array = TICK_ARRAY_SIZE * tick_spacing
+    first = tick_array_start_index(MIN_TICK_INDEX, tick_spacing)
+    last = tick_array_start_index(MAX_TICK_INDEX, tick_spacing)
+    if window is not None:
+        current = tick_array_start_index(tick_current_index, tick_spacing)
+        first = max(first, current - window * ticks_in_array)
+        last = min(last, current + window * ticks_in_array)
+    return list(range(first, last + 1, ticks_in_array))
+
+
+def tick_array_address(whirlpool: Pubkey, start_tick_index: int) -> Pubkey:
+    seeds = [b"tick_array", bytes(whirlpool), str(start_tick_index).encode()]
+    pda, _ = Pubkey.find_program_address(seeds, PROGRAM_ID)
+    return pda
+
+
+def _tick_array(row: dict) -> SimpleNamespace:
+    """A registry-decoded TickArray, shaped like the ones AccountFinder returns."""
+    data = row["parsed"]["data"]
+    return SimpleNamespace(
+        pubkey=row["address"],
+        start_tick_index=data["startTickIndex"],
+        whirlpool=data["whirlpool"],
+        ticks=[
+            SimpleNamespace(
+                initialized=tick["initialized"],
+                liquidity_net=tick["liquidityNet"],
+                liquidity_gross=tick["liquidityGross"],
+                fee_growth_outside_a=tick["feeGrowthOutsideA"],
+                fee_growth_outside_b=tick["feeGrowthOutsideB"],
+                reward_growths_outside=tick["rewardGrowthsOutside"],
+            )
+            for tick in data["ticks"]
+        ],
+    )
+
+
+async def fetch_tick_array_accounts(
+    connection: AsyncRoutedClient,
+    whirlpool_pubkey: Pubkey,
+    whirlpool,
+    window: Optional[int] = TICK_WINDOW,
+) -> List[Tuple[str, bytes]]:
+    """
+    Fetches a whirlpool's tick arrays by deriving their PDAs.
+
+    Every possible array address in the window (`window` arrays either side
+    of the current tick, or the whole tick range for None) is derived from
+    the pool's tick spacing and read with chunked `getMultipleAccounts`;
+    arrays that were never initialized simply come back empty. This replaces
+    a `getProgramAccounts` scan of the whole Whirlpool program per pool.
+
+    Returns:
+        List[Tuple[str, bytes]]: (address, raw data) of every existing array
+    """
+    starts = tick_array_starts(
+        whirlpool.tick_current_index, whirlpool.tick_spacing, window
+    )
+    addresses = [tick_array_address(whirlpool_pubkey, start) for start in starts]
+
+    async def fetch_chunk(chunk: List[Pubkey]):
+        resp = await with_retry(connection.get_multiple_accounts, chunk)
+        return [
+            (str(address), bytes(account.data))
+            for address, account in zip(chunk, resp.value)
+            if account is not None
+        ]
+
+    results = await asyncio.gather(*(fetch_chunk(c) for c in chunked(addresses)))
+    return [pair for pairs in results for pair in pairs]
+
+
+def decode_tick_arrays(
+    registry: DecoderRegistry, accounts: List[Tuple[str, bytes]]
+) -> List[WhirlpoolTickArrayRow]:
+    """Tick array rows from raw accounts, as the program scan gives them."""
+    decoded = registry.decode_many(accounts)
+    return [
+        WhirlpoolTickArrayRow.from_account(_tick_array(row))
+        for row in decoded.get("TickArray", [])
+    ]
+
+
+async def fetch_tick_arrays(
+    connection: AsyncRoutedClient,
+    registry: DecoderRegistry,
+    whirlpool_pubkey: Pubkey,
+    whirlpool,
+    window: Optional[int] = TICK_WINDOW,
+) -> List[WhirlpoolTickArrayRow]:
+    """`fetch_tick_array_accounts` and `decode_tick_arrays` in one call."""
+    accounts = await fetch_tick_array_accounts(
+        connection, whirlpool_pubkey, whirlpool, window
+    )
+    return decode_tick_arrays(registry, accounts)
+
+
+async def resolve_tick_array_accounts(
+    connection: AsyncRoutedClient,
+    finder: AccountFinder,
+    whirlpool_pubkey: Pubkey,
+    whirlpool,
+    window: Optional[int] = TICK_WINDOW,
+) -> Tuple[List[Tuple[str, bytes]], list]:
+    """
+    `fetch_tick_array_accounts`, falling back to the program scan if
+    derivation fails, finds nothing for a pool that has liquidity, or finds
+    arrays that are not fixed-size TickArray accounts (e.g. the program's
+    newer dynamic tick arrays, which the IDL here cannot decode).
+
+    Returns:
+        Tuple[list, list]: Raw derived accounts, and tick arrays already
+            decoded by the scan (only one of the two is non-empty)
+    """
+    try:
+        accounts = await fetch_tick_array_accounts(
+            connection, whirlpool_pubkey, whirlpool, window
+        )
+        unknown = sum(
+            data[:ACCOUNT_DISCRIMINATOR_SIZE] != TICK_ARRAY_DISCRIMINATOR
+            for _, data in accounts
+        )
+        if unknown:
+            reason = f"{unknown} tick arrays of an unknown account type"
+        elif accounts or whirlpool.liquidity == 0:
+            return accounts, []
+        else:
+            reason = "no tick arrays found"
+    except Exception as exc:
+        reason = str(exc)
+    logger.info(f"{str(whirlpool_pubkey)[:6]}…  {reason}, scanning for tick arrays")
+    found = await with_retry(
+        finder.find_tick_arrays_by_whirlpool,
+        ORCA_WHIRLPOOL_PROGRAM_ID,
+        whirlpool_pubkey,
+    )
+    return [], found
+
+
+async def run_orca(
+    token: str,
+    rpc_url: str,
+    run_id: Optional[str] = None,
+    tick_window: Optional[int] = TICK_WINDOW,
+    concurrency: Optional[Dict[str, int]] = None,
+    pools: Optional[List[str]] = None,
+    time_budget: Optional[float] = None,
+    rescan_pools: bool = False,
+    detect_new_pools: bool = False,
+    shard: Optional[Shard] = None,
+    extraction_timestamp: Optional[str] = None,
+) -> dict | None:
+    """
+    Snapshot every Orca Whirlpool for `token` and upload it to S3.
+
+    Pools go through the staged pipeline (see `common.pipeline`); `concurrency`
+    overrides the workers per stage. Pools are checkpointed to a spool as
+    they finish (mirrored to the bucket, see `RunSpool`); calling again with
+    the same `run_id`, in any container, resumes an interrupted run instead
+    of starting over. Returns the run manifest (see
+    `upload_snapshot`, plus per-stage pipeline counters), or None if the
+    token has no pools.
+
+    Tick arrays are read by PDA: `tick_window` arrays either side of the
+    current tick, or every array in the valid tick range with None.
+
+    `pools` restricts the run to those pools (the ones the pool schedule
+    says are due, see `common.pool_schedule`); every run updates the
+    schedule with the activity it saw.
+
+    Pools are fetched most valuable first. With `time_budget` (seconds), no
+    pool is started once it is spent: the run finishes the pools in flight,
+    uploads them and lists the rest in the manifest's `deferred_pools`; the
+    next run reads those first. Pools whose fetch failed are listed in
+    `failed_pools` and also read first next time.
+
+    The token's pools come from the pool registry instead of a program scan
+    every run; `rescan_pools` forces a scan and `detect_new_pools` looks for
+    pools created since the last run (see `common.pool_registry`).
+
+    With `shard`, the run reads only that shard's pools and uploads them as
+    a part of the snapshot taken at `extraction_timestamp`, for
+    `finalize_snapshot` to merge (see `common.sharding`). A shard always
+    uploads its part, even without pools.
+    """
+    spool = RunSpool("orca", token, run_id)
+    deadline = Deadline(time_budget)
+    cache = get_account_cache()
+    cache_stats = cache.stats()
+
+    connection = AsyncRoutedClient(rpc_url)
     fetcher = AccountFetcher(connection)
     finder = AccountFinder(connection)
+    registry = build_registry()
 
-    pool_rows: list[dict] = []
-    tick_rows: list[dict] = []
-    position_rows: list[dict] = []
+    extraction_time = spool.start(extraction_timestamp or str(datetime.now()))
+    start_slot = spool.start_slot((await with_retry(connection.get_slot)).value)
 
-    extraction_time = str(datetime.now())
-    # logger.info(extraction_time)
+    def discover(token: str) -> List[str]:
+        pool_addresses = spool.pools()
+        if pool_addresses is None:
+            pool_addresses = pools or PoolRegistry(
+                routed_client(rpc_url), ORCA_POOLS, cache
+            ).pools(token, rescan=rescan_pools, detect=detect_new_pools)
+            if shard is not None:
+                pool_addresses = shard.select(pool_addresses)
+            spool.set_pools(pool_addresses)
+        return order_pools("orca", spool.pending(pool_addresses))
 
-    for addr in pool_addresses:
+    async def fetch(addr: str) -> dict:
         pubkey = Pubkey.from_string(addr)
-        try:
-            whirlpool = await with_retry(fetcher.get_whirlpool, pubkey)
-            tick_arrays_data = await with_retry(
-                finder.find_tick_arrays_by_whirlpool, ORCA_WHIRLPOOL_PROGRAM_ID, pubkey
-            )
-            token_vault_a = await with_retry(
-                fetcher.get_token_account, whirlpool.token_vault_a
-            )
-            token_vault_b = await with_retry(
-                fetcher.get_token_account, whirlpool.token_vault_b
-            )
-            positions_data = await with_retry(
-                finder.find_positions_by_whirlpool, ORCA_WHIRLPOOL_PROGRAM_ID, pubkey
-            )
+        whirlpool = await with_retry(fetcher.get_whirlpool, pubkey)
+        tick_accounts, scanned = await resolve_tick_array_accounts(
+            connection, finder, pubkey, whirlpool, tick_window
+        )
+        positions_data = await with_retry(
+            finder.find_positions_by_whirlpool, ORCA_WHIRLPOOL_PROGRAM_ID, pubkey
+        )
+        return {
+            "pubkey": pubkey,
+            "whirlpool": whirlpool,
+            "tick_accounts": tick_accounts,
+            "scanned_tick_arrays": scanned,
+            "positions": positions_data,
+        }
 
-            position_rows.extend(
-                {**serialize_position(p), "extraction_timestamp": extraction_time}
-                for p in positions_data
-            )
-
-            pool_rows.append(
+    def decode(fetched: dict) -> Tuple[str, Dict[str, list]]:
+        pubkey = fetched["pubkey"]
+        tick_arrays = decode_tick_arrays(registry, fetched["tick_accounts"]) + [
+            WhirlpoolTickArrayRow.from_account(ta)
+            for ta in fetched["scanned_tick_arrays"]
+        ]
+        positions_data = fetched["positions"]
+        logger.info(
+            f"{str(pubkey)[:6]}…  tick_arrays={len(tick_arrays):<3} "
+            f"positions={len(positions_data):<4}"
+        )
+        return str(pubkey), {
+            "pool": [
                 {
-                    "whirlpool": serialize_whirlpool(whirlpool, pubkey, token),
-                    "token_vault_a_amount": serialize_token_accounts(token_vault_a),
-                    "token_vault_b_amount": serialize_token_accounts(token_vault_b),
+                    "whirlpool": WhirlpoolRow.from_account(
+                        fetched["whirlpool"], pubkey, token
+                    ),
+                    # filled in for every pool at once by fetch_vault_amounts
+                    "token_vault_a_amount": None,
+                    "token_vault_b_amount": None,
                     "extraction_timestamp": extraction_time,
                 }
-            )
-
-            tick_rows.append(
+            ],
+            "tick": [
                 {
                     "pool": str(pubkey),
-                    "tick_arrays": [
-                        serialize_tick_array(ta) for ta in tick_arrays_data
-                    ],
+                    "tick_arrays": tick_arrays,
                     "extraction_timestamp": extraction_time,
                 }
-            )
+            ],
+            "position": [
+                WhirlpoolPositionRow.from_account(p, extraction_time)
+                for p in positions_data
+            ],
+        }
 
-            logger.info(
-                f"{addr[:6]}…  tick_arrays={len(tick_arrays_data):<3} "
-                f"positions={len(positions_data):<4}"
-            )
+    pipeline = Pipeline(
+        snapshot_stages(
+            spool,
+            discover=in_thread(discover),
+            fetch=fetch,
+            decode=in_thread(decode),
+            concurrency=concurrency,
+            defaults=ORCA_CONCURRENCY,
+            deadline=deadline,
+        )
+    )
+    await pipeline.run([token])
+    pipeline.log_summary()
+    if deadline.deferred:
+        logger.warning(
+            f"Time budget of {time_budget}s spent: "
+            f"{len(deadline.deferred)} pools deferred to the next run"
+        )
+    failed = pipeline.dropped("fetch")
+    if failed:
+        logger.warning(f"{len(failed)} pools failed to fetch: {failed}")
 
-        except Exception as exc:
-            logger.info(f"Failed to fetch {addr}: {exc}")
+    if not spool.pools() and shard is None:
+        logger.info("No pools found for token.")
+        await connection.close()
+        spool.cleanup()
+        return None
 
-    timestamp = get_timestamp()
-    bucket = get_s3_bucket()
+    # only the pool rows are held in memory (their vault balances are filled
+    # in here); the other kinds are streamed from the spool
+    kinds = ["tick", "position"]
+    pool_rows = list(spool.rows("pool"))
+    outputs = {"pool": pool_rows, **spool.outputs(kinds, raw=True)}
 
-    key_pool = f"{ORCA_STORAGE_KEY}/pool/{token}_{timestamp}_pools.json"
-    key_tick = f"{ORCA_STORAGE_KEY}/tick/{token}_{timestamp}_ticks.json"
-    key_position = f"{ORCA_STORAGE_KEY}/position/{token}_{timestamp}_positions.json"
+    logger.info(f"Fetching vault balances for {len(pool_rows)} pools...")
+    await fetch_vault_amounts(connection, pool_rows)
 
-    upload_to_s3(bucket=bucket, key=key_pool, data=pool_rows)
-    upload_to_s3(bucket=bucket, key=key_tick, data=tick_rows)
-    upload_to_s3(bucket=bucket, key=key_position, data=position_rows)
+    upload = upload_snapshot
+    if shard is not None:
+        # the run's schedule update is made once, from every part's
+        # observations, by `finalize_snapshot`
+        upload = partial(
+            upload_snapshot_part,
+            shard=shard,
+            assigned=spool.pools(),
+            observations=snapshot_observations(
+                "orca", token, {"pool": pool_rows, **spool.outputs(kinds)}
+            ),
+            deferred=deadline.deferred,
+            failed=failed,
+        )
+    manifest = upload(
+        get_s3_bucket(),
+        ORCA_STORAGE_KEY,
+        "orca",
+        token,
+        extraction_time,
+        outputs,
+        (start_slot, (await with_retry(connection.get_slot)).value),
+        # only pools with a pool row; the index points the models at them
+        [row["whirlpool"]["pubkey"] for row in pool_rows],
+    )
+    registry.log_errors()
+    log_endpoint_summary(connection)
     await connection.close()
+
+    # a shard's part has no index row, see `finalize_snapshot`
+    archived = outputs if shard else {**outputs, "snapshot_index": [manifest["index"]]}
+    try:
+        archive_snapshot(
+            "orca",
+            token,
+            extraction_time,
+            archived,
+            part=shard.label if shard else None,
+        )
+    except Exception as exc:
+        # best-effort: the snapshot is already uploaded
+        logger.warning(f"Failed to archive snapshot locally: {exc}")
+    if shard is None:
+        # read from the spool, so before it is cleaned up
+        manifest["schedule"] = record_snapshot(
+            "orca",
+            token,
+            {"pool": pool_rows, **spool.outputs(kinds)},
+            all_pools=None if pools else spool.pools(),
+            # failed pools are read first next time, like deferred ones
+            deferred=deadline.deferred + failed,
+        )
+    spool.cleanup()
+
+    manifest["cache_hit_rates"] = cache.hit_rates(since=cache_stats)
+    manifest["pipeline"] = pipeline.summary()
+    manifest["deferred_pools"] = deadline.deferred
+    manifest["failed_pools"] = failed
+    manifest["field_profile"] = active_field_profile()
+    logger.info(f"Account cache: {manifest['cache_hit_rates']}")
+    return manifest
@@ -1,14 +1,16 @@
+import asyncio
 import logging
 import struct
+import threading
 import time
 from datetime import datetime
+from functools import lru_cache, partial
 from time import sleep
-from typing import Dict, List, Optional
+from typing import Dict, List, Optional, Tuple
 
-from dotenv import load_dotenv
+import msgspec
 from httpx import HTTPStatusError
 from solana.exceptions import SolanaRpcException
-from solana.rpc.api import Client
 from solana.rpc.commitment import Processed
 from solana.rpc.types import MemcmpOpts
 from solders.pubkey import Pubkey
@@ -20,11 +22,37 @@ from tenacity import (
     before_sleep_log,
 )
 
+from dex_dagster.ingestion.src.common.account_cache import get_account_cache
+from dex_dagster.ingestion.src.common.archive import archive_snapshot
+from dex_dagster.ingestion.src.common.checkpoint import RunSpool
 from dex_dagster.ingestion.src.common.constants import RAYDIUM_STORAGE_KEY
+from dex_dagster.ingestion.src.common.field_profiles import active_field_profile
+from dex_dagster.ingestion.src.common.pipeline import (
+    Deadline,
+    Pipeline,
+    in_thread,
+    snapshot_stages,
+)
+from dex_dagster.ingestion.src.common.pool_registry import PoolProgram, PoolRegistry
+from dex_dagster.ingestion.src.common.pool_schedule import (
+    order_pools,
+    record_snapshot,
+    snapshot_observations,
+)
+from dex_dagster.ingestion.src.common.rpc_router import (
+    log_endpoint_summary,
+    routed_client,
+)
+from dex_dagster.ingestion.src.common.sharding import Shard, upload_snapshot_part
+from dex_dagster.ingestion.src.common.spl_token import (
+    chunked,
+    decode_token_account,
+    mint_cache,
+    vault_balance,
+)
 from dex_dagster.ingestion.src.common.utility import (
     get_s3_bucket,
-    get_timestamp,
-    upload_to_s3,
+    upload_snapshot,
 )
 from dex_dagster.ingestion.src.decoders.raydium_decoder import AnchorRaydiumDecoder
 
@@ -35,8 +63,6 @@ logging.basicConfig(
 )
 logger = logging.getLogger("dex")
 
-load_dotenv()
-
 PROTOCOL_POSITION_SIZE = 225
 POOL_ID_OFFSET = 9
 TICK_ARRAY_SIZE = 60
@@ -49,38 +75,55 @@ MAX_REQUESTS_PER_SECOND = 3  # Conservative limit
 REQUEST_WINDOW = 1.0  # 1 second window
 last_request_time = 0
 
+# pipeline workers per stage; RPC calls share the rate limit above, so more
+# fetch workers only help while others are decoding or writing
+RAYDIUM_CONCURRENCY = {"fetch": 2, "decode": 1, "serialize": 1}
+
+
+# PDAs are a pure function of their seeds; memoized in process, since a
+# derivation is cheaper than any persistent cache lookup
+@lru_cache(maxsize=65536)
+def find_program_address(seeds: Tuple[bytes, ...], program_id: Pubkey) -> str:
+    pda, _ = Pubkey.find_program_address(list(seeds), program_id)
+    return str(pda)
+
 
 class RaydiumDataFetcher:
     def __init__(self, rpc_url: str):
         self.rpc_url = rpc_url
-        self.client = Client(rpc_url)
-        self.decoder = AnchorRaydiumDecoder(rpc_url)
+        self.client = routed_client(rpc_url)
+        self.cache = get_account_cache()
+        self.decoder = AnchorRaydiumDecoder(rpc_url, typed=True)
         self.PROGRAM_ID = Pubkey.from_string(
             "CAMMCzo5YL8w4VFF8KVHrK22GGUsp5VTaW7grrKgrWqK"
         )
         self.request_times = []  # Track request timestamps for rate limiting
+        self._rate_lock = threading.Lock()  # fetch workers share the limit
 
     def initialize(self) -> None:
         self.decoder.initialize()
 
     def apply_rate_limit(self):
         """Apply rate limiting to prevent 429 errors"""
-        current_time = time.time()
-        
-        # Remove timestamps older than our window
-        self.request_times = [t for t in self.request_times if current_time - t < REQUEST_WINDOW]
-        
-        # If we've made too many requests in the window, wait
-        if len(self.request_times) >= MAX_REQUESTS_PER_SECOND:
-            # Wait until the oldest request is outside our window
-            sleep_time = REQUEST_WINDOW - (current_time - self.request_times[0])
-            if sleep_time > 0:
-                logger.debug(f"Rate limiting: sleeping for {sleep_time:.2f}s")
-                time.sleep(sleep_time)
-                current_time = time.time()  # Update after sleeping
-        
-        # Record this request
-        self.request_times.append(current_time)
+        with self._rate_lock:
+            current_time = time.time()
+
+            # Remove timestamps older than our window
+            self.request_times = [
+                t for t in self.request_times if current_time - t < REQUEST_WINDOW
+            ]
+
+            # If we've made too many requests in the window, wait
+            if len(self.request_times) >= MAX_REQUESTS_PER_SECOND:
+                # Wait until the oldest request is outside our window
+                sleep_time = REQUEST_WINDOW - (current_time - self.request_times[0])
+                if sleep_time > 0:
+                    logger.debug(f"Rate limiting: sleeping for {sleep_time:.2f}s")
+                    time.sleep(sleep_time)
+                    current_time = time.time()  # Update after sleeping
+
+            # Record this request
+            self.request_times.append(current_time)
 
     # Improved retry decorator with longer backoff and logging
     SyncRetry = retry(
@@ -92,38 +135,19 @@ class RaydiumDataFetcher:
     )
 
     @SyncRetry
-    def fetch_pools_for_token(
-        self,
-        token_mint: str,
-        quote_offset: int,
-        base_offset: int,
-        data_length: int,
-    ) -> List[str]:
-        self.apply_rate_limit()  # Apply rate limiting before request
-        
-        memcmp_base = MemcmpOpts(offset=base_offset, bytes=token_mint)
-        memcmp_quote = MemcmpOpts(offset=quote_offset, bytes=token_mint)
-        found = set()
-
-        resp_base = self.client.get_program_accounts(
-            self.PROGRAM_ID,
-            commitment=Processed,
-            filters=[data_length, memcmp_base],
+    def current_slot(self) -> int:
+        self.apply_rate_limit()
+        return self.client.get_slot().value
+
+    def pool_registry(
+        self, quote_offset: int, base_offset: int, length: int
+    ) -> PoolRegistry:
+        program = PoolProgram(
+            "raydium", str(self.PROGRAM_ID), length, (quote_offset, base_offset)
         )
-        for account in resp_base.value:
-            found.add(str(account.pubkey))
-
-        self.apply_rate_limit()  # Apply rate limiting between requests
-        
-        resp_quote = self.client.get_program_accounts(
-            self.PROGRAM_ID,
-            commitment=Processed,
-            filters=[data_length, memcmp_quote],
+        return PoolRegistry(
+            self.client, program, self.cache, before_call=self.apply_rate_limit
         )
-        for account in resp_quote.value:
-            found.add(str(account.pubkey))
-
-        return list(found)
 
     @staticmethod
     def get_array_start_index(tick_index: int, tick_spacing: int) -> int:
@@ -134,15 +158,12 @@ class RaydiumDataFetcher:
         return start * ticks_in_array
 
     def get_extension_address(self, pool_id: Pubkey) -> str:
-        seeds = [b"pool_tick_array_bitmap_extension", bytes(pool_id)]
-        address, _ = Pubkey.find_program_address(seeds, self.PROGRAM_ID)
-        return str(address)
+        seeds = (b"pool_tick_array_bitmap_extension", bytes(pool_id))
+        return find_program_address(seeds, self.PROGRAM_ID)
 
     def get_tick_array_address(self, pool_id: Pubkey, start_index: int) -> str:
-        seed_index = struct.pack(">i", start_index)
-        seeds = [b"tick_array", bytes(pool_id), seed_index]
-        pda, _ = Pubkey.find_program_address(seeds, self.PROGRAM_ID)
-        return str(pda)
+        seeds = (b"tick_array", bytes(pool_id), struct.pack(">i", start_index))
+        return find_program_address(seeds, self.PROGRAM_ID)
 
     @SyncRetry
     def get_account_data(self, address: str) -> Optional[Dict]:
@@ -160,7 +181,70 @@ class RaydiumDataFetcher:
             return None
 
     @SyncRetry
-    def fetch_protocol_positions(self, pool_pubkey: str) -> List[dict]:
+    def get_multiple_accounts(
+        self, addresses: List[str]
+    ) -> Dict[str, Optional[bytes]]:
+        """
+        Raw data of many accounts, fetched with chunked `getMultipleAccounts`.
+
+        Returns:
+            Dict[str, Optional[bytes]]: Account data by address (None if missing)
+        """
+        accounts: Dict[str, Optional[bytes]] = {}
+        for chunk in chunked(addresses):
+            self.apply_rate_limit()
+            resp = self.client.get_multiple_accounts(
+                [Pubkey.from_string(a) for a in chunk]
+            )
+            for address, account in zip(chunk, resp.value):
+                accounts[address] = bytes(account.data) if account else None
+        return accounts
+
+    def fetch_vault_balances(self, pool_rows: List[Dict]) -> None:
+        """
+        Fills `tokenVault0`/`tokenVault1` of every pool row in place.
+
+        All vaults are fetched together and decoded locally instead of two
+        `getTokenAccountBalance` calls per pool. Decimals come from the mint
+        cache, seeded from the pool state; unknown mints are fetched once.
+        """
+        vaults = []
+        for row in pool_rows:
+            data = row["pool"]["parsed"]["data"]
+            for i in (0, 1):
+                mint_cache.seed(data[f"tokenMint{i}"], data[f"mintDecimals{i}"])
+                vaults.append((row, f"tokenVault{i}", data[f"tokenVault{i}"]))
+        if not vaults:
+            return
+
+        accounts = self.get_multiple_accounts(
+            list(dict.fromkeys(address for _, _, address in vaults))
+        )
+        decoded = {
+            address: decode_token_account(raw) if raw else None
+            for address, raw in accounts.items()
+        }
+
+        missing_mints = mint_cache.missing(
+            acct["mint"] for acct in decoded.values() if acct
+        )
+        if missing_mints:
+            mint_cache.update(self.get_multiple_accounts(missing_mints))
+
+        for row, field, address in vaults:
+            account = decoded.get(address)
+            decimals = mint_cache.get(account["mint"]) if account else None
+            if account is None or decimals is None:
+                logger.info(
+                    f"Could not read vault {address} of {row['pool']['address']}"
+                )
+                continue
+            row[field] = vault_balance(address, account, decimals)
+
+    @SyncRetry
+    def fetch_protocol_position_accounts(
+        self, pool_pubkey: str
+    ) -> List[Tuple[str, bytes]]:
         self.apply_rate_limit()  # Apply rate limiting before request
         
         pool_key = Pubkey.from_string(pool_pubkey)
@@ -171,16 +255,12 @@ class RaydiumDataFetcher:
         resp = self.client.get_program_accounts(
             self.PROGRAM_ID, commitment=Processed, filters=filters
         )
-
-        decoded: List[dict] = []
-        for acct in resp.value:
-            dec = self.decoder.decode_account(acct.account.data, str(acct.pubkey))
-            if "error" not in dec:
-                decoded.append(dec["parsed"]["data"])
-        return decoded
+        return [(str(acct.pubkey), bytes(acct.account.data)) for acct in resp.value]
 
     @SyncRetry
-    def fetch_personal_positions(self, pool_pubkey: str) -> list[dict]:
+    def fetch_personal_position_accounts(
+        self, pool_pubkey: str
+    ) -> List[Tuple[str, bytes]]:
         self.apply_rate_limit()  # Apply rate limiting before request
         
         pool_key = Pubkey.from_string(pool_pubkey)
@@ -191,12 +271,14 @@ class RaydiumDataFetcher:
             commitment=Processed,
             filters=filters,
         )
-        decoded: list[dict] = []
-        for acct in resp.value:
-            parsed = self.decoder.decode_account(acct.account.data, str(acct.pubkey))
-            if parsed and "error" not in parsed:
-                decoded.append(parsed["parsed"]["data"])
-        return decoded
+        return [(str(acct.pubkey), bytes(acct.account.data)) for acct in resp.value]
+
+    def decode_positions(
+        self, accounts: List[Tuple[str, bytes]], account_type: str
+    ) -> List:
+        """Decoded data of the position accounts of one type, in fetch order."""
+        batches = self.decoder.registry.decode_many(accounts)
+        return [dec["parsed"]["data"] for dec in batches.get(account_type, [])]
 
     @SyncRetry
     def fetch_pool_data(self, pool_address: str) -> Dict:
@@ -206,22 +288,9 @@ class RaydiumDataFetcher:
 
         try:
             data = pool_account["parsed"]["data"]
-            current_tick = int(data["tickCurrent"])
-            tick_spacing = int(data["tickSpacing"])
-            bitmap = data.get("tickArrayBitmap", [])
-
-            token_vault0 = data["tokenVault0"]
-            token_vault1 = data["tokenVault1"]
-
-            self.apply_rate_limit()
-            token_vault0_balance = self.client.get_token_account_balance(
-                Pubkey.from_string(token_vault0)
-            )
-            
-            self.apply_rate_limit()
-            token_vault1_balance = self.client.get_token_account_balance(
-                Pubkey.from_string(token_vault1)
-            )
+            current_tick = data.tick_current
+            tick_spacing = data.tick_spacing
+            bitmap = data.tick_array_bitmap
 
             pool_pubkey = Pubkey.from_string(pool_address)
             ext_addr = self.get_extension_address(pool_pubkey)
@@ -237,13 +306,14 @@ class RaydiumDataFetcher:
                     start_idx = (bit - mid) * ticks_per_array
                     initialized.append(start_idx)
 
-            tick_arrays = {}
-            for start in initialized:
-                arr_addr = self.get_tick_array_address(pool_pubkey, start)
-                arr_data = self.get_account_data(arr_addr)
-                if arr_data and "error" not in arr_data:
-                    tick_arrays[arr_addr] = arr_data
-                time.sleep(0.2)
+            # raw (address, data) pairs; decoded by decode_pool_accounts
+            addresses = [
+                self.get_tick_array_address(pool_pubkey, start) for start in initialized
+            ]
+            raw_arrays = self.get_multiple_accounts(addresses) if addresses else {}
+            tick_arrays = [
+                (address, data) for address, data in raw_arrays.items() if data
+            ]
 
             return {
                 "timestamp": str(datetime.now()),
@@ -255,93 +325,288 @@ class RaydiumDataFetcher:
                 "currentArrayStart": self.get_array_start_index(
                     current_tick, tick_spacing
                 ),
-                "tokenVault0": {
-                    "address": token_vault0,
-                    "balance": token_vault0_balance.value.amount,
-                    "decimals": token_vault0_balance.value.decimals,
-                    "amount": token_vault0_balance.value.ui_amount_string,
-                },
-                "tokenVault1": {
-                    "address": token_vault1,
-                    "balance": token_vault1_balance.value.amount,
-                    "decimals": token_vault1_balance.value.decimals,
-                    "amount": token_vault1_balance.value.ui_amount_string,
-                },
+                # filled in for every pool at once by fetch_vault_balances
+                "tokenVault0": None,
+                "tokenVault1": None,
             }
         except Exception as exc:
             logger.info(f"Error processing pool {pool_address}: {exc}")
             return {"error": str(exc)}
 
-    def run(self, token: str, quote_offset: int, base_offset: int, length: int) -> None:
-        pools = self.fetch_pools_for_token(token, quote_offset, base_offset, length)
-        extraction_time = str(datetime.now())
-
+    def discover(
+        self,
+        spool: RunSpool,
+        token: str,
+        quote_offset: int,
+        base_offset: int,
+        length: int,
+        only: Optional[List[str]] = None,
+        rescan: bool = False,
+        detect: bool = False,
+        shard: Optional[Shard] = None,
+    ) -> List[str]:
+        """
+        Pools of `token` not yet in the spool (the pool list is spooled too),
+        most valuable first (see `order_pools`).
+
+        The token's pools come from the pool registry, which only scans for
+        them when stale or when `rescan` is set, and with `detect` looks for
+        new ones by signature (see `common.pool_registry`). With `only`, those
+        pools are snapshotted instead and the registry isn't read. With
+        `shard`, only the pools hashed to it are (see `common.sharding`).
+        """
+        pools = spool.pools()
+        if pools is None:
+            pools = only or self.pool_registry(quote_offset, base_offset, length).pools(
+                token, rescan=rescan, detect=detect
+            )
+            if shard is not None:
+                pools = shard.select(pools)
+            spool.set_pools(pools)
         logger.info(f"Found {len(pools)} pools for token {token}")
-
-        pool_rows: list[dict] = []
-        tick_rows: list[dict] = []
-        proto_pos_rows: list[dict] = []
-        pers_pos_rows: list[dict] = []
-
-        for p in pools:
-            logger.info(f"\n── {p}")
-
-            logger.info("Fetching protocol positions...")
-            proto_pos = self.fetch_protocol_positions(p)
-            if proto_pos:
-                proto_pos_rows.extend(
-                    {**pos, "extraction_timestamp": extraction_time}
-                    for pos in proto_pos
-                )
-            else:
-                logger.info("no protocol positions")
-
-            time.sleep(1)
-            
-            logger.info("Fetching personal positions...")
-            pers_pos = self.fetch_personal_positions(p)
-            if pers_pos:
-                pers_pos_rows.extend(
-                    {**pos, "extraction_timestamp": extraction_time} for pos in pers_pos
-                )
-            else:
-                logger.info("no personal positions")
-
-            time.sleep(1)
-            
-            logger.info("Fetching pool data...")
-            pool_blob = self.fetch_pool_data(p)
-            if pool_blob and "error" not in pool_blob:
-                tick_rows.append(
-                    {
-                        "pool": p,
-                        "tickArrays": pool_blob.pop("tickArrays", {}),
-                        "extraction_timestamp": extraction_time,
-                    }
-                )
-                pool_blob["extraction_timestamp"] = extraction_time
-                pool_rows.append(pool_blob)
-            else:
-                logger.info(f"Failed pool fetch: {pool_blob}")
-
-            logger.info(f"Completed processing pool {p}, pausing before next pool")
-            time.sleep(3)
-
-        timestamp = get_timestamp()
-        bucket = get_s3_bucket()
-        
-        key_pool = f"{RAYDIUM_STORAGE_KEY}/pool/{token}_{timestamp}_pools.json"
-        key_tick = f"{RAYDIUM_STORAGE_KEY}/tick/{token}_{timestamp}_ticks.json"
-        key_proto_position = f"{RAYDIUM_STORAGE_KEY}/protocol_position/{token}_{timestamp}_protocol_position.json"
-        key_pers_position = f"{RAYDIUM_STORAGE_KEY}/personal_position/{token}_{timestamp}_personal_position.json"
-
-        upload_to_s3(bucket, key_pool, pool_rows)
-        upload_to_s3(bucket, key_tick, tick_rows)
-        upload_to_s3(bucket, key_proto_position, proto_pos_rows)
-        upload_to_s3(bucket, key_pers_position, pers_pos_rows)
-
-
-def run_raydium(token: str, rpc_url: str) -> None:
+        return order_pools("raydium", spool.pending(pools))
+
+    def fetch_pool_accounts(self, pool: str) -> Dict:
+        """
+        Fetch stage: every account of one pool, positions still undecoded.
+
+        Raises if the pool state can't be read, so the pool is dropped and
+        stays pending instead of being spooled (and indexed) without rows.
+        """
+        logger.info(f"── {pool}: fetching pool data and positions")
+        pool_data = self.fetch_pool_data(pool)
+        if "error" in pool_data:
+            raise RuntimeError(f"Failed pool fetch: {pool_data['error']}")
+        return {
+            "pool": pool,
+            "protocol_positions": self.fetch_protocol_position_accounts(pool),
+            "personal_positions": self.fetch_personal_position_accounts(pool),
+            "pool_data": pool_data,
+        }
+
+    def decode_pool_accounts(
+        self, fetched: Dict, extraction_time: str
+    ) -> Tuple[str, Dict[str, list]]:
+        """Decode stage: the snapshot rows of one pool, per kind."""
+        p = fetched["pool"]
+
+        def stamped(accounts, account_type):
+            return [
+                msgspec.structs.replace(pos, extraction_timestamp=extraction_time)
+                for pos in self.decode_positions(accounts, account_type)
+            ]
+
+        proto_pos_rows = stamped(
+            fetched["protocol_positions"], "ProtocolPositionState"
+        )
+        if not proto_pos_rows:
+            logger.info(f"{p}: no protocol positions")
+        pers_pos_rows = stamped(fetched["personal_positions"], "PersonalPositionState")
+        if not pers_pos_rows:
+            logger.info(f"{p}: no personal positions")
+
+        pool_blob = fetched["pool_data"]
+        tick_arrays = self.decoder.registry.decode_many(pool_blob.pop("tickArrays", []))
+        tick_row = {
+            "pool": p,
+            "tickArrays": {
+                dec["address"]: dec for dec in tick_arrays.get("TickArrayState", [])
+            },
+            "extraction_timestamp": extraction_time,
+        }
+        pool_blob["extraction_timestamp"] = extraction_time
+
+        return p, {
+            "pool": [pool_blob],
+            "tick": [tick_row],
+            "protocol_position": proto_pos_rows,
+            "personal_position": pers_pos_rows,
+        }
+
+    def run(
+        self,
+        token: str,
+        quote_offset: int,
+        base_offset: int,
+        length: int,
+        run_id: Optional[str] = None,
+        concurrency: Optional[Dict[str, int]] = None,
+        pools: Optional[List[str]] = None,
+        time_budget: Optional[float] = None,
+        rescan_pools: bool = False,
+        detect_new_pools: bool = False,
+        shard: Optional[Shard] = None,
+        extraction_timestamp: Optional[str] = None,
+    ) -> dict:
+        spool = RunSpool("raydium", token, run_id)
+        deadline = Deadline(time_budget)
+        extraction_time = spool.start(extraction_timestamp or str(datetime.now()))
+        cache_stats = self.cache.stats()
+        slot = self.current_slot()
+        start_slot = spool.start_slot(slot)
+
+        discover = partial(
+            self.discover,
+            spool,
+            quote_offset=quote_offset,
+            base_offset=base_offset,
+            length=length,
+            only=pools,
+            rescan=rescan_pools,
+            detect=detect_new_pools,
+            shard=shard,
+        )
+        pipeline = Pipeline(
+            snapshot_stages(
+                spool,
+                discover=in_thread(discover),
+                fetch=in_thread(self.fetch_pool_accounts),
+                decode=in_thread(
+                    partial(self.decode_pool_accounts, extraction_time=extraction_time)
+                ),
+                concurrency=concurrency,
+                defaults=RAYDIUM_CONCURRENCY,
+                deadline=deadline,
+            )
+        )
+        asyncio.run(pipeline.run([token]))
+        pipeline.log_summary()
+        if deadline.deferred:
+            logger.warning(
+                f"Time budget of {time_budget}s spent: "
+                f"{len(deadline.deferred)} pools deferred to the next run"
+            )
+        failed = pipeline.dropped("fetch")
+        if failed:
+            logger.warning(f"{len(failed)} pools failed to fetch: {failed}")
+
+        # only the pool rows are held in memory (their vault balances are
+        # filled in here); the other kinds are streamed from the spool
+        kinds = ["tick", "protocol_position", "personal_position"]
+        pool_rows = list(spool.rows("pool"))
+        outputs = {"pool": pool_rows, **spool.outputs(kinds, raw=True)}
+
+        logger.info(f"Fetching vault balances for {len(pool_rows)} pools...")
+        self.fetch_vault_balances(pool_rows)
+
+        self.decoder.registry.log_errors()
+        log_endpoint_summary(self.client)
+
+        upload = upload_snapshot
+        if shard is not None:
+            # the run's schedule update is made once, from every part's
+            # observations, by `finalize_snapshot`
+            upload = partial(
+                upload_snapshot_part,
+                shard=shard,
+                assigned=spool.pools(),
+                observations=snapshot_observations(
+                    "raydium", token, {"pool": pool_rows, **spool.outputs(kinds)}
+                ),
+                deferred=deadline.deferred,
+                failed=failed,
+            )
+        manifest = upload(
+            get_s3_bucket(),
+            RAYDIUM_STORAGE_KEY,
+            "raydium",
+            token,
+            extraction_time,
+            outputs,
+            (start_slot, self.current_slot()),
+            # only pools with a pool row; the index points the models at them
+            [row["pool"]["address"] for row in pool_rows],
+        )
+        # a shard's part has no index row, see `finalize_snapshot`
+        archived = (
+            outputs if shard else {**outputs, "snapshot_index": [manifest["index"]]}
+        )
+        try:
+            archive_snapshot(
+                "raydium",
+                token,
+                extraction_time,
+                archived,
+                part=shard.label if shard else None,
+            )
+        except Exception as exc:
+            # best-effort: the snapshot is already uploaded
+            logger.warning(f"Failed to archive snapshot locally: {exc}")
+        if shard is None:
+            # read from the spool, so before it is cleaned up
+            manifest["schedule"] = record_snapshot(
+                "raydium",
+                token,
+                {"pool": pool_rows, **spool.outputs(kinds)},
+                all_pools=None if pools else spool.pools(),
+                # failed pools are read first next time, like deferred ones
+                deferred=deadline.deferred + failed,
+            )
+        spool.cleanup()
+
+        manifest["cache_hit_rates"] = self.cache.hit_rates(since=cache_stats)
+        manifest["pipeline"] = pipeline.summary()
+        manifest["deferred_pools"] = deadline.deferred
+        manifest["failed_pools"] = failed
+        manifest["field_profile"] = active_field_profile()
+        logger.info(f"Account cache: {manifest['cache_hit_rates']}")
+        return manifest
+
+
+def run_raydium(
+    token: str,
+    rpc_url: str,
+    run_id: Optional[str] = None,
+    concurrency: Optional[Dict[str, int]] = None,
+    pools: Optional[List[str]] = None,
+    time_budget: Optional[float] = None,
+    rescan_pools: bool = False,
+    detect_new_pools: bool = False,
+    shard: Optional[Shard] = None,
+    extraction_timestamp: Optional[str] = None,
+) -> dict:
+    """
+    Snapshot every Raydium CLMM pool for `token` and upload it to S3.
+
+    Pools go through the staged pipeline (see `common.pipeline`); `concurrency`
+    overrides the workers per stage. Pools are checkpointed to a spool as
+    they finish (mirrored to the bucket, see `RunSpool`); calling again with
+    the same `run_id`, in any container, resumes an interrupted run instead
+    of starting over. Returns the run manifest: the
+    exact object keys, row counts and sizes written, the slot range the run
+    covered, and per-stage pipeline counters.
+
+    `pools` restricts the run to those pools (the ones the pool schedule
+    says are due, see `common.pool_schedule`); every run updates the
+    schedule with the activity it saw.
+
+    Pools are fetched most valuable first. With `time_budget` (seconds), no
+    pool is started once it is spent: the run finishes the pools in flight,
+    uploads them and lists the rest in the manifest's `deferred_pools`; the
+    next run reads those first. Pools whose fetch failed are listed in
+    `failed_pools` and also read first next time.
+
+    The token's pools come from the pool registry instead of a program scan
+    every run; `rescan_pools` forces a scan and `detect_new_pools` looks for
+    pools created since the last run (see `common.pool_registry`).
+
+    With `shard`, the run reads only that shard's pools and uploads them as
+    a part of the snapshot taken at `extraction_timestamp`, for
+    `finalize_snapshot` to merge (see `common.sharding`).
+    """
     fetcher = RaydiumDataFetcher(rpc_url)
     fetcher.initialize()
-    fetcher.run(token, TOKEN_MINT_A_OFFSET, TOKEN_MINT_B_OFFSET, POOL_ACCOUNT_SIZE)
\ No newline at end of file
+    return fetcher.run(
+        token,
+        TOKEN_MINT_A_OFFSET,
+        TOKEN_MINT_B_OFFSET,
+        POOL_ACCOUNT_SIZE,
+        run_id,
+        concurrency,
+        pools,
+        time_budget,
+        rescan_pools,
+        detect_new_pools,
+        shard,
+        extraction_timestamp,
+    )
\ No newline at end of file
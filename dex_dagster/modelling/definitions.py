@@ -1,15 +1,46 @@
 import os
+import shutil
 from collections.abc import Mapping
 from pathlib import Path
 from typing import Any, Optional
-from dex_dagster.ingestion.definitions import raydium_snapshot, orca_snapshot, s3_resource, solana_config
+from dex_dagster.ingestion.definitions import (
+    SNAPSHOT_JOBS,
+    orca_snapshot,
+    raydium_snapshot,
+    s3_resource,
+    snapshot_schedule_sensor,
+    solana_config,
+)
 
 import dagster as dg
-from dagster_dbt import DagsterDbtTranslator, DbtCliResource, dbt_assets
+from dagster_dbt import (
+    DagsterDbtTranslator,
+    DbtCliResource,
+    build_dbt_asset_selection,
+    dbt_assets,
+)
+from dex_dagster.ingestion.src.common.utility import (
+    download_state_file,
+    shared_state_enabled,
+    upload_state_file,
+)
 from dex_dagster.modelling.project import dbt_project
 
 dbt_resource = DbtCliResource(project_dir=dbt_project)
 
+# manifest of the last successful build of each job, under <job name>/; used to
+# defer to and to skip unchanged views. The project dir doesn't outlive a run on
+# Dagster Cloud, so with a snapshot bucket the manifests are kept there too
+DBT_STATE_DIR = Path(os.getenv("DBT_STATE_DIR", dbt_project.project_dir / "state"))
+# row counts cost one extra query per model, so they are opt-in
+DBT_FETCH_ROW_COUNTS = os.getenv("DBT_FETCH_ROW_COUNTS", "false").lower() == "true"
+# seconds between two builds of a protocol's models; with the adaptive
+# schedule its snapshot can land every few minutes
+DBT_BUILD_MIN_INTERVAL = int(os.getenv("DBT_BUILD_MIN_INTERVAL", "3600"))
+
+RAYDIUM_DBT_SELECT = "+stg_raydium*+"
+ORCA_DBT_SELECT = "+stg_orca*+"
+
 
 class CustomizedDagsterDbtTranslator(DagsterDbtTranslator):
     def get_group_name(self, dbt_resource_props: Mapping[str, Any]) -> Optional[str]:
@@ -33,7 +64,62 @@ class CustomizedDagsterDbtTranslator(DagsterDbtTranslator):
     dagster_dbt_translator=CustomizedDagsterDbtTranslator(),
 )
 def dbt_soldex(context: dg.AssetExecutionContext, dbt: DbtCliResource):
-    yield from (dbt.cli(["build"], context=context).stream().fetch_row_counts())
+    job_name = context.run.job_name
+    invocation = dbt.cli(["build", *dbt_state_args(job_name)], context=context)
+    events = invocation.stream()
+    if DBT_FETCH_ROW_COUNTS:
+        events = events.fetch_row_counts()
+    yield from events
+    save_dbt_state(job_name, invocation.target_path)
+
+
+def dbt_state_args(job_name: str) -> list[str]:
+    """
+    Defer to the job's stored manifest and skip views whose definition hasn't
+    changed since the job last built them.
+
+    Tables are always rebuilt because their data changes every hour, but a view
+    only needs recreating when its SQL changes. The state is per job: the jobs
+    build different selections, so a view is only compared with the last build
+    that actually included it.
+    """
+    state_dir = DBT_STATE_DIR / job_name
+    state_dir.mkdir(parents=True, exist_ok=True)
+    manifest = state_dir / "manifest.json"
+    if shared_state_enabled():
+        try:
+            found = download_state_file(f"dbt/{job_name}/manifest.json", manifest)
+        except Exception as exc:
+            dg.get_dagster_logger().warning(f"Building without dbt state: {exc}")
+            found = False
+        if not found:
+            # the bucket is the record of what was built; a local copy isn't
+            manifest.unlink(missing_ok=True)
+    if not manifest.exists():
+        return []
+    return [
+        "--defer",
+        "--state",
+        str(state_dir),
+        "--exclude",
+        "config.materialized:view,state:unmodified",
+    ]
+
+
+def save_dbt_state(job_name: str, target_path: Path) -> None:
+    """Stores the manifest of a finished build as the job's state for its next one."""
+    manifest = Path(target_path) / "manifest.json"
+    if not manifest.exists():
+        return
+    state_dir = DBT_STATE_DIR / job_name
+    state_dir.mkdir(parents=True, exist_ok=True)
+    shutil.copy(manifest, state_dir / "manifest.json")
+    if shared_state_enabled():
+        try:
+            upload_state_file(f"dbt/{job_name}/manifest.json", manifest)
+        except Exception as exc:
+            # the next build of the job then rebuilds its views, nothing worse
+            dg.get_dagster_logger().warning(f"Failed to store the dbt state: {exc}")
 
 
 dbt_build_job = dg.define_asset_job(
@@ -41,17 +127,56 @@ dbt_build_job = dg.define_asset_job(
     selection=[dbt_soldex], 
 )
 
+raydium_dbt_job = dg.define_asset_job(
+    "raydium_dbt_job",
+    selection=build_dbt_asset_selection([dbt_soldex], dbt_select=RAYDIUM_DBT_SELECT),
+)
+
+orca_dbt_job = dg.define_asset_job(
+    "orca_dbt_job",
+    selection=build_dbt_asset_selection([dbt_soldex], dbt_select=ORCA_DBT_SELECT),
+)
+
+SNAPSHOT_DBT_JOBS = {
+    dg.AssetKey("raydium_snapshot"): raydium_dbt_job,
+    dg.AssetKey("orca_snapshot"): orca_dbt_job,
+}
+
 
 @dg.multi_asset_sensor(
-    monitored_assets=[dg.AssetKey("raydium_snapshot"), dg.AssetKey("orca_snapshot")],
-    job=dbt_build_job,
+    monitored_assets=list(SNAPSHOT_DBT_JOBS),
+    jobs=list(SNAPSHOT_DBT_JOBS.values()),
 )
 def snapshot_sensor(context):
+    """
+    Builds each protocol's models once its own snapshot lands.
+
+    Builds are coalesced: while the protocol's last build is still running,
+    or started less than `DBT_BUILD_MIN_INTERVAL` ago, new snapshots are left
+    unconsumed in the cursor, and a single build picks all of them up once
+    it is allowed.
+    """
+    import time
+
     asset_events = context.latest_materialization_records_by_key()
-    if all(asset_events.values()):
-        context.advance_all_cursors()
-        return dg.RunRequest(run_key=context.cursor, run_config={})
-    return None
+    for asset_key, record in asset_events.items():
+        if record is None:
+            continue
+        job = SNAPSHOT_DBT_JOBS[asset_key]
+        last = context.instance.get_run_records(
+            filters=dg.RunsFilter(job_name=job.name), limit=1
+        )
+        if last and (
+            not last[0].dagster_run.is_finished
+            or time.time() - last[0].create_timestamp.timestamp()
+            < DBT_BUILD_MIN_INTERVAL
+        ):
+            continue
+        yield dg.RunRequest(
+            run_key=f"{asset_key.to_user_string()}:{record.storage_id}",
+            job_name=job.name,
+        )
+        context.advance_cursor({asset_key: record})
 
 
 defs = dg.Definitions(
@@ -61,6 +186,6 @@ defs = dg.Definitions(
         "solana": solana_config,
         "dbt": dbt_resource,  # Adding the dbt resource
     },
-    jobs=[dbt_build_job],
-    sensors=[snapshot_sensor],
+    jobs=[dbt_build_job, raydium_dbt_job, orca_dbt_job, *SNAPSHOT_JOBS.values()],
+    sensors=[snapshot_sensor, snapshot_schedule_sensor],
 )
@@ -0,0 +1,192 @@
+"""
+Resuming a snapshot run from its spool in another container.
+
+The bucket is an in-memory stand-in for the state helpers `RunSpool` mirrors
+to, and each "container" is a separate local spool root; a resumed run must
+restore the spool from the bucket, keep the first attempt's extraction
+timestamp and fetch only the pools that weren't finished.
+"""
+
+import json
+import shutil
+from types import SimpleNamespace as NS
+
+import pytest
+
+from dex_dagster.ingestion.src.common import checkpoint
+from dex_dagster.ingestion.src.common.checkpoint import RunSpool
+from dex_dagster.ingestion.src.common.rows import decode_json
+from dex_dagster.ingestion.src.protocols import raydium
+
+TOKEN = "So11111111111111111111111111111111111111112"
+POOLS = [f"pool{i}" for i in range(6)]
+
+
+class FakeBucket:
+    """The state prefix of the snapshot bucket: name -> document or file bytes."""
+
+    def __init__(self):
+        self.objects = {}
+
+    def read_state(self, name):
+        return self.objects.get(f"{name}.json")
+
+    def write_state(self, name, data):
+        self.objects[f"{name}.json"] = json.loads(json.dumps(data))
+
+    def upload_state_file(self, name, path):
+        self.objects[name] = path.read_bytes()
+
+    def download_state_file(self, name, path):
+        if name not in self.objects:
+            return False
+        path.write_bytes(self.objects[name])
+        return True
+
+    def delete_state_prefix(self, prefix):
+        for name in [n for n in self.objects if n.startswith(f"{prefix}/")]:
+            del self.objects[name]
+
+
+@pytest.fixture
+def bucket(monkeypatch):
+    bucket = FakeBucket()
+    monkeypatch.setattr(checkpoint, "shared_state_enabled", lambda: True)
+    # mirror every finished pool, unless a test says otherwise
+    monkeypatch.setattr(checkpoint, "SPOOL_SYNC_EVERY", 1)
+    for name in (
+        "read_state",
+        "write_state",
+        "upload_state_file",
+        "download_state_file",
+        "delete_state_prefix",
+    ):
+        monkeypatch.setattr(checkpoint, name, getattr(bucket, name))
+    return bucket
+
+
+@pytest.fixture
+def container(tmp_path, monkeypatch):
+    """Switches to a fresh container: a new, empty local spool root."""
+    containers = iter(range(100))
+
+    def switch():
+        root = tmp_path / f"container{next(containers)}"
+        monkeypatch.setattr(checkpoint, "SPOOL_DIR", root)
+        return root
+
+    switch()
+    return switch
+
+
+def partial_spool(run_id, done):
+    spool = RunSpool("raydium", TOKEN, run_id)
+    spool.start("2025-06-01 13:00:07")
+    spool.start_slot(100)
+    spool.set_pools(POOLS)
+    for pool in done:
+        spool.write_pool(pool, pool_rows(pool, "2025-06-01 13:00:07"))
+    return spool
+
+
+def pool_rows(pool, ts):
+    return {
+        "pool": [{"pool": {"address": pool}, "extraction_timestamp": ts}],
+        "tick": [{"pool": pool, "tickArrays": {}, "extraction_timestamp": ts}],
+        "protocol_position": [],
+        "personal_position": [],
+    }
+
+
+class FakeFetcher(raydium.RaydiumDataFetcher):
+    """The Raydium fetcher with its RPC and decoding stubbed out."""
+
+    def __init__(self):
+        self.fetched = []
+        self.client = NS(summary=lambda: [])
+        self.cache = NS(stats=lambda: {}, hit_rates=lambda since: {})
+        self.decoder = NS(registry=NS(log_errors=lambda: None))
+
+    def current_slot(self):
+        return 100 + len(self.fetched)
+
+    def pool_registry(self, *args):
+        raise AssertionError("a resumed run reads its pool list from the spool")
+
+    def fetch_pool_accounts(self, pool):
+        self.fetched.append(pool)
+        return {"pool": pool}
+
+    def decode_pool_accounts(self, fetched, extraction_time):
+        return fetched["pool"], pool_rows(fetched["pool"], extraction_time)
+
+    def fetch_vault_balances(self, pool_rows):
+        pass
+
+
+def test_spool_is_restored_in_another_container(bucket, container):
+    first = partial_spool("run", POOLS[:2])
+    container()
+    spool = RunSpool("raydium", TOKEN, "run")
+
+    assert spool.path != first.path
+    assert spool.completed() == POOLS[:2]
+    assert spool.pools() == POOLS
+    assert spool.start("2025-06-01 14:00:00") == "2025-06-01 13:00:07"
+    assert spool.start_slot(200) == 100
+    assert [row["pool"]["address"] for row in spool.rows("pool")] == POOLS[:2]
+
+
+def test_pools_missing_from_the_bucket_are_fetched_again(bucket, container):
+    partial_spool("run", POOLS[:3])
+    del bucket.objects[f"spool/raydium/{TOKEN}/run/pools/{POOLS[1]}.json"]
+    container()
+
+    assert RunSpool("raydium", TOKEN, "run").completed() == [POOLS[0], POOLS[2]]
+
+
+def test_manifest_is_mirrored_every_sync_every_pools(bucket, container, monkeypatch):
+    monkeypatch.setattr(checkpoint, "SPOOL_SYNC_EVERY", 2)
+    spool = partial_spool("run", [])
+    mirrored = lambda: bucket.read_state(f"{spool.state_name}/manifest")  # noqa: E731
+
+    spool.write_pool(POOLS[0], {})
+    assert mirrored()["completed"] == []
+    spool.write_pool(POOLS[1], {})
+    assert mirrored()["completed"] == POOLS[:2]
+
+
+def test_resumed_run_skips_finished_pools(bucket, container, monkeypatch):
+    uploads = []
+
+    def upload(bucket, key, protocol, token, ts, outputs, slot_range, pools):
+        uploads.append(
+            {
+                "ts": ts,
+                "slot_range": slot_range,
+                "pools": pools,
+                "ticks": [decode_json(row)["pool"] for row in outputs["tick"]],
+            }
+        )
+        return {"index": {}}
+
+    monkeypatch.setattr(raydium, "upload_snapshot", upload)
+    monkeypatch.setattr(raydium, "get_s3_bucket", lambda: "bucket")
+    monkeypatch.setattr(raydium, "archive_snapshot", lambda *a, **k: None)
+    monkeypatch.setattr(raydium, "record_snapshot", lambda *a, **k: {})
+    monkeypatch.setattr(raydium, "order_pools", lambda protocol, pools: pools)
+
+    first = partial_spool("run", POOLS[:4])
+    shutil.rmtree(first.path)
+    container()
+    fetcher = FakeFetcher()
+    fetcher.run(TOKEN, 0, 0, 0, run_id="run")
+
+    assert sorted(fetcher.fetched) == POOLS[4:]
+    [upload] = uploads
+    assert upload["ts"] == "2025-06-01 13:00:07"
+    assert upload["slot_range"][0] == 100
+    assert sorted(upload["pools"]) == sorted(upload["ticks"]) == POOLS
+    # a finished run leaves nothing behind, locally or in the bucket
+    assert not bucket.objects
+    assert not (checkpoint.SPOOL_DIR / "raydium" / TOKEN / "run").exists()
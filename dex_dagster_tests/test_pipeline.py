@@ -0,0 +1,195 @@
+"""
+The staged snapshot pipeline: bounded queues, ordering, dropped and failed
+items, the wall-clock deadline, and the stages of a snapshot run.
+"""
+
+import asyncio
+
+import pytest
+
+from dex_dagster.ingestion.src.common import checkpoint
+from dex_dagster.ingestion.src.common.checkpoint import RunSpool
+from dex_dagster.ingestion.src.common.pipeline import (
+    Deadline,
+    Pipeline,
+    Stage,
+    snapshot_stages,
+)
+
+TOKEN = "So11111111111111111111111111111111111111112"
+POOLS = [f"pool{i}" for i in range(6)]
+
+
+def run(pipeline, items):
+    return asyncio.run(pipeline.run(items))
+
+
+async def identity(item):
+    return item
+
+
+@pytest.fixture
+def spool(tmp_path, monkeypatch):
+    monkeypatch.setattr(checkpoint, "shared_state_enabled", lambda: False)
+    return RunSpool("raydium", TOKEN, "run", root=tmp_path)
+
+
+def test_single_workers_keep_the_input_order():
+    async def split(n):
+        return [n, n + 100]
+
+    async def double(n):
+        return 2 * n
+
+    pipeline = Pipeline(
+        [
+            Stage("split", split, fan_out=True),
+            Stage("double", double),
+            Stage("sink", identity),
+        ]
+    )
+    assert run(pipeline, range(5)) == [
+        v for n in range(5) for v in (2 * n, 2 * n + 200)
+    ]
+    summary = pipeline.summary()
+    assert summary["split"]["items_in"] == 5
+    assert summary["split"]["items_out"] == summary["sink"]["items_in"] == 10
+
+
+def test_a_blocked_stage_holds_upstream_back():
+    produced = []
+    release = asyncio.Event()
+
+    def items():
+        for n in range(100):
+            produced.append(n)
+            yield n
+
+    async def slow(n):
+        await release.wait()
+        return n
+
+    pipeline = Pipeline(
+        [
+            Stage("fetch", identity, queue_size=2),
+            Stage("sink", slow, queue_size=2),
+        ]
+    )
+
+    async def main():
+        running = asyncio.ensure_future(pipeline.run(items()))
+        await asyncio.sleep(0.05)
+        # 2 queued for fetch, 1 held by its worker, 2 queued for sink, 1 in
+        # the sink and the one the feeder is blocked putting
+        stalled = len(produced)
+        release.set()
+        return stalled, await running
+
+    stalled, results = asyncio.run(main())
+    assert stalled <= 7
+    assert results == list(range(100))
+    assert pipeline.summary()["sink"]["max_queue_depth"] == 2
+
+
+def test_skip_errors_drops_the_item_and_keeps_going():
+    async def fetch(n):
+        if n % 3 == 0:
+            raise ConnectionError(f"pool {n}")
+        return n
+
+    pipeline = Pipeline(
+        [
+            Stage("fetch", fetch, concurrency=2, skip_errors=True),
+            Stage("sink", identity),
+        ]
+    )
+    assert sorted(run(pipeline, range(7))) == [1, 2, 4, 5]
+    assert sorted(pipeline.dropped("fetch")) == [0, 3, 6]
+    assert pipeline.dropped("sink") == []
+    assert pipeline.summary()["fetch"]["errors"] == 3
+
+
+def test_an_error_cancels_the_run():
+    cancelled = []
+
+    async def fetch(n):
+        try:
+            await asyncio.sleep(10 if n else 0)
+        except asyncio.CancelledError:
+            cancelled.append(n)
+            raise
+        return n
+
+    async def decode(n):
+        raise ValueError(f"bad pool {n}")
+
+    pipeline = Pipeline([Stage("fetch", fetch, concurrency=3), Stage("decode", decode)])
+    with pytest.raises(ValueError, match="bad pool 0"):
+        asyncio.run(asyncio.wait_for(pipeline.run(range(3)), timeout=5))
+    assert sorted(cancelled) == [1, 2]
+    assert pipeline.summary()["decode"]["errors"] == 1
+
+
+def test_deadline_defers_what_was_not_started():
+    deadline = Deadline(3600)
+
+    async def fetch(n):
+        if n == 2:
+            deadline.expires = 0  # the budget runs out while pool 2 is fetched
+        return n
+
+    pipeline = Pipeline(
+        [Stage("fetch", deadline.guard(fetch)), Stage("sink", identity)]
+    )
+    assert run(pipeline, range(6)) == [0, 1, 2]
+    assert deadline.deferred == [3, 4, 5]
+    assert Deadline().expired() is False
+
+
+def test_snapshot_stages_spool_every_fetched_pool(spool):
+    deadline = Deadline(3600)
+
+    async def discover(token):
+        return POOLS
+
+    async def fetch(pool):
+        if pool == "pool1":
+            raise ConnectionError("rpc down")
+        if pool == "pool4":
+            deadline.expires = 0
+        return {"pool": pool}
+
+    async def decode(raw):
+        return raw["pool"], {"pool": [{"address": raw["pool"]}]}
+
+    pipeline = Pipeline(
+        snapshot_stages(
+            spool,
+            discover,
+            fetch,
+            decode,
+            concurrency={"decode": 2},
+            defaults={"fetch": 1},
+            deadline=deadline,
+        )
+    )
+    finished = run(pipeline, [TOKEN])
+
+    assert sorted(finished) == sorted(spool.completed())
+    assert sorted(finished) == ["pool0", "pool2", "pool3", "pool4"]
+    assert pipeline.dropped("fetch") == ["pool1"]
+    assert deadline.deferred == ["pool5"]
+    addresses = [row["address"] for row in spool.rows("pool")]
+    assert sorted(addresses) == sorted(finished)
+    assert {s.name: s.concurrency for s in pipeline.stats} == {
+        "discover": 1,
+        "fetch": 1,
+        "decode": 2,
+        "serialize": 1,
+        "sink": 1,
+    }
+
+
+def test_snapshot_stages_reject_unknown_stage_names(spool):
+    with pytest.raises(ValueError, match="fetchh"):
+        snapshot_stages(spool, identity, identity, identity, concurrency={"fetchh": 4})
@@ -0,0 +1,161 @@
+"""
+The activity-adaptive pool schedule: interval assignment, recording runs and
+picking the pools that are due.
+"""
+
+import pytest
+
+from dex_dagster.ingestion.src.common.pool_schedule import (
+    NEW_POOL_SCORE,
+    PoolObservation,
+    PoolSchedule,
+    SchedulePolicy,
+    assign_intervals,
+)
+
+POLICY = SchedulePolicy(
+    rpc_budget_per_hour=1_000_000,
+    min_interval=300,
+    max_interval=6 * 3600,
+    granularity=300,
+    snapshots_per_score=1.0,
+)
+HOUR = 3600.0
+
+
+def observation(pool, tick=0, liquidity=1_000, calls=4, **kwargs):
+    return PoolObservation(
+        pool=pool,
+        tick=tick,
+        tick_spacing=1,
+        liquidity=liquidity,
+        volume=[0, 0],
+        vaults=[None, None],
+        positions=[],
+        calls=calls,
+        **kwargs,
+    )
+
+
+@pytest.fixture
+def schedule(tmp_path):
+    return PoolSchedule(tmp_path / "schedule.sqlite", POLICY)
+
+
+def test_intervals_follow_the_score_within_the_policy_range():
+    intervals = assign_intervals(
+        {"dead": 0.0, "hourly": 1.0, "busy": 6.0, "hot": 1_000.0},
+        {"dead": 4, "hourly": 4, "busy": 4, "hot": 4},
+        POLICY,
+    )
+    assert intervals == {
+        "dead": POLICY.max_interval,
+        "hourly": 3600,
+        "busy": 600,
+        "hot": POLICY.min_interval,
+    }
+
+
+def test_intervals_are_rounded_up_to_the_granularity():
+    # 3 snapshots an hour is every 1200s, 2.5 every 1440s -> 1500s
+    assert assign_intervals({"p": 2.5}, {"p": 1}, POLICY) == {"p": 1500}
+
+
+def test_intervals_are_stretched_to_fit_the_budget():
+    scores = {f"p{i}": 12.0 for i in range(10)}
+    calls = {pool: 10 for pool in scores}
+    # at 12 snapshots an hour the pools need 1200 calls/h, twice the budget
+    policy = SchedulePolicy(**{**POLICY.__dict__, "rpc_budget_per_hour": 600})
+    intervals = assign_intervals(scores, calls, policy)
+
+    assert set(intervals.values()) == {600}
+    assert sum(calls[p] * 3600 / i for p, i in intervals.items()) <= 600
+
+
+def test_pools_over_budget_at_the_longest_interval_all_get_it():
+    policy = SchedulePolicy(**{**POLICY.__dict__, "rpc_budget_per_hour": 1})
+    intervals = assign_intervals({"a": 100.0, "b": 0.0}, {"a": 4, "b": 4}, policy)
+    assert intervals == {"a": policy.max_interval, "b": policy.max_interval}
+
+
+def test_no_pools_no_intervals():
+    assert assign_intervals({}, {}, POLICY) == {}
+
+
+def test_record_scores_new_pools_then_their_activity(schedule):
+    assert schedule.record("raydium", [observation("a")], now=0) == {
+        "a": NEW_POOL_SCORE
+    }
+    # 20 tick spacings in an hour, weighted 0.2: 4, smoothed with the first 1
+    scores = schedule.record("raydium", [observation("a", tick=20)], now=HOUR)
+    assert scores["a"] == pytest.approx(0.5 * 4 + 0.5 * NEW_POOL_SCORE)
+
+
+def test_record_reschedules_every_pool(schedule):
+    schedule.record("raydium", [observation("a"), observation("b")], now=0)
+    schedule.record("raydium", [observation("a", tick=100)], now=HOUR)
+
+    # "a" moved and is read every 10 minutes; "b" keeps its new-pool hourly
+    # interval, so it fell due first
+    summary = schedule.summary("raydium")
+    assert summary["pools"] == 2
+    assert (summary["min_interval"], summary["max_interval"]) == (600, 3600)
+    assert schedule.due_pools("raydium", now=HOUR + 599) == ["b"]
+    assert schedule.due_pools("raydium", now=HOUR + 600) == ["b", "a"]
+
+
+def test_full_run_drops_pools_no_longer_listed(schedule):
+    schedule.record("raydium", [observation("a"), observation("b")], now=0)
+    schedule.defer("raydium", ["b"])
+    schedule.record("raydium", [observation("a")], all_pools=["a"], now=HOUR)
+
+    assert schedule.summary("raydium")["pools"] == 1
+    assert schedule.due_pools("raydium", now=10 * HOUR) == ["a"]
+    assert not schedule.full_run_due("raydium", now=HOUR + 1)
+    assert schedule.full_run_due("raydium", now=HOUR + POLICY.max_interval)
+
+
+def test_due_pools_are_most_overdue_first(schedule):
+    schedule.record("raydium", [observation("a")], now=0)
+    schedule.record("raydium", [observation("b")], now=600)
+
+    assert schedule.due_pools("raydium", now=HOUR - 1) == []
+    assert schedule.due_pools("raydium", now=2 * HOUR) == ["a", "b"]
+    assert schedule.due_pools("orca", now=2 * HOUR) == []
+
+
+def test_due_pools_include_deferred_pools(schedule):
+    schedule.record("raydium", [observation("a"), observation("b")], now=0)
+    schedule.defer("raydium", ["b", "c"])
+
+    assert schedule.due_pools("raydium", now=1) == ["b", "c"]
+    assert schedule.due_pools("raydium", now=2 * HOUR) == ["b", "c", "a"]
+    # reading a deferred pool clears it
+    schedule.record("raydium", [observation("b")], now=2)
+    assert schedule.due_pools("raydium", now=3) == ["c"]
+
+
+def test_due_pools_include_known_pools_never_read(schedule):
+    # a full run that could only read "a" of the token's three pools
+    schedule.record("raydium", [observation("a")], all_pools=["a", "b", "c"], now=0)
+
+    assert schedule.due_pools("raydium", now=1) == ["b", "c"]
+    schedule.record("raydium", [observation("b"), observation("c")], now=2)
+    assert schedule.due_pools("raydium", now=3) == []
+
+
+def test_known_and_deferred_pools_survive_a_sync(tmp_path, monkeypatch):
+    from dex_dagster.ingestion.src.common import pool_schedule
+
+    bucket = {}
+    monkeypatch.setattr(pool_schedule, "read_state", bucket.get)
+    monkeypatch.setattr(pool_schedule, "write_state", bucket.__setitem__)
+
+    run = PoolSchedule(tmp_path / "run.sqlite", POLICY)
+    run.record("orca", [observation("a")], all_pools=["a", "b"], now=0)
+    run.defer("orca", ["a"])
+    run.push("orca")
+
+    sensor = PoolSchedule(tmp_path / "sensor.sqlite", POLICY)
+    assert sensor.pull("orca")
+    assert sensor.due_pools("orca", now=1) == ["a", "b"]
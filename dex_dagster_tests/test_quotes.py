@@ -0,0 +1,229 @@
+"""
+Swap quotes replayed against pinned pool states.
+
+Each case is a pool state in the snapshot row format (sqrt price, liquidity,
+current tick, fee rate and the initialized ticks of three tick arrays) and
+exact-input swaps that cross several ticks, with the amount out, end price,
+end tick and fee pinned. The expected values come from Orca's own swap
+simulator (`orca_whirlpool`, the Python port of the Whirlpools SDK quote);
+the Orca cases also run it live. The Raydium cases went through the same
+simulator with Raydium's tick math, which is checked against the program's
+MIN/MAX sqrt price constants.
+"""
+
+import pytest
+from solders.pubkey import Pubkey
+
+from dex_dagster.ingestion.src.analytics import quotes
+from dex_dagster.ingestion.src.analytics.quotes import (
+    orca_pool_indexes,
+    quote,
+    raydium_pool_indexes,
+)
+
+TICK_ARRAY_SIZE = 88
+
+# a SOL/USDC-like 0.05% pool, tick spacing 10
+RAYDIUM_POOL = {
+    "sqrt_price": 6769333251552023077,
+    "liquidity": 41_234_567_890_123,
+    "tick_current": -20051,
+    "fee_rate": 500,
+    "tick_spacing": 10,
+    "liquidity_net": {
+        -20130: 5_500_000_000_000,
+        -20100: -9_000_000_000_000,
+        -20070: 3_000_000_000_000,
+        -20050: -4_000_000_000_000,
+        -20030: 6_000_000_000_000,
+        -20000: -2_000_000_000_000,
+    },
+}
+# (a_to_b, amount in, amount out, end sqrt price, end tick, fee)
+RAYDIUM_SWAPS = [
+    (True, 600_000_000_000, 80331537436, 6734232139353512794, -20155, 300000002),
+    (False, 90_000_000_000, 663997396664, 6809739254461951958, -19932, 45000002),
+]
+
+# a 0.3% whirlpool, tick spacing 64
+ORCA_POOL = {
+    "sqrt_price": 7147785285662277615,
+    "liquidity": 5_432_101_234_567,
+    "tick_current": -18963,
+    "fee_rate": 3000,
+    "tick_spacing": 64,
+    "liquidity_net": {
+        -19328: 2_500_000_000_000,
+        -19200: -800_000_000_000,
+        -19072: 1_200_000_000_000,
+        -18944: -1_000_000_000_000,
+        -18752: 700_000_000_000,
+        -18560: -300_000_000_000,
+    },
+}
+ORCA_SWAPS = [
+    (True, 250_000_000_000, 36701136810, 6999978990763339195, -19381, 750000002),
+    (False, 40_000_000_000, 259919003392, 7300587472592694542, -18540, 120000002),
+]
+
+
+def tick_array_starts(pool, a_to_b):
+    """Start ticks of the three tick arrays a swap from the pool's tick reads."""
+    width = TICK_ARRAY_SIZE * pool["tick_spacing"]
+    first = pool["tick_current"] // width * width
+    step = -width if a_to_b else width
+    return [first + i * step for i in range(3)]
+
+
+def raydium_rows(pool):
+    address, spacing = "raydium-pool", pool["tick_spacing"]
+    arrays = {}
+    starts = set(tick_array_starts(pool, True) + tick_array_starts(pool, False))
+    for start in sorted(starts):
+        ticks = []
+        for i in range(TICK_ARRAY_SIZE):
+            net = pool["liquidity_net"].get(start + i * spacing, 0)
+            ticks.append(
+                {
+                    "tick": start + i * spacing,
+                    "liquidityNet": str(net),
+                    "liquidityGross": str(abs(net)),
+                }
+            )
+        arrays[f"array{start}"] = {"parsed": {"data": {"ticks": ticks}}}
+    pool_row = {
+        "pool": {
+            "address": address,
+            "parsed": {
+                "data": {
+                    "sqrtPriceX64": str(pool["sqrt_price"]),
+                    "liquidity": str(pool["liquidity"]),
+                    "tickCurrent": pool["tick_current"],
+                    "ammConfig": "config",
+                }
+            },
+        }
+    }
+    [index] = raydium_pool_indexes(
+        [pool_row],
+        [{"pool": address, "tickArrays": arrays}],
+        {"config": pool["fee_rate"]},
+    )
+    return index
+
+
+def orca_rows(pool, a_to_b):
+    address, spacing = "orca-pool", pool["tick_spacing"]
+    arrays = [
+        {
+            "start_tick_index": start,
+            "ticks": [
+                {
+                    "initialized": start + i * spacing in pool["liquidity_net"],
+                    "liquidity_net": str(
+                        pool["liquidity_net"].get(start + i * spacing, 0)
+                    ),
+                }
+                for i in range(TICK_ARRAY_SIZE)
+            ],
+        }
+        for start in tick_array_starts(pool, a_to_b)
+    ]
+    whirlpool = {
+        "pubkey": address,
+        "tick_spacing": spacing,
+        "sqrt_price": str(pool["sqrt_price"]),
+        "liquidity": str(pool["liquidity"]),
+        "tick_current_index": pool["tick_current"],
+        "fee_rate": pool["fee_rate"],
+    }
+    [index] = orca_pool_indexes(
+        [{"whirlpool": whirlpool}], [{"pool": address, "tick_arrays": arrays}]
+    )
+    return index
+
+
+def orca_simulator_quote(pool, a_to_b, amount):
+    """The Whirlpools SDK quote of the same swap."""
+    from orca_whirlpool.accounts import TickArray, Whirlpool
+    from orca_whirlpool.constants import MAX_SQRT_PRICE, MIN_SQRT_PRICE
+    from orca_whirlpool.internal.anchor.types.tick import Tick
+    from orca_whirlpool.quote import QuoteBuilder, SwapQuoteParams
+    from orca_whirlpool.types import (
+        Percentage,
+        SpecifiedAmount,
+        SwapDirection,
+        TickArrayReduction,
+    )
+
+    key, spacing = Pubkey.default(), pool["tick_spacing"]
+
+    def tick(index):
+        net = pool["liquidity_net"].get(index, 0)
+        return Tick(net != 0, net, abs(net), 0, 0, [0, 0, 0])
+
+    arrays = [
+        TickArray(
+            key,
+            start,
+            [tick(start + i * spacing) for i in range(TICK_ARRAY_SIZE)],
+            key,
+        )
+        for start in tick_array_starts(pool, a_to_b)
+    ]
+    whirlpool = Whirlpool(
+        key, key, [0], spacing, [spacing, 0], pool["fee_rate"], 0,
+        pool["liquidity"], pool["sqrt_price"], pool["tick_current"],
+        0, 0, key, key, 0, key, key, 0, 0, [],
+    )  # fmt: skip
+    params = SwapQuoteParams(
+        whirlpool=whirlpool,
+        amount=amount,
+        other_amount_threshold=0,
+        sqrt_price_limit=MIN_SQRT_PRICE if a_to_b else MAX_SQRT_PRICE,
+        direction=SwapDirection.AtoB if a_to_b else SwapDirection.BtoA,
+        specified_amount=SpecifiedAmount.SwapInput,
+        tick_arrays=arrays,
+        slippage_tolerance=Percentage(0, 1),
+    )
+    return QuoteBuilder.swap(params, TickArrayReduction.No)
+
+
+def test_tick_math_meets_the_programs_price_bounds():
+    assert quotes.raydium_sqrt_price_at_tick(0) == quotes.Q64
+    assert quotes.orca_sqrt_price_at_tick(0) == quotes.Q64
+    assert (
+        quotes.raydium_sqrt_price_at_tick(quotes.MIN_TICK)
+        == quotes.RAYDIUM_MIN_SQRT_PRICE
+    )
+    assert (
+        quotes.raydium_sqrt_price_at_tick(quotes.MAX_TICK)
+        == quotes.RAYDIUM_MAX_SQRT_PRICE
+    )
+    assert quotes.orca_sqrt_price_at_tick(quotes.MIN_TICK) == quotes.ORCA_MIN_SQRT_PRICE
+    assert quotes.orca_sqrt_price_at_tick(quotes.MAX_TICK) == quotes.ORCA_MAX_SQRT_PRICE
+
+
+@pytest.mark.parametrize("a_to_b, amount, out, sqrt_price, tick, fee", RAYDIUM_SWAPS)
+def test_raydium_swap(a_to_b, amount, out, sqrt_price, tick, fee):
+    result = quote(raydium_rows(RAYDIUM_POOL), a_to_b, amount)
+
+    assert result.filled and result.amount_in == amount
+    assert result.amount_out == out
+    assert result.sqrt_price_after == sqrt_price
+    assert result.tick_after == tick
+    assert result.fee_amount == fee
+    assert result.ticks_crossed == 3
+
+
+@pytest.mark.parametrize("a_to_b, amount, out, sqrt_price, tick, fee", ORCA_SWAPS)
+def test_orca_swap(a_to_b, amount, out, sqrt_price, tick, fee):
+    result = quote(orca_rows(ORCA_POOL, a_to_b), a_to_b, amount)
+    reference = orca_simulator_quote(ORCA_POOL, a_to_b, amount)
+
+    assert result.filled and result.amount_in == amount
+    assert result.amount_out == out == reference.estimated_amount_out
+    assert result.sqrt_price_after == sqrt_price == reference.estimated_end_sqrt_price
+    assert result.tick_after == tick == reference.estimated_end_tick_index
+    assert result.fee_amount == fee == reference.estimated_fee_amount
+    assert result.ticks_crossed == 3
@@ -0,0 +1,310 @@
+"""
+Byte-for-byte parity of the typed row structs with the dict serializers.
+
+Every row type is built from synthetic decoded accounts (random u64/u128
+values, the attribute names anchorpy and whirlpool-essentials produce) under
+every field profile, and `encode_json(Row.from_...(x))` must equal
+`json.dumps(builder(x), indent=2)`, one row at a time and as a list. The
+cases are shared with `benchmarks/row_encoding.py`.
+"""
+
+import json
+import random
+from types import SimpleNamespace as NS
+
+import msgspec
+import pytest
+from solders.pubkey import Pubkey
+
+from dex_dagster.ingestion.src.common import rows
+from dex_dagster.ingestion.src.common.field_profiles import (
+    DROPPABLE,
+    FIELD_PROFILES,
+    use_field_profile,
+)
+from dex_dagster.ingestion.src.common.serializers import (
+    serialize_position,
+    serialize_tick_array,
+    serialize_whirlpool,
+)
+from dex_dagster.ingestion.src.common.spl_token import serialize_token_account
+from dex_dagster.ingestion.src.decoders.raydium_decoder import AnchorRaydiumDecoder
+
+TS = "2025-06-01 13:00:07.123456"
+
+
+def u(bits: int) -> int:
+    return random.getrandbits(bits)
+
+
+def key() -> Pubkey:
+    return Pubkey.new_unique()
+
+
+def whirlpool():
+    reward = lambda: NS(  # noqa: E731
+        mint=key(),
+        vault=key(),
+        authority=key(),
+        emissions_per_second_x64=u(128),
+        growth_global_x64=u(128),
+    )
+    return NS(
+        whirlpools_config=key(),
+        whirlpool_bump=[u(8)],
+        tick_spacing=64,
+        tick_spacing_seed=[64, 0],
+        fee_rate=3000,
+        protocol_fee_rate=1300,
+        liquidity=u(128),
+        sqrt_price=u(128),
+        tick_current_index=random.randint(-443636, 443636),
+        protocol_fee_owed_a=u(64),
+        protocol_fee_owed_b=u(64),
+        token_mint_a=key(),
+        token_vault_a=key(),
+        fee_growth_global_a=u(128),
+        token_mint_b=key(),
+        token_vault_b=key(),
+        fee_growth_global_b=u(128),
+        reward_last_updated_timestamp=u(63),
+        reward_infos=[reward() for _ in range(3)],
+    )
+
+
+def whirlpool_tick_array():
+    tick = lambda: NS(  # noqa: E731
+        initialized=random.random() < 0.3,
+        liquidity_net=u(127) - (1 << 126),
+        liquidity_gross=u(128),
+        fee_growth_outside_a=u(128),
+        fee_growth_outside_b=u(128),
+        reward_growths_outside=[u(128) for _ in range(3)],
+    )
+    return NS(
+        pubkey=key(),
+        start_tick_index=random.randint(-5000, 5000) * 88,
+        ticks=[tick() for _ in range(88)],
+        whirlpool=key(),
+    )
+
+
+def whirlpool_position():
+    return NS(
+        pubkey=key(),
+        whirlpool=key(),
+        position_mint=key(),
+        liquidity=u(128),
+        tick_lower_index=-64,
+        tick_upper_index=64,
+        fee_growth_checkpoint_a=u(128),
+        fee_owed_a=u(64),
+        fee_growth_checkpoint_b=u(128),
+        fee_owed_b=u(64),
+        reward_infos=[
+            NS(growth_inside_checkpoint=u(128), amount_owed=u(64)) for _ in range(3)
+        ],
+    )
+
+
+def token_account():
+    return {
+        "mint": str(key()),
+        "owner": str(key()),
+        "amount": u(64),
+        "delegate": None,
+        "is_native": False,
+        "delegated_amount": 0,
+        "close_authority": None,
+    }
+
+
+def pool_state():
+    reward = lambda: NS(  # noqa: E731
+        reward_state=1,
+        open_time=u(64),
+        end_time=u(64),
+        last_update_time=u(64),
+        emissions_per_second_x64=u(128),
+        reward_total_emissioned=u(64),
+        reward_claimed=u(64),
+        token_mint=key(),
+        token_vault=key(),
+        authority=key(),
+        reward_growth_global_x64=u(128),
+    )
+    return NS(
+        bump=[u(8)],
+        amm_config=key(),
+        owner=key(),
+        token_mint0=key(),
+        token_mint1=key(),
+        token_vault0=key(),
+        token_vault1=key(),
+        observation_key=key(),
+        mint_decimals0=6,
+        mint_decimals1=9,
+        tick_spacing=10,
+        liquidity=u(128),
+        sqrt_price_x64=u(128),
+        tick_current=random.randint(-443636, 443636),
+        padding3=0,
+        padding4=0,
+        fee_growth_global0_x64=u(128),
+        fee_growth_global1_x64=u(128),
+        protocol_fees_token0=u(64),
+        protocol_fees_token1=u(64),
+        swap_in_amount_token0=u(128),
+        swap_out_amount_token1=u(128),
+        swap_in_amount_token1=u(128),
+        swap_out_amount_token0=u(128),
+        status=0,
+        padding=[0] * 7,
+        reward_infos=[reward() for _ in range(3)],
+        tick_array_bitmap=[u(64) for _ in range(16)],
+        total_fees_token0=u(64),
+        total_fees_claimed_token0=u(64),
+        total_fees_token1=u(64),
+        total_fees_claimed_token1=u(64),
+        fund_fees_token0=u(64),
+        fund_fees_token1=u(64),
+        open_time=u(64),
+        recent_epoch=u(64),
+        padding1=[0] * 24,
+        padding2=[0] * 32,
+    )
+
+
+def raydium_tick_array():
+    tick = lambda i: NS(  # noqa: E731
+        tick=i,
+        liquidity_net=u(127) - (1 << 126),
+        liquidity_gross=u(128),
+        fee_growth_outside0_x64=u(128),
+        fee_growth_outside1_x64=u(128),
+        reward_growths_outside_x64=[u(128) for _ in range(3)],
+    )
+    start = random.randint(-700, 700) * 600
+    return NS(
+        pool_id=key(),
+        start_tick_index=start,
+        ticks=[tick(start + 10 * i) for i in range(60)],
+    )
+
+
+def personal_position():
+    return NS(
+        nft_mint=key(),
+        pool_id=key(),
+        tick_lower_index=-600,
+        tick_upper_index=600,
+        liquidity=u(128),
+        fee_growth_inside0_last_x64=u(128),
+        fee_growth_inside1_last_x64=u(128),
+        token_fees_owed0=u(64),
+        token_fees_owed1=u(64),
+        reward_infos=[
+            NS(growth_inside_last_x64=u(128), reward_amount_owed=u(64))
+            for _ in range(3)
+        ],
+    )
+
+
+def protocol_position():
+    return NS(
+        pool_id=key(),
+        tick_lower_index=-600,
+        tick_upper_index=600,
+        liquidity=u(128),
+        fee_growth_inside0_last_x64=u(128),
+        fee_growth_inside1_last_x64=u(128),
+        token_fees_owed0=u(64),
+        token_fees_owed1=u(64),
+        reward_growth_inside=[u(128) for _ in range(3)],
+    )
+
+
+def stamped(row):
+    return msgspec.structs.replace(row, extraction_timestamp=TS)
+
+
+raydium = AnchorRaydiumDecoder
+CASES = {
+    # name: (synthetic account, dict builder, struct builder)
+    "orca pool": (
+        whirlpool,
+        lambda x: serialize_whirlpool(x, "POOL", "MINT"),
+        lambda x: rows.WhirlpoolRow.from_account(x, "POOL", "MINT"),
+    ),
+    "orca tick array": (
+        whirlpool_tick_array,
+        serialize_tick_array,
+        rows.WhirlpoolTickArrayRow.from_account,
+    ),
+    "orca position": (
+        whirlpool_position,
+        lambda x: {**serialize_position(x), "extraction_timestamp": TS},
+        lambda x: rows.WhirlpoolPositionRow.from_account(x, TS),
+    ),
+    "vault": (
+        token_account,
+        serialize_token_account,
+        rows.TokenAccountRow.from_decoded,
+    ),
+    "raydium pool": (
+        pool_state,
+        raydium.decode_pool_state,
+        rows.PoolStateRow.from_decoded,
+    ),
+    "raydium tick array": (
+        raydium_tick_array,
+        raydium.decode_tick_array_state,
+        rows.TickArrayStateRow.from_decoded,
+    ),
+    "raydium personal position": (
+        personal_position,
+        lambda x: {**raydium.decode_position_state(x), "extraction_timestamp": TS},
+        lambda x: stamped(rows.PersonalPositionRow.from_decoded(x)),
+    ),
+    "raydium protocol position": (
+        protocol_position,
+        lambda x: {
+            **raydium.decode_protocol_position_state(x),
+            "extraction_timestamp": TS,
+        },
+        lambda x: stamped(rows.ProtocolPositionRow.from_decoded(x)),
+    ),
+}
+
+
+@pytest.mark.parametrize("profile", sorted(FIELD_PROFILES))
+@pytest.mark.parametrize("case", sorted(CASES))
+def test_struct_rows_match_dict_rows(case, profile):
+    make, as_dict, as_struct = CASES[case]
+    random.seed(3)
+    accounts = [make() for _ in range(50)]
+    with use_field_profile(profile):
+        for account in accounts:
+            expected = json.dumps(as_dict(account), indent=2).encode()
+            assert rows.encode_json(as_struct(account)) == expected
+        expected = json.dumps([as_dict(a) for a in accounts], indent=2).encode()
+        assert rows.encode_json([as_struct(a) for a in accounts]) == expected
+
+
+@pytest.mark.parametrize("case", sorted(CASES))
+def test_lean_profile_drops_fields(case):
+    make, _, as_struct = CASES[case]
+    random.seed(3)
+    account = make()
+    with use_field_profile("full"):
+        full = json.loads(rows.encode_json(as_struct(account)))
+    with use_field_profile("lean"):
+        lean = json.loads(rows.encode_json(as_struct(account)))
+
+    def fields(row):
+        # tick arrays carry the droppable tick fields in each tick
+        return set(row) | {k for tick in row.get("ticks", []) for k in tick}
+
+    dropped = set().union(*DROPPABLE.values())
+    assert not fields(lean) & dropped
+    assert fields(lean) <= fields(full)
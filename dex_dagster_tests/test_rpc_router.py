@@ -0,0 +1,183 @@
+"""
+Routing, failover, ejection and hedging of `RoutedClient` and
+`AsyncRoutedClient`, with fake clients standing in for the RPC endpoints.
+"""
+
+import asyncio
+import threading
+import time
+
+import pytest
+
+from dex_dagster.ingestion.src.common import rpc_router
+from dex_dagster.ingestion.src.common.rpc_router import (
+    EJECT_AFTER,
+    AsyncRoutedClient,
+    RoutedClient,
+)
+
+A, B = "http://a", "http://b"
+HEDGE_DELAY = 0.05
+
+
+class RpcError(Exception):
+    pass
+
+
+class FakeClient:
+    """An endpoint answering after `delay` seconds, or failing."""
+
+    METHODS = ("get_slot", "get_program_accounts", "send_transaction")
+
+    def __init__(self, url, delay=0.0, fail=False):
+        self.url = url
+        self.delay = delay
+        self.fail = fail
+        self.calls = []
+        self._lock = threading.Lock()
+
+    def _answer(self, method):
+        with self._lock:
+            self.calls.append((method, time.monotonic()))
+        if self.fail:
+            raise RpcError(self.url)
+        return f"{method} from {self.url}"
+
+    def __getattr__(self, name):
+        if name not in self.METHODS:
+            raise AttributeError(name)
+
+        def call():
+            time.sleep(self.delay)
+            return self._answer(name)
+
+        return call
+
+
+class FakeAsyncClient(FakeClient):
+    def __getattr__(self, name):
+        if name not in self.METHODS:
+            raise AttributeError(name)
+
+        async def call():
+            await asyncio.sleep(self.delay)
+            return self._answer(name)
+
+        return call
+
+    async def close(self):
+        pass
+
+
+@pytest.fixture(autouse=True)
+def fresh_stats(monkeypatch):
+    """Endpoint stats are process-wide; every test starts without any."""
+    monkeypatch.setattr(rpc_router, "_STATS", {})
+    # no exploration: calls are led by the best endpoint, A on a tie
+    monkeypatch.setattr(rpc_router, "EXPLORE_RATE", 0.0)
+    monkeypatch.setattr(rpc_router, "HEDGE_DEFAULT_DELAY", HEDGE_DELAY)
+
+
+def router(a, b):
+    client = RoutedClient([A, B], max_workers=4)
+    client.clients = {A: a, B: b}
+    return client
+
+
+def async_router(a, b):
+    client = AsyncRoutedClient([A, B])
+    client.clients = {A: a, B: b}
+    return client
+
+
+def test_read_fails_over_to_the_next_endpoint():
+    a, b = FakeClient(A, fail=True), FakeClient(B)
+    client = router(a, b)
+
+    assert client.get_slot() == f"get_slot from {B}"
+    assert len(a.calls) == len(b.calls) == 1
+    assert client.stats[A].failures == 1
+    assert client.stats[B].failures == 0
+
+
+def test_last_error_is_raised_once_every_endpoint_failed():
+    client = router(FakeClient(A, fail=True), FakeClient(B, fail=True))
+
+    with pytest.raises(RpcError):
+        client.get_slot()
+
+
+def test_endpoint_is_ejected_after_consecutive_failures():
+    a, b = FakeClient(A, fail=True), FakeClient(B)
+    client = router(a, b)
+    for _ in range(EJECT_AFTER):
+        client.get_slot()
+    assert client.stats[A].ejected(time.monotonic())
+    assert {s["url"]: s["ejected"] for s in client.summary()} == {A: True, B: False}
+
+    # healthy again, but left out of rotation until the ejection ends
+    a.fail = False
+    for _ in range(3):
+        assert client.get_slot() == f"get_slot from {B}"
+    assert len(a.calls) == EJECT_AFTER
+
+
+def test_slow_read_is_hedged_after_the_hedge_delay():
+    a, b = FakeClient(A, delay=1.0), FakeClient(B)
+    client = router(a, b)
+
+    start = time.monotonic()
+    assert client.get_slot() == f"get_slot from {B}"
+    assert time.monotonic() - start < 0.5
+    [(_, hedged_at)] = b.calls
+    assert hedged_at - start >= HEDGE_DELAY
+
+
+def test_unhedged_methods_wait_for_the_first_endpoint():
+    a, b = FakeClient(A, delay=0.3), FakeClient(B)
+    client = router(a, b)
+
+    assert client.get_program_accounts() == f"get_program_accounts from {A}"
+    assert b.calls == []
+
+
+def test_unhedged_methods_still_fail_over():
+    a, b = FakeClient(A, fail=True), FakeClient(B)
+    client = router(a, b)
+
+    assert client.get_program_accounts() == f"get_program_accounts from {B}"
+
+
+def test_writes_are_sent_once():
+    a, b = FakeClient(A, delay=0.2), FakeClient(B)
+    client = router(a, b)
+    assert client.send_transaction() == f"send_transaction from {A}"
+    assert b.calls == []
+
+    # a failed write isn't retried on, or hedged to, another endpoint
+    a.fail = b.fail = True
+    with pytest.raises(RpcError):
+        client.send_transaction()
+    assert len(a.calls) + len(b.calls) == 2
+
+
+def test_async_read_fails_over_and_hedges():
+    async def run():
+        a, b = FakeAsyncClient(A, fail=True), FakeAsyncClient(B)
+        client = async_router(a, b)
+        assert await client.get_slot() == f"get_slot from {B}"
+
+        a.fail, a.delay = False, 1.0
+        client.stats[A].consecutive_failures = 0
+        start = time.monotonic()
+        assert await client.get_slot() == f"get_slot from {B}"
+        assert time.monotonic() - start < 0.5
+
+        # the hedged-away call was cancelled, so A is still unmeasured and first
+        a.fail = b.fail = True
+        with pytest.raises(RpcError):
+            await client.send_transaction()
+        sends = [m for m, _ in a.calls + b.calls if m == "send_transaction"]
+        assert len(sends) == 1
+
+    asyncio.run(run())
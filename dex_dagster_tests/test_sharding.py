@@ -0,0 +1,98 @@
+"""
+Finalizing a sharded run: the parts' manifests are merged and the pool
+schedule is updated once, from every part, instead of by each worker.
+"""
+
+import pytest
+
+from dex_dagster.ingestion.src.common import sharding
+from dex_dagster.ingestion.src.common.sharding import (
+    Shard,
+    finalize_snapshot,
+    upload_snapshot_part,
+)
+
+TOKEN = "So11111111111111111111111111111111111111112"
+TS = "2025-06-01 13:00:07"
+
+
+@pytest.fixture
+def bucket(monkeypatch):
+    objects = {}
+
+    def upload_objects(bucket, keys, outputs):
+        return {
+            kind: {"key": keys[kind], "rows": len(list(rows)), "bytes": 1}
+            for kind, rows in outputs.items()
+        }
+
+    def upload_to_s3(bucket, key, data, log=True):
+        objects[key] = data
+        return 1
+
+    monkeypatch.setattr(sharding, "upload_objects", upload_objects)
+    monkeypatch.setattr(sharding, "upload_to_s3", upload_to_s3)
+    monkeypatch.setattr(sharding, "read_from_s3", lambda bucket, key: objects[key])
+    monkeypatch.setattr(sharding, "archive_snapshot", lambda *a, **k: None)
+    return objects
+
+
+@pytest.fixture
+def recorded(monkeypatch):
+    calls = []
+
+    def record_snapshot(protocol, token, outputs, all_pools, **kwargs):
+        calls.append({"protocol": protocol, "all_pools": all_pools, **kwargs})
+        return {"pools": len(kwargs["observations"])}
+
+    monkeypatch.setattr(sharding, "record_snapshot", record_snapshot)
+    return calls
+
+
+def upload_part(index, pools, observations, deferred=(), failed=()):
+    return upload_snapshot_part(
+        "bucket",
+        sharding.STORAGE_KEYS["raydium"],
+        "raydium",
+        TOKEN,
+        TS,
+        {"pool": [{"pool": pool} for pool in pools]},
+        (100 + index, 200 + index),
+        pools,
+        shard=Shard(index, 2),
+        assigned=pools + list(deferred) + list(failed),
+        observations=observations,
+        deferred=list(deferred),
+        failed=list(failed),
+    )
+
+
+def test_finalize_records_the_schedule_once_from_every_part(bucket, recorded):
+    upload_part(0, ["a"], [{"pool": "a"}], deferred=["c"])
+    upload_part(1, ["b"], [{"pool": "b"}], failed=["d"])
+    manifest = finalize_snapshot("bucket", "raydium", TOKEN, TS, shards=2)
+
+    [call] = recorded
+    assert call["observations"] == [{"pool": "a"}, {"pool": "b"}]
+    assert call["deferred"] == ["c", "d"]
+    assert sorted(call["all_pools"]) == ["a", "b", "c", "d"]
+    assert manifest["schedule"] == {"pools": 2}
+    assert manifest["index"]["pools"] == ["a", "b"]
+    assert manifest["slot_range"] == {"first": 100, "last": 201}
+
+
+def test_finalize_of_a_scheduled_run_drops_no_pools(bucket, recorded):
+    upload_part(0, ["a"], [])
+    upload_part(1, ["b"], [])
+    finalize_snapshot("bucket", "raydium", TOKEN, TS, shards=2, full_run=False)
+
+    [call] = recorded
+    assert call["all_pools"] is None
+
+
+def test_finalize_fails_while_a_part_is_missing(bucket, recorded):
+    upload_part(0, ["a"], [{"pool": "a"}])
+
+    with pytest.raises(RuntimeError, match="part-1-of-2"):
+        finalize_snapshot("bucket", "raydium", TOKEN, TS, shards=2)
+    assert not recorded
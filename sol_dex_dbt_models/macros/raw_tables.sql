@@ -0,0 +1,232 @@
+{#
+    Managed DDL for the `raw` landing tables declared in models/sources.yml.
+
+    Tables are ReplacingMergeTree keyed by (hour of extraction_timestamp,
+    pool or position, extraction_timestamp), versioned by extraction_timestamp.
+    A retried run keeps its original extraction_timestamp (the run spool
+    records it), so it replaces the earlier attempt instead of adding
+    duplicate rows, while the scheduler's several snapshots of a busy pool
+    within one hour are all kept. Because the key leads with
+    toStartOfHour(extraction_timestamp), "latest snapshot" lookups still read
+    a single contiguous range.
+
+    Tables created with an older sorting key (the hourly one collapses the
+    scheduler's sub-hour snapshots and sub-hour snapshot_index_raw rows)
+    make create_raw_tables fail, listing them. Pause ingestion and run it
+    with `--vars '{migrate_raw_tables: true}'` to migrate them: each table is
+    copied into a new one with the current key, the two are exchanged, rows
+    that landed during the copy are copied again (the ReplacingMergeTree
+    collapses the repeats) and the old table is dropped.
+
+    `snapshots` lists the (protocol, snapshot kind) object prefixes that feed
+    each table; see macros/s3_queue.sql.
+
+    Data is partitioned by day. Once older than `raw_hourly_retention_days`
+    (default 30), every snapshot taken outside hour 0 is dropped by TTL,
+    downsampling hourly history to daily. Every pool is read in hour 0: the
+    hourly schedule reads them all on the hour, and under the adaptive one
+    snapshot_schedule_sensor launches a full run in the first hour of each
+    day whatever the pools' intervals. Run with:
+
+        dbt run-operation create_raw_tables
+#}
+{% macro raw_landing_tables() %}
+    {{ return({
+        'raydium_pools_raw': {
+            'snapshots': [('raydium', 'pool')],
+            'columns': [
+                ('timestamp', 'String'),
+                ('pool', 'JSON'),
+                ('pool_address', 'String materialized pool.address::String'),
+                ('extension', 'JSON'),
+                ('currentTick', 'Int32'),
+                ('tickSpacing', 'UInt16'),
+                ('currentArrayStart', 'Int32'),
+                ('tokenVault0', 'JSON'),
+                ('tokenVault1', 'JSON'),
+                ('extraction_timestamp', 'DateTime64(6)'),
+            ],
+            'order_by': '(toStartOfHour(extraction_timestamp), pool_address, extraction_timestamp)',
+        },
+        'raydium_ticks_raw': {
+            'snapshots': [('raydium', 'tick')],
+            'columns': [
+                ('pool', 'String'),
+                ('tickArrays', 'String'),
+                ('extraction_timestamp', 'DateTime64(6)'),
+            ],
+            'order_by': '(toStartOfHour(extraction_timestamp), pool, extraction_timestamp)',
+        },
+        'raydium_pools_positions_raw': {
+            'snapshots': [('raydium', 'protocol_position')],
+            'columns': [
+                ('poolId', 'String'),
+                ('tickLowerIndex', 'Int32'),
+                ('tickUpperIndex', 'Int32'),
+                ('liquidity', 'String'),
+                ('feeGrowthInside0LastX64', 'String'),
+                ('feeGrowthInside1LastX64', 'String'),
+                ('tokenFeesOwed0', 'String'),
+                ('tokenFeesOwed1', 'String'),
+                ('rewardGrowthInside', 'Array(String)'),
+                ('extraction_timestamp', 'DateTime64(6)'),
+            ],
+            'order_by': '(toStartOfHour(extraction_timestamp), poolId, tickLowerIndex, tickUpperIndex, extraction_timestamp)',
+        },
+        'raydium_personal_position_raw': {
+            'snapshots': [('raydium', 'personal_position')],
+            'columns': [
+                ('nftMint', 'String'),
+                ('poolId', 'String'),
+                ('tickLowerIndex', 'Int32'),
+                ('tickUpperIndex', 'Int32'),
+                ('liquidity', 'String'),
+                ('feeGrowthInside0LastX64', 'String'),
+                ('feeGrowthInside1LastX64', 'String'),
+                ('tokenFeesOwed0', 'String'),
+                ('tokenFeesOwed1', 'String'),
+                ('rewardInfos', 'Array(Tuple(growthInsideLastX64 String, rewardAmountOwed String))'),
+                ('extraction_timestamp', 'DateTime64(6)'),
+            ],
+            'order_by': '(toStartOfHour(extraction_timestamp), poolId, nftMint, extraction_timestamp)',
+        },
+        'orca_pools_raw': {
+            'snapshots': [('orca', 'pool')],
+            'columns': [
+                ('whirlpool', 'JSON'),
+                ('pool_address', 'String materialized whirlpool.pubkey::String'),
+                ('token_vault_a_amount', 'JSON'),
+                ('token_vault_b_amount', 'JSON'),
+                ('extraction_timestamp', 'DateTime64(6)'),
+            ],
+            'order_by': '(toStartOfHour(extraction_timestamp), pool_address, extraction_timestamp)',
+        },
+        'orca_positions_raw': {
+            'snapshots': [('orca', 'position')],
+            'columns': [
+                ('pubkey', 'String'),
+                ('whirlpool', 'String'),
+                ('position_mint', 'String'),
+                ('liquidity', 'String'),
+                ('tick_lower_index', 'Int32'),
+                ('tick_upper_index', 'Int32'),
+                ('fee_growth_ckpt_a', 'String'),
+                ('fee_owed_a', 'String'),
+                ('fee_growth_ckpt_b', 'String'),
+                ('fee_owed_b', 'String'),
+                ('reward_infos', 'Array(Tuple(growth_inside_checkpoint String, amount_owed String))'),
+                ('extraction_timestamp', 'DateTime64(6)'),
+            ],
+            'order_by': '(toStartOfHour(extraction_timestamp), whirlpool, pubkey, extraction_timestamp)',
+        },
+        'orca_ticks_raw': {
+            'snapshots': [('orca', 'tick')],
+            'columns': [
+                ('pool', 'String'),
+                ('tick_arrays', 'Array(Tuple(pubkey String, start_tick_index Int32, ticks Array(Tuple(initialized Bool, liquidity_net String, liquidity_gross String, fee_growth_outside_a String, fee_growth_outside_b String, reward_growths_outside Array(String))), whirlpool String))'),
+                ('extraction_timestamp', 'DateTime64(6)'),
+            ],
+            'order_by': '(toStartOfHour(extraction_timestamp), pool, extraction_timestamp)',
+        },
+        'snapshot_index_raw': {
+            'snapshots': [('raydium', 'snapshot_index'), ('orca', 'snapshot_index')],
+            'columns': [
+                ('protocol', 'LowCardinality(String)'),
+                ('token', 'String'),
+                ('extraction_timestamp', 'DateTime64(6)'),
+                ('row_counts', 'Map(String, UInt64)'),
+                ('object_keys', 'Map(String, String)'),
+                ('pools', 'Array(String)'),
+            ],
+            'order_by': '(protocol, token, extraction_timestamp)',
+        },
+    }) }}
+{% endmacro %}
+
+
+{% macro raw_table_ddl(relation, spec) %}
+    create table if not exists {{ relation }}
+    (
+        {%- for column, type in spec['columns'] %}
+        {{ column }} {{ type }}{{ "," if not loop.last }}
+        {%- endfor %}
+    )
+    engine = ReplacingMergeTree(extraction_timestamp)
+    partition by toDate(extraction_timestamp)
+    order by {{ spec['order_by'] }}
+    ttl toDateTime(extraction_timestamp) + interval {{ var('raw_hourly_retention_days', 30) }} day
+        delete where toHour(extraction_timestamp) != 0
+{% endmacro %}
+
+
+{% macro raw_table_sorting_key(relation) %}
+    {% set result = run_query(
+        "select sorting_key from system.tables where database = '"
+        ~ relation.schema ~ "' and name = '" ~ relation.identifier ~ "'"
+    ) %}
+    {{ return(result.rows[0][0] | replace(' ', '')) }}
+{% endmacro %}
+
+
+{% macro migrate_raw_table(relation, spec) %}
+    {% set staging = relation.schema ~ '.' ~ relation.identifier ~ '__migrate' %}
+    {% set columns = [] %}
+    {% for column, type in spec['columns'] if ' materialized ' not in type %}
+        {% do columns.append(column) %}
+    {% endfor %}
+    {% set column_list = columns | join(', ') %}
+
+    {% do run_query('drop table if exists ' ~ staging) %}
+    {% do run_query(raw_table_ddl(staging, spec)) %}
+    {% set copied_until = run_query(
+        'select toString(max(extraction_timestamp)) from ' ~ relation
+    ).rows[0][0] %}
+    {% do run_query(
+        'insert into ' ~ staging ~ ' (' ~ column_list ~ ') select '
+        ~ column_list ~ ' from ' ~ relation
+    ) %}
+    {% do run_query('exchange tables ' ~ relation ~ ' and ' ~ staging) %}
+    {# rows inserted into the old table while it was being copied #}
+    {% do run_query(
+        'insert into ' ~ relation ~ ' (' ~ column_list ~ ') select '
+        ~ column_list ~ ' from ' ~ staging
+        ~ " where extraction_timestamp >= '" ~ copied_until ~ "'"
+    ) %}
+    {% do run_query('drop table ' ~ staging) %}
+    {{ log("Migrated " ~ relation ~ " to order by " ~ spec['order_by'], info=True) }}
+{% endmacro %}
+
+
+{% macro create_raw_tables() %}
+    {% set outdated = [] %}
+    {% for name, spec in raw_landing_tables().items() %}
+        {% set relation = source('raw', name) %}
+        {% do run_query(raw_table_ddl(relation, spec)) %}
+        {# columns added since the table was created, e.g. snapshot_index_raw.pools #}
+        {% for column, type in spec['columns'] %}
+            {% do run_query(
+                'alter table ' ~ relation
+                ~ ' add column if not exists ' ~ column ~ ' ' ~ type
+            ) %}
+        {% endfor %}
+
+        {% set expected = spec['order_by'][1:-1] | replace(' ', '') %}
+        {% if raw_table_sorting_key(relation) != expected %}
+            {% if var('migrate_raw_tables', false) %}
+                {% do migrate_raw_table(relation, spec) %}
+            {% else %}
+                {% do outdated.append(name) %}
+            {% endif %}
+        {% endif %}
+        {{ log("Created raw landing table " ~ name, info=True) }}
+    {% endfor %}
+
+    {% if outdated %}
+        {{ exceptions.raise_compiler_error(
+            "Raw tables with an outdated sorting key, which collapses sub-hour "
+            ~ "snapshots: " ~ outdated | join(', ') ~ ". Pause ingestion and run "
+            ~ "`dbt run-operation create_raw_tables --vars '{migrate_raw_tables: true}'` "
+            ~ "to migrate them."
+        ) }}
+    {% endif %}
+{% endmacro %}
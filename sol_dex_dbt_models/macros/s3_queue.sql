@@ -0,0 +1,88 @@
+{#
+    Continuous ingestion of new snapshot objects with ClickHouse S3Queue.
+
+    For every (protocol, snapshot kind) listed in raw_landing_tables() this
+    creates an S3Queue table over every object of that kind, i.e.
+    `<storage key>/protocol=<p>/kind=<kind>/date=*/hour=*/token=*/*.json`, and
+    a materialized view that inserts each new object into the typed landing
+    table. S3Queue tracks processed files in Keeper, so every object written by
+    run_raydium / run_orca is loaded exactly once, seconds after it lands.
+    Queues created for the older flat `<storage key>/<kind>/*.json` layout
+    must be dropped (drop_s3_queue_ingestion) and recreated to pick up the
+    new path.
+
+    S3 credentials come from a ClickHouse named collection (var
+    `s3_named_collection`, default `snapshot_s3`) holding the bucket url and
+    keys, so they never appear in the DDL. Run after create_raw_tables:
+
+        dbt run-operation create_s3_queue_ingestion
+#}
+{% macro snapshot_storage_key(protocol) %}
+    {% if protocol == 'raydium' %}
+        {{ return(var('raydium_storage_key', env_var('RAYDIUM_STORAGE_KEY', 'raydium'))) }}
+    {% else %}
+        {{ return(var('orca_storage_key', env_var('ORCA_STORAGE_KEY', 'orca'))) }}
+    {% endif %}
+{% endmacro %}
+
+
+{% macro s3_queue_name(protocol, kind) %}
+    {{ return(protocol ~ '_' ~ kind ~ '_queue') }}
+{% endmacro %}
+
+
+{% macro create_s3_queue_ingestion() %}
+    {% set collection = var('s3_named_collection', 'snapshot_s3') %}
+    {% set landing = source('raw', 'snapshot_index_raw') %}
+    {% for name, spec in raw_landing_tables().items() %}
+        {% set columns = [] %}
+        {% for column, type in spec['columns'] if ' materialized ' not in type %}
+            {% do columns.append((column, type)) %}
+        {% endfor %}
+
+        {% for protocol, kind in spec['snapshots'] %}
+            {% set queue = s3_queue_name(protocol, kind) %}
+            {% set prefix = snapshot_storage_key(protocol) ~ '/protocol=' ~ protocol ~ '/kind=' ~ kind %}
+            {% set ddl %}
+                create table if not exists {{ landing.schema }}.{{ queue }}
+                (
+                    {%- for column, type in columns %}
+                    {{ column }} {{ type }}{{ "," if not loop.last }}
+                    {%- endfor %}
+                )
+                engine = S3Queue({{ collection }}, filename = '{{ prefix }}/**/*.json', format = 'JSONEachRow')
+                settings
+                    mode = 'unordered',
+                    keeper_path = '/clickhouse/s3queue/{{ landing.schema }}/{{ queue }}',
+                    s3queue_polling_min_timeout_ms = 1000,
+                    s3queue_tracked_file_ttl_sec = {{ var('s3_queue_tracked_file_ttl_sec', 2592000) }}
+            {% endset %}
+            {% do run_query(ddl) %}
+
+            {% set view %}
+                create materialized view if not exists {{ landing.schema }}.{{ queue }}_mv
+                to {{ source('raw', name) }}
+                as
+                select
+                    {%- for column, type in columns %}
+                    {{ column }}{{ "," if not loop.last }}
+                    {%- endfor %}
+                from {{ landing.schema }}.{{ queue }}
+            {% endset %}
+            {% do run_query(view) %}
+            {{ log("Created S3Queue ingestion " ~ prefix ~ " -> " ~ name, info=True) }}
+        {% endfor %}
+    {% endfor %}
+{% endmacro %}
+
+
+{% macro drop_s3_queue_ingestion() %}
+    {% set landing = source('raw', 'snapshot_index_raw') %}
+    {% for name, spec in raw_landing_tables().items() %}
+        {% for protocol, kind in spec['snapshots'] %}
+            {% set queue = s3_queue_name(protocol, kind) %}
+            {% do run_query('drop view if exists ' ~ landing.schema ~ '.' ~ queue ~ '_mv') %}
+            {% do run_query('drop table if exists ' ~ landing.schema ~ '.' ~ queue) %}
+        {% endfor %}
+    {% endfor %}
+{% endmacro %}
@@ -0,0 +1,27 @@
+{#
+    Filter to the latest snapshot of every pool of a protocol, read from the
+    snapshot index.
+
+    Runs no longer cover every pool: the pool schedule snapshots busy pools
+    every few minutes and quiet ones every few hours, so "the latest run" only
+    holds the pools that were due. Each index row lists the pools its run
+    covered; the newest extraction_timestamp per pool is taken from there,
+    which reads the small index instead of a max() over every raw snapshot.
+    Use it as a where condition, with the model's pool address column:
+
+        where {{ latest_pool_snapshot('raydium', 'pool_address') }}
+
+    Runs indexed before the `pools` column existed list no pools and are
+    ignored; the first run after the upgrade covers every pool.
+#}
+{% macro latest_pool_snapshot(protocol, pool_column) %}
+    ({{ pool_column }}, extraction_timestamp) in (
+        select
+            pool,
+            max(snapshot_index.extraction_timestamp)
+        from {{ ref('stg_snapshot_index') }} as snapshot_index
+        array join snapshot_index.pools as pool
+        where snapshot_index.protocol = '{{ protocol }}'
+        group by pool
+    )
+{% endmacro %}
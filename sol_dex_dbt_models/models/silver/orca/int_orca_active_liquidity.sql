@@ -13,9 +13,15 @@ orca_pools as (select * from {{ ref('stg_orca_pools_raw') }}),
 latest_time as (
     select *
     from orca_ticks
-    where extraction_timestamp = (
-        select max(extraction_timestamp) from orca_ticks
-    )
+    where {{ latest_pool_snapshot('orca', 'pool') }}
+),
+
+latest_pools as (
+    select
+        pool_address,
+        tick_spacing
+    from orca_pools
+    where {{ latest_pool_snapshot('orca', 'pool_address') }}
 ),
 
 flatten_ticks as (
@@ -38,7 +44,7 @@ with_spacing as (
         ticks_flat.tick_tuple,
         ticks_flat.extraction_timestamp
     from flatten_ticks as ticks_flat
-    left join orca_pools as pools
+    left join latest_pools as pools
         on ticks_flat.pool = pools.pool_address
 ),
 
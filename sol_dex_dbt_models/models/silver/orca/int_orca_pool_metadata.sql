@@ -11,10 +11,7 @@ orca_pools_raw as (select * from {{ ref('stg_orca_pools_raw') }}),
 latest_pool_snapshot as (
     select *
     from orca_pools_raw
-    where extraction_timestamp = (
-        select MAX(extraction_timestamp)
-        from orca_pools_raw
-    )
+    where {{ latest_pool_snapshot('orca', 'pool_address') }}
 ),
 
 final as (
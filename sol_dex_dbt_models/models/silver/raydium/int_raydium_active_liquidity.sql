@@ -11,10 +11,7 @@ pools_tick as (select * from {{ ref('stg_raydium_pools_ticks') }}),
 latest_time as (
     select *
     from pools_tick
-    where extraction_timestamp = (
-        select MAX(extraction_timestamp)
-        from pools_tick
-    )
+    where {{ latest_pool_snapshot('raydium', 'poolId') }}
 ),
 
 flatten_ticks as (
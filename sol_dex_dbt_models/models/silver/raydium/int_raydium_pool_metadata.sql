@@ -11,10 +11,7 @@ pools_raw as (select * from {{ ref('stg_raydium_pools_raw') }}),
 latest_pool_snapshot as (
     select *
     from pools_raw
-    where extraction_timestamp = (
-        select MAX(extraction_timestamp)
-        from pools_raw
-    )
+    where {{ latest_pool_snapshot('raydium', 'pool_address') }}
 ),
 
 final as (
@@ -58,12 +58,6 @@ final as (
         pool.parsed.data.tickCurrent::UInt32 as tick_current,
         pool.parsed.data.tickSpacing::UInt16 as tick_spacing,
 
-        pool.parsed.data.padding as padding,
-        pool.parsed.data.padding1 as padding_1,
-        pool.parsed.data.padding2 as padding_2,
-        pool.parsed.data.padding3 as padding_3,
-        pool.parsed.data.padding4 as padding_4,
-
         pool.parsed.data.recentEpoch as recent_epoch,
         pool.parsed.data.rewardInfos as reward_infos,
 
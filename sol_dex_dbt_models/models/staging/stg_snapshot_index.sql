@@ -0,0 +1,17 @@
+with source as (
+    select *
+    from {{ source('raw', 'snapshot_index_raw') }}
+),
+
+final as (
+    select
+        protocol,
+        token,
+        extraction_timestamp,
+        row_counts,
+        object_keys,
+        pools
+    from source
+)
+
+select * from final